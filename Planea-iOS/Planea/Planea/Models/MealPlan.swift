@@ -41,6 +41,16 @@ struct MealPlan: Identifiable, Codable {
     var status: PlanStatus = .draft
     var confirmedDate: Date?
     var name: String?
+    var missingSlots: [SlotSelection]?  // Slots the generator could not fill, set on a newly generated plan
+    
+    /// Message listing the slots that could not be generated, if any
+    var missingSlotsMessage: String? {
+        guard let missingSlots = missingSlots, !missingSlots.isEmpty else { return nil }
+        let slots = missingSlots
+            .map { "\($0.weekday.localizedName) \($0.mealType.localizedName.lowercased())" }
+            .joined(separator: ", ")
+        return String(format: "plan.missingSlots".localized, slots)
+    }
 }
 
 struct MealItem: Identifiable, Codable {
@@ -4,10 +4,31 @@ import Foundation
 private struct PlanResponse: Codable {
     let items: [PlanItemResponse]
     let mealPrepKits: [[String: AnyCodable]]?
+    let failedSlots: [PlanSlotFailureResponse]?
     
     enum CodingKeys: String, CodingKey {
         case items
         case mealPrepKits = "meal_prep_kits"
+        case failedSlots = "failed_slots"
+    }
+}
+
+// Slot the backend could not generate (partial plan); regenerated on its own
+private struct PlanSlotFailureResponse: Codable {
+    let slotIndex: Int
+    let weekday: Weekday
+    let mealType: MealType
+    let isMealPrep: Bool?
+    let mealPrepGroupId: String?
+    let error: String
+    
+    enum CodingKeys: String, CodingKey {
+        case slotIndex = "slot_index"
+        case weekday
+        case mealType = "meal_type"
+        case isMealPrep = "is_meal_prep"
+        case mealPrepGroupId = "meal_prep_group_id"
+        case error
     }
 }
 
@@ -92,6 +113,12 @@ struct IAService {
     private func performRequest(request: URLRequest, maxRetries: Int = 2) async throws -> (Data, URLResponse) {
         var lastError: Error?
         
+        // Same key on every attempt so the server can attach retries to the generation already running
+        var request = request
+        if request.value(forHTTPHeaderField: "Idempotency-Key") == nil {
+            request.setValue(UUID().uuidString, forHTTPHeaderField: "Idempotency-Key")
+        }
+        
         for attempt in 0..<maxRetries {
             do {
                 let (data, response) = try await Self.urlSession.data(for: request)
@@ -191,7 +218,9 @@ struct IAService {
             "constraints": constraints,
             "servings": servings,
             "language": language,
-            "preferences": preferencesDict
+            "preferences": preferencesDict,
+            // Get the successful recipes back even if a few slots fail
+            "allow_partial": true
         ]
         
         // Use JSONSerialization with explicit UTF-8 encoding option
@@ -221,7 +250,7 @@ struct IAService {
         let correctWeekStart = WeekDateHelper.startOfWeek(from: weekStart, preferredStartDay: prefs.weekStartDay)
         
         // Convert to MealPlan with real dates
-        let mealItems = planResponse.items.map { item in
+        var mealItems = planResponse.items.map { item in
             var mealItem = MealItem(
                 id: UUID(),
                 weekday: item.weekday,
@@ -241,7 +270,71 @@ struct IAService {
             return mealItem
         }
         
+        // Regenerate only the slots the backend could not generate, all at once
+        let failures = planResponse.failedSlots ?? []
+        let regenerated = await withTaskGroup(of: (Int, Recipe?).self) { group -> [Int: Recipe] in
+            for (index, failure) in failures.enumerated() {
+                print("🔁 Regenerating failed slot \(failure.weekday.rawValue) - \(failure.mealType.rawValue): \(failure.error)")
+                group.addTask {
+                    do {
+                        let recipe = try await self.regenerateMeal(
+                            weekday: failure.weekday,
+                            mealType: failure.mealType,
+                            constraints: constraints,
+                            servings: servings,
+                            units: units,
+                            language: language,
+                            diversitySeed: failure.slotIndex
+                        )
+                        return (index, recipe)
+                    } catch {
+                        print("⚠️ Could not regenerate \(failure.weekday.rawValue) - \(failure.mealType.rawValue): \(error.localizedDescription)")
+                        return (index, nil)
+                    }
+                }
+            }
+            var recipes: [Int: Recipe] = [:]
+            for await (index, recipe) in group {
+                recipes[index] = recipe
+            }
+            return recipes
+        }
+        
+        // Keep the backend's slot order; slots still failing are returned as missing
+        var missingSlots: [SlotSelection] = []
+        for (index, failure) in failures.enumerated() {
+            guard let recipe = regenerated[index] else {
+                var slot = SlotSelection(weekday: failure.weekday, mealType: failure.mealType)
+                slot.isMealPrep = failure.isMealPrep ?? false
+                if let groupIdString = failure.mealPrepGroupId {
+                    slot.mealPrepGroupId = UUID(uuidString: groupIdString)
+                }
+                missingSlots.append(slot)
+                continue
+            }
+            var mealItem = MealItem(
+                id: UUID(),
+                weekday: failure.weekday,
+                mealType: failure.mealType,
+                recipe: recipe
+            )
+            mealItem.isMealPrep = failure.isMealPrep ?? false
+            if let groupIdString = failure.mealPrepGroupId, let groupId = UUID(uuidString: groupIdString) {
+                mealItem.mealPrepGroupId = groupId
+            }
+            mealItem.date = MealItem.calculateDate(for: failure.weekday, weekStart: correctWeekStart)
+            mealItems.append(mealItem)
+            // The backend built its kits before these slots were regenerated, so
+            // a meal prep kit does not cover them: they are cooked on their own
+            if mealItem.isMealPrep {
+                print("ℹ️ Regenerated meal prep slot \(failure.weekday.rawValue) - \(failure.mealType.rawValue) is not in its group's kit")
+            }
+        }
+        
         print("✅ Successfully generated plan with \(mealItems.count) items")
+        if !missingSlots.isEmpty {
+            print("⚠️ \(missingSlots.count) slots could not be generated")
+        }
         
         // CRITICAL: Store meal prep kits if present
         if let kitsData = planResponse.mealPrepKits, !kitsData.isEmpty {
@@ -273,7 +366,8 @@ struct IAService {
             id: UUID(),
             familyId: UUID(), // Will be set by the caller if needed
             weekStart: correctWeekStart,
-            items: mealItems
+            items: mealItems,
+            missingSlots: missingSlots.isEmpty ? nil : missingSlots
         )
     }
     
@@ -109,7 +109,12 @@ final class WeekGenerationConfigViewModel: ObservableObject {
             let usageVM = UsageViewModel()
             usageVM.recordGenerations(count: plan.items.count)
 
-            generationSuccess = true
+            // Stay open to tell the user which meals are missing
+            if let missingSlotsMessage = plan.missingSlotsMessage {
+                errorMessage = missingSlotsMessage
+            } else {
+                generationSuccess = true
+            }
         } catch let urlError as URLError {
             switch urlError.code {
             case .notConnectedToInternet:
@@ -178,6 +178,7 @@ struct GenerateMealPlanView: View {
             
             // Record generation usage
             usageVM.recordGenerations(count: plan.items.count)
+            errorMessage = plan.missingSlotsMessage
             
             // Clear selections after successful generation
             selectedSlots.removeAll()
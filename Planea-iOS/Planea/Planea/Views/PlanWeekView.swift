@@ -383,6 +383,7 @@ struct PlanWeekView: View {
             
             // Record generation usage
             usageVM.recordGenerations(count: plan.items.count)
+            errorMessage = plan.missingSlotsMessage
         } catch {
             // Provide more helpful error messages
             if let urlError = error as? URLError {
@@ -0,0 +1,205 @@
+"""
+Intent classification for chat messages.
+
+Before the agent replies, `/ai/chat` needs to know whether the message asks
+to see the plan, confirms a pending action, requests a recipe modification
+or a new meal, and which agent mode fits. All the keyword families behind
+those decisions are compiled into one automaton at import time: the message
+is lowercased and split once, scanned once, and every flag is derived from
+the set of families that occurred.
+"""
+
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from deal_matcher import AhoCorasick
+
+
+RECIPE_QA_KEYWORDS = [
+    # French
+    'recette', 'substituer', 'remplacer', 'conversion', 'convertir', 'portion', 'portions',
+    'ingrédient', 'ingrédients', 'étape', 'étapes', 'cuisson', 'température',
+    'comment faire', 'comment cuire', 'combien de', 'ajuster',
+    # English
+    'recipe', 'substitute', 'replace', 'conversion', 'convert', 'portion', 'portions',
+    'ingredient', 'ingredients', 'step', 'steps', 'cooking', 'temperature',
+    'how to', 'how do i', 'how much', 'adjust'
+]
+RECIPE_CONTEXT_KEYWORDS = ['recipe', 'recette']
+
+# Questions about possibility: "Est-ce que JE PEUX...?", "Can I...?"
+POSSIBILITY_QUESTION_KEYWORDS = [
+    'est-ce que', 'est ce que', 'puis-je', 'peux-je', 'peut-on', 'pourrais-je', 'devrais-je', 'dois-je',
+    'can i', 'could i', 'should i', 'is it possible', 'would it be', 'may i'
+]
+# Requests for action (the agent should DO something): "Peux-TU...?", "Can YOU...?"
+ACTION_REQUEST_KEYWORDS = [
+    'peux-tu', 'peux tu', 'peut-tu', 'peut tu', 'pourrais-tu', 'pourrais tu', 'veux-tu', 'veux tu',
+    'can you', 'could you', 'would you', 'will you', 'please'
+]
+MODIFICATION_KEYWORDS = [
+    'remplace', 'remplacer', 'substitue', 'substituer', 'change', 'changer', 'modifie', 'modifier', 'ajuste', 'ajuster', 'double', 'triple',
+    'replace', 'substitute', 'change', 'modify', 'adjust', 'swap', 'double', 'triple'
+]
+PORTION_KEYWORDS = ['portion', 'portions', 'servings', 'double', 'triple', 'moitié', 'half', 'personnes', 'people']
+
+ADD_MEAL_KEYWORDS = [
+    'ajoute', 'ajouter', 'crée', 'créer', 'génère', 'générer', 'propose', 'proposer',
+    'add', 'create', 'generate', 'suggest', 'propose'
+]
+# Checked in order: the first meal type / weekday with a keyword in the message wins
+MEAL_TYPE_KEYWORDS = {
+    'BREAKFAST': ['breakfast', 'petit-déjeuner', 'petit déjeuner', 'déjeuner'],
+    'LUNCH': ['lunch', 'dîner', 'midi'],
+    'DINNER': ['dinner', 'souper', 'soir', 'diner']
+}
+WEEKDAY_KEYWORDS = {
+    'Mon': ['lundi', 'monday', 'mon'],
+    'Tue': ['mardi', 'tuesday', 'tue'],
+    'Wed': ['mercredi', 'wednesday', 'wed'],
+    'Thu': ['jeudi', 'thursday', 'thu'],
+    'Fri': ['vendredi', 'friday', 'fri'],
+    'Sat': ['samedi', 'saturday', 'sat'],
+    'Sun': ['dimanche', 'sunday', 'sun']
+}
+
+# Only counted when the (stripped) message starts with them
+CONFIRMATION_KEYWORDS = [
+    'oui', 'ok', 'confirme', 'confirm', 'accepte', 'accept', "d'accord", 'daccord', 'parfait', 'vas-y', 'vas y', 'go',
+    'yes', 'ok', 'confirm', 'accept', 'go ahead', 'sure', 'perfect', 'agreed'
+]
+
+PLAN_KEYWORDS = [
+    'mon plan', 'le plan', 'mon menu', 'le menu', 'semaine', 'cette semaine', 'plan actuel', 'plan de la semaine', 'mes repas', 'repas de la semaine',
+    'my plan', 'the plan', 'my menu', 'the menu', 'week', 'this week', 'current plan', 'week plan', 'my meals', 'week meals'
+]
+PLAN_QUESTION_KEYWORDS = [
+    'quel', 'quelle', 'quels', 'quelles', 'montre', 'voir', 'affiche', 'afficher',
+    'what', 'which', 'show', 'display', 'see', 'view'
+]
+
+
+class ChatIntents(NamedTuple):
+    """Every intent flag of one chat message."""
+    message_lower: str
+    words: Tuple[str, ...]
+    plan_display: bool
+    confirmation: bool
+    modification: bool
+    # Asking whether something is possible rather than asking the agent to do it
+    question: bool
+    modification_type: Optional[str]
+    add_meal: bool
+    meal_type: Optional[str]
+    weekday: Optional[str]
+    agent_mode: str
+
+
+class IntentEngine:
+    """Keyword families compiled into a single Aho-Corasick automaton.
+    
+    `classify()` returns exactly what the original per-detector `any(k in
+    message_lower ...)` checks returned, from one scan of the message.
+    """
+    
+    def __init__(self, families: Dict[str, Iterable[str]], prefix_families: Iterable[str] = ()):
+        self.prefix_families: FrozenSet[str] = frozenset(prefix_families)
+        self._families_by_pattern: Dict[str, FrozenSet[str]] = {}
+        for family, keywords in families.items():
+            for keyword in keywords:
+                self._families_by_pattern[keyword] = self._families_by_pattern.get(keyword, frozenset()) | {family}
+        self._automaton = AhoCorasick(self._families_by_pattern)
+        
+        # Fold the families of every pattern ending at a state into one set,
+        # so the scan loop is a dict lookup and a set union per character
+        self._transitions, outputs = self._automaton.transition_table()
+        self._state_families: List[FrozenSet[str]] = [
+            frozenset(
+                family
+                for pattern in patterns
+                for family in self._families_by_pattern[pattern]
+                if family not in self.prefix_families
+            )
+            for patterns in outputs
+        ]
+    
+    def families(self, text_lower: str, check_prefix: bool = False) -> Set[str]:
+        """Families with a keyword anywhere in `text_lower`.
+        
+        Prefix-only families count only when `check_prefix` is set and the
+        text (leading whitespace aside) starts with one of their keywords.
+        """
+        transitions = self._transitions
+        state_families = self._state_families
+        found: Set[str] = set()
+        state = 0
+        for char in text_lower:
+            state = transitions[state].get(char, 0)
+            if state_families[state]:
+                found |= state_families[state]
+        
+        if check_prefix:
+            for pattern in self._automaton.starts_with(text_lower.lstrip()):
+                found |= self._families_by_pattern[pattern] & self.prefix_families
+        return found
+    
+    def classify(self, message: str, conversation_history: Optional[List[dict]] = None) -> ChatIntents:
+        message_lower = message.lower()
+        found = self.families(message_lower, check_prefix=True)
+        
+        plan_display = "plan" in found and (
+            "plan_question" in found or message_lower.endswith('?')
+        )
+        
+        modification = "modification" in found
+        question = "possibility_question" in found and "action_request" not in found
+        modification_type = None
+        if modification:
+            modification_type = "adjust_portions" if "portion" in found else "replace_ingredient"
+        
+        add_meal = "add_meal" in found
+        meal_type = weekday = None
+        if add_meal:
+            meal_type = next((m for m in MEAL_TYPE_KEYWORDS if f"meal:{m}" in found), None)
+            weekday = next((d for d in WEEKDAY_KEYWORDS if f"weekday:{d}" in found), None)
+        
+        recipe_qa = "recipe_qa" in found or any(
+            "recipe_context" in self.families(str(msg).lower())
+            for msg in (conversation_history or [])[-5:] if msg
+        )
+        
+        return ChatIntents(
+            message_lower=message_lower,
+            words=tuple(message_lower.split()),
+            plan_display=plan_display,
+            confirmation="confirmation" in found,
+            modification=modification,
+            question=modification and question,
+            modification_type=modification_type,
+            add_meal=add_meal,
+            meal_type=meal_type,
+            weekday=weekday,
+            agent_mode="recipe_qa" if recipe_qa else "nutrition_coach"
+        )
+
+
+def build_intent_engine() -> IntentEngine:
+    families = {
+        "recipe_qa": RECIPE_QA_KEYWORDS,
+        "recipe_context": RECIPE_CONTEXT_KEYWORDS,
+        "possibility_question": POSSIBILITY_QUESTION_KEYWORDS,
+        "action_request": ACTION_REQUEST_KEYWORDS,
+        "modification": MODIFICATION_KEYWORDS,
+        "portion": PORTION_KEYWORDS,
+        "add_meal": ADD_MEAL_KEYWORDS,
+        "confirmation": CONFIRMATION_KEYWORDS,
+        "plan": PLAN_KEYWORDS,
+        "plan_question": PLAN_QUESTION_KEYWORDS
+    }
+    for meal_type, keywords in MEAL_TYPE_KEYWORDS.items():
+        families[f"meal:{meal_type}"] = keywords
+    for weekday, keywords in WEEKDAY_KEYWORDS.items():
+        families[f"weekday:{weekday}"] = keywords
+    return IntentEngine(families, prefix_families=["confirmation"])
+
+
+intent_engine = build_intent_engine()
@@ -0,0 +1,214 @@
+"""
+Prompt budgeting for the conversational agent.
+
+The chat prompt is the mode's system prompt with the user's context block,
+then recent messages, then the new message. Long conversations are compacted
+so input tokens stay bounded:
+
+- recent messages are kept verbatim only while they fit the history budget
+  (and at most `max_recent_messages` of them). The latest exchange is always
+  kept, cut to fit if it alone overflows the budget,
+- older messages are folded into a running summary stored with the chat
+  session, so each message is summarized once. The summary is extractive
+  (first sentence of each message), so compaction costs no extra OpenAI call,
+- every mode has a hard cap on prompt tokens: the context block is cut if
+  it alone would overflow it, and history and summary get what is left.
+
+Token counts use the gateway's ~4 characters per token estimate.
+"""
+
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from conversation_store import ConversationSession
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+DEFAULT_PROMPT_TOKEN_CAPS = {"onboarding": 3000, "recipe_qa": 6000, "nutrition_coach": 6000}
+# Longest excerpt kept per summarized message
+SUMMARY_LINE_CHARS = 200
+# The latest exchange (user message and reply) is always kept, trimmed if needed
+LATEST_EXCHANGE_MESSAGES = 2
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+SUMMARY_HEADERS = {
+    "fr": "Résumé des échanges précédents de cette conversation:",
+    "en": "Summary of the earlier messages in this conversation:"
+}
+
+
+def estimate_text_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def parse_token_caps(value: Optional[str]) -> Dict[str, int]:
+    """Parse "mode=max_prompt_tokens,..." (e.g. "recipe_qa=6000,nutrition_coach=4000").
+    
+    Modes that are not listed keep their default cap.
+    """
+    caps = dict(DEFAULT_PROMPT_TOKEN_CAPS)
+    for part in (value or "").split(","):
+        mode, _, cap = part.strip().partition("=")
+        if not mode:
+            continue
+        try:
+            caps[mode] = int(cap)
+        except ValueError:
+            logger.warning(f"Ignoring invalid chat prompt token cap for '{mode}': {cap!r}")
+    return caps
+
+
+def summarize_message(message: dict, language: str) -> str:
+    """One summary line: who spoke and the first sentence of what they said."""
+    text = " ".join(str(message.get("content", "")).split())
+    sentence = _SENTENCE_END.split(text, 1)[0]
+    if len(sentence) > SUMMARY_LINE_CHARS:
+        sentence = sentence[:SUMMARY_LINE_CHARS].rstrip() + "…"
+    if message.get("isFromUser"):
+        speaker = "Utilisateur" if language == "fr" else "User"
+    else:
+        speaker = "Assistant"
+    return f"- {speaker}: {sentence}"
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut the end of `text` so it fits in about `max_tokens`."""
+    max_chars = max(0, max_tokens - 1) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "…"
+
+
+class ChatMemoryPolicy:
+    """Builds the chat messages for one turn within the mode's token cap."""
+    
+    def __init__(
+        self,
+        history_token_budget: int = 1200,
+        summary_token_budget: int = 400,
+        max_recent_messages: int = 10,
+        prompt_token_caps: Optional[Dict[str, int]] = None
+    ):
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_recent_messages = max_recent_messages
+        self.prompt_token_caps = prompt_token_caps or dict(DEFAULT_PROMPT_TOKEN_CAPS)
+        self.summarized_messages = 0
+        self.capped_prompts = 0
+    
+    @classmethod
+    def from_env(cls) -> "ChatMemoryPolicy":
+        """Policy configured from CHAT_*_TOKEN_* environment variables."""
+        return cls(
+            history_token_budget=int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1200")),
+            summary_token_budget=int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "400")),
+            prompt_token_caps=parse_token_caps(os.getenv("CHAT_PROMPT_TOKEN_CAPS"))
+        )
+    
+    def build_messages(
+        self,
+        system_content: str,
+        history: List[dict],
+        message: str,
+        mode: str,
+        language: str,
+        session: Optional[ConversationSession] = None
+    ) -> List[dict]:
+        """Messages for the chat completion.
+        
+        `history` is the full conversation. With a session, its first
+        `session.summarized_count` messages are already in `session.summary`,
+        and the messages folded this turn are added to it.
+        """
+        summarized_count = min(session.summarized_count, len(history)) if session else 0
+        summary_lines = session.summary.splitlines() if session and session.summary else []
+        # Room for at least a cut-down latest exchange
+        reserved = min(len(history) - summarized_count, LATEST_EXCHANGE_MESSAGES)
+        
+        cap = self.prompt_token_caps.get(mode) or max(self.prompt_token_caps.values())
+        message_tokens = estimate_text_tokens(message)
+        system_tokens = estimate_text_tokens(system_content)
+        if system_tokens + message_tokens + reserved > cap:
+            # Keep the instructions, cut the end of the context block
+            system_content = trim_to_tokens(system_content, cap - message_tokens - reserved)
+            system_tokens = estimate_text_tokens(system_content)
+            self.capped_prompts += 1
+        available = cap - system_tokens - message_tokens
+        
+        # Newest messages first, verbatim, while they fit
+        history_budget = min(self.history_token_budget, max(reserved, available - self.summary_token_budget))
+        trimmed = self._fit_latest_exchange(history, summarized_count, history_budget)
+        start = len(history)
+        used = 0
+        while start > summarized_count and len(history) - start < self.max_recent_messages:
+            content = trimmed.get(start - 1, str((history[start - 1] or {}).get("content", "")))
+            tokens = estimate_text_tokens(content)
+            if used + tokens > history_budget and start - 1 not in trimmed:
+                break
+            used += tokens
+            start -= 1
+        
+        # Everything older joins the running summary
+        folded = [m for m in history[summarized_count:start] if m]
+        summary_lines.extend(summarize_message(m, language) for m in folded)
+        self.summarized_messages += len(folded)
+        
+        header = SUMMARY_HEADERS.get(language, SUMMARY_HEADERS["en"])
+        summary_budget = min(self.summary_token_budget, available - used) - estimate_text_tokens(header)
+        summary_tokens = 0
+        kept = len(summary_lines)
+        while kept and summary_tokens + estimate_text_tokens(summary_lines[kept - 1]) <= summary_budget:
+            summary_tokens += estimate_text_tokens(summary_lines[kept - 1])
+            kept -= 1
+        summary = "\n".join(summary_lines[kept:])
+        
+        if session is not None:
+            session.summary = summary
+            session.summarized_count = start
+        
+        messages = [{"role": "system", "content": system_content}]
+        if summary:
+            messages.append({"role": "system", "content": f"{header}\n{summary}"})
+        for index, msg in enumerate(history[start:], start):
+            if msg:
+                messages.append({
+                    "role": "user" if msg.get("isFromUser") else "assistant",
+                    "content": trimmed.get(index, msg.get("content", ""))
+                })
+        messages.append({"role": "user", "content": message})
+        return messages
+    
+    @staticmethod
+    def _fit_latest_exchange(history: List[dict], summarized_count: int, history_budget: int) -> Dict[int, str]:
+        """Contents of the latest exchange, by history index, cut to share the history budget.
+        
+        Empty when the exchange already fits. Otherwise the shorter message
+        keeps up to an even share and the other gets the rest.
+        """
+        latest = [
+            i for i in range(max(summarized_count, len(history) - LATEST_EXCHANGE_MESSAGES), len(history))
+            if history[i]
+        ]
+        contents = {i: str(history[i].get("content", "")) for i in latest}
+        sizes = {i: estimate_text_tokens(contents[i]) for i in latest}
+        if sum(sizes.values()) <= history_budget:
+            return {}
+        
+        fitted: Dict[int, str] = {}
+        remaining = history_budget
+        for n, i in enumerate(sorted(latest, key=sizes.get)):
+            share = min(sizes[i], max(1, remaining // (len(latest) - n)))
+            fitted[i] = contents[i] if share == sizes[i] else trim_to_tokens(contents[i], share)
+            remaining -= estimate_text_tokens(fitted[i])
+        return fitted
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "history_token_budget": self.history_token_budget,
+            "prompt_token_caps": self.prompt_token_caps,
+            "summarized_messages": self.summarized_messages,
+            "capped_prompts": self.capped_prompts
+        }
@@ -0,0 +1,284 @@
+"""
+Server-side chat sessions.
+
+Without a session the iOS client sends the whole `conversation_history` and
+`user_context` (current plan, recent and favorite recipes, preferences) with
+every `/ai/chat` message, and the server re-renders the recipe context block
+for the prompt each turn. A session keeps both on the server under a
+conversation id:
+
+- sessions are opt-in: a request with `start_session` set gets a
+  `conversation_id` in its response; later requests send it with only the
+  new messages and the `user_context` keys that changed (a key set to null
+  is removed). Other requests get a throwaway session that is never saved,
+- every turn appends the user message and the agent reply to the stored
+  history,
+- the rendered context block is cached per language until the context
+  changes.
+
+Sessions live in memory (LRU, lost on restart) or in a SQLite file. A
+request naming an unknown or expired id starts a new session, under a fresh
+id, with what it carries, and the response tells the client to resend its
+full state.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSession:
+    """History and user context of one conversation."""
+    
+    def __init__(
+        self,
+        conversation_id: str,
+        history: Optional[List[dict]] = None,
+        user_context: Optional[dict] = None,
+        context_version: int = 0,
+        context_blocks: Optional[Dict[str, str]] = None,
+        summary: str = "",
+        summarized_count: int = 0,
+        updated_at: Optional[float] = None,
+        persistent: bool = True
+    ):
+        self.conversation_id = conversation_id
+        self.history: List[dict] = history or []
+        self.user_context: dict = user_context or {}
+        # Bumped whenever the context changes; rendered blocks belong to one version
+        self.context_version = context_version
+        self.context_blocks: Dict[str, str] = context_blocks or {}
+        # Running summary of the first `summarized_count` messages of `history`
+        self.summary = summary
+        self.summarized_count = summarized_count
+        self.updated_at = updated_at or time.time()
+        # Throwaway sessions (client did not opt in) are never saved
+        self.persistent = persistent
+    
+    def apply_context_updates(self, updates: dict) -> bool:
+        """Merge changed top-level context keys (None removes a key). Returns True if anything changed."""
+        changed = False
+        for key, value in updates.items():
+            if value is None:
+                if key in self.user_context:
+                    del self.user_context[key]
+                    changed = True
+            elif self.user_context.get(key) != value:
+                self.user_context[key] = value
+                changed = True
+        if changed:
+            self.context_version += 1
+            self.context_blocks = {}
+        return changed
+    
+    def context_block(self, language: str, render: Callable[[dict, str], str]) -> str:
+        """Rendered context for `language`, rendered only once per context version."""
+        block = self.context_blocks.get(language)
+        if block is None:
+            block = render(self.user_context, language)
+            self.context_blocks[language] = block
+        return block
+    
+    def append_turn(self, user_message: str, reply: str, max_messages: int):
+        self.history.append({"content": user_message, "isFromUser": True})
+        self.history.append({"content": reply, "isFromUser": False})
+        if len(self.history) > max_messages:
+            dropped = len(self.history) - max_messages
+            del self.history[:dropped]
+            self.summarized_count = max(0, self.summarized_count - dropped)
+        self.updated_at = time.time()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "conversation_id": self.conversation_id,
+            "history": self.history,
+            "user_context": self.user_context,
+            "context_version": self.context_version,
+            "context_blocks": self.context_blocks,
+            "summary": self.summary,
+            "summarized_count": self.summarized_count,
+            "updated_at": self.updated_at
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationSession":
+        return cls(**data)
+
+
+class ConversationStore:
+    """Session lookup and persistence; subclasses provide `_load` / `_save`."""
+    
+    backend = "none"
+    
+    def __init__(self, ttl_seconds: float = 24 * 3600, max_messages: int = 50):
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+        self.transient = 0
+    
+    async def _load(self, conversation_id: str) -> Optional[ConversationSession]:
+        raise NotImplementedError
+    
+    async def _save(self, session: ConversationSession):
+        raise NotImplementedError
+    
+    async def resume(
+        self,
+        conversation_id: Optional[str],
+        history: List[dict],
+        user_context: dict,
+        start_session: bool = False
+    ) -> Tuple[ConversationSession, bool]:
+        """Session for a chat request, with the request's deltas applied.
+        
+        Returns `(session, expired)`: `expired` is True when the request named
+        a session the store no longer has, so the client should resend its
+        full history and context. Without a `conversation_id` or
+        `start_session`, the session is not persistent.
+        """
+        session = None
+        if conversation_id:
+            session = await self._load(conversation_id)
+            if session is not None and time.time() - session.updated_at > self.ttl_seconds:
+                session = None
+        
+        if session is not None:
+            self.resumed += 1
+            session.history.extend(history)
+            session.apply_context_updates(user_context)
+            return session, False
+        
+        expired = conversation_id is not None
+        persistent = expired or start_session
+        if expired:
+            self.expired += 1
+            logger.info(f"Chat session {conversation_id} not found, starting over from the request")
+        if persistent:
+            self.created += 1
+        else:
+            self.transient += 1
+        # Never adopt a client-chosen id
+        session = ConversationSession(uuid.uuid4().hex, list(history), persistent=persistent)
+        session.apply_context_updates(user_context)
+        return session, expired
+    
+    async def record_turn(self, session: ConversationSession, user_message: str, reply: str):
+        session.append_turn(user_message, reply, self.max_messages)
+        if session.persistent:
+            await self._save(session)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "created": self.created,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "transient": self.transient
+        }
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Sessions kept in process memory, least recently used evicted first."""
+    
+    backend = "memory"
+    
+    def __init__(self, max_sessions: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+    
+    async def _load(self, conversation_id: str) -> Optional[ConversationSession]:
+        session = self._sessions.get(conversation_id)
+        if session is not None:
+            self._sessions.move_to_end(conversation_id)
+        return session
+    
+    async def _save(self, session: ConversationSession):
+        self._sessions[session.conversation_id] = session
+        self._sessions.move_to_end(session.conversation_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "sessions": len(self._sessions)}
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Sessions stored as JSON rows in a SQLite file (survive restarts)."""
+    
+    backend = "sqlite"
+    
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "conversation_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS chat_sessions_updated_at ON chat_sessions (updated_at)")
+    
+    async def _load(self, conversation_id: str) -> Optional[ConversationSession]:
+        row = await asyncio.to_thread(self._select, conversation_id)
+        if row is None:
+            return None
+        try:
+            return ConversationSession.from_dict(json.loads(row[0]))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Discarding unreadable chat session {conversation_id}: {e}")
+            return None
+    
+    async def _save(self, session: ConversationSession):
+        data = json.dumps(session.to_dict(), ensure_ascii=False)
+        await asyncio.to_thread(self._upsert, session.conversation_id, data, session.updated_at)
+    
+    def _select(self, conversation_id: str) -> Optional[Tuple[str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT data FROM chat_sessions WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+    
+    def _upsert(self, conversation_id: str, data: str, updated_at: float):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO chat_sessions (conversation_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(conversation_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (conversation_id, data, updated_at)
+            )
+            # Expired sessions are dropped as new ones are written
+            self._db.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def conversation_store_from_env() -> ConversationStore:
+    """Store configured from CHAT_SESSION_* environment variables."""
+    options = {
+        "ttl_seconds": float(os.getenv("CHAT_SESSION_TTL_SECONDS", str(24 * 3600))),
+        "max_messages": int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "50"))
+    }
+    if os.getenv("CHAT_SESSION_BACKEND", "memory").lower() == "sqlite":
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "chat_sessions.sqlite3")
+        return SQLiteConversationStore(os.getenv("CHAT_SESSION_DB_PATH") or default_path, **options)
+    return InMemoryConversationStore(
+        max_sessions=int(os.getenv("CHAT_SESSION_MAX_SESSIONS", "1000")),
+        **options
+    )
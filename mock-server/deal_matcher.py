@@ -0,0 +1,195 @@
+"""
+Deal Matcher for Flyer Sale Tagging
+Matches recipe ingredients against a flyer's deals in one linear pass per ingredient.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class AhoCorasick:
+    """Multi-pattern substring search automaton.
+    
+    Built once for a set of patterns, it finds whether any of them occurs in a
+    text with a single left-to-right scan, instead of one `in` test per pattern.
+    """
+    
+    def __init__(self, patterns: Iterable[str]):
+        # Trie as a list of {char: next_state} dicts; state 0 is the root
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Longest pattern ending at each state (own or via fail links), if any
+        self._output: List[Optional[str]] = [None]
+        # Every pattern ending at each state, longest first
+        self._outputs: List[Tuple[str, ...]] = [()]
+        
+        for pattern in patterns:
+            self._add(pattern)
+        self._build_fail_links()
+    
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._outputs.append(())
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state] = pattern
+        self._outputs[state] = (pattern,)
+    
+    def _build_fail_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                candidate = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                if self._output[next_state] is None:
+                    self._output[next_state] = self._output[self._fail[next_state]]
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
+    
+    def find_any(self, text: str) -> Optional[str]:
+        """Return a pattern occurring in `text`, or None if no pattern matches."""
+        if self._output[0] is not None:
+            return self._output[0]  # Empty pattern matches everything
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+    
+    def starts_with(self, text: str) -> Iterator[str]:
+        """Yield every pattern that `text` starts with, shortest first."""
+        goto = self._goto
+        state = 0
+        for depth, char in enumerate(text, 1):
+            state = goto[state].get(char)
+            if state is None:
+                return
+            pattern = self._output[state]
+            if pattern is not None and len(pattern) == depth:
+                yield pattern
+    
+    def transition_table(self) -> Tuple[List[Dict[str, int]], List[Tuple[str, ...]]]:
+        """Deterministic form of the automaton: `(transitions, outputs)`.
+        
+        `transitions[state]` maps every character with a non-root successor
+        to the next state (fail links already followed), and `outputs[state]`
+        lists the patterns ending there. Callers that fold per-state data into
+        their own scan loop step with `transitions[state].get(char, 0)`.
+        """
+        order = [0]
+        for state in order:
+            order.extend(self._goto[state].values())
+        transitions: List[Dict[str, int]] = [{} for _ in self._goto]
+        for state in order:
+            if state:
+                transitions[state].update(transitions[self._fail[state]])
+            transitions[state].update(self._goto[state])
+        return transitions, list(self._outputs)
+
+
+class DealMatcher:
+    """Compiled matcher for one snapshot of flyer deals.
+    
+    Build it once per deal list and reuse it for every ingredient of every
+    recipe. Results are identical to the original nested-loop matching:
+    
+    - `match()`: exact name, qualifier-free keyword, or deal-substring match
+      against deal names, their EN <-> FR translations and their words
+      (used to tag recipe ingredients on sale).
+    - `match_loose()`: bidirectional substring match against raw deal names
+      (used by `FlyerScraperService.match_ingredients_with_sales`).
+    """
+    
+    def __init__(
+        self,
+        deal_names: Iterable[str],
+        translations: Optional[Dict[str, str]] = None,
+        ignore_words: Iterable[str] = (),
+        min_keyword_length: int = 4,
+        min_substring_length: int = 5
+    ):
+        translations = translations or {}
+        self.ignore_words = frozenset(ignore_words)
+        self.min_keyword_length = min_keyword_length
+        
+        self.deal_names: List[str] = [name.lower().strip() for name in deal_names]
+        
+        # Keyword hash index: normalized names, translations and individual words
+        terms = set()
+        for normalized in self.deal_names:
+            terms.add(normalized)
+            
+            # Add translation (EN <-> FR)
+            translation = translations.get(normalized, normalized)
+            if translation != normalized:
+                terms.add(translation)
+            
+            # Also add individual words for partial matching
+            for word in normalized.split():
+                if len(word) >= min_keyword_length:
+                    terms.add(word)
+                    word_translation = translations.get(word, word)
+                    if word_translation != word:
+                        terms.add(word_translation)
+        self.terms = frozenset(terms)
+        
+        # Automaton over every term long enough to count as a substring match
+        self._term_automaton = AhoCorasick(t for t in self.terms if len(t) >= min_substring_length)
+        
+        # Loose matching: automaton over raw names plus a single haystack to
+        # test "is this text inside any deal name" with one C-level scan
+        self._name_automaton = AhoCorasick(self.deal_names)
+        self._name_haystack = "\x00".join(self.deal_names)
+    
+    def __len__(self) -> int:
+        return len(self.terms)
+    
+    def match(self, ingredient_name: str) -> Optional[str]:
+        """Return the deal term an ingredient matched, or None if it is not on sale."""
+        ing_name = ingredient_name.lower().strip()
+        
+        # Check exact match first
+        if ing_name in self.terms:
+            return ing_name
+        
+        # Keywords from the ingredient name, qualifiers removed
+        for word in ing_name.split():
+            if len(word) >= self.min_keyword_length and word not in self.ignore_words and word in self.terms:
+                return word
+        
+        # Any deal term that is a substring of the ingredient
+        return self._term_automaton.find_any(ing_name)
+    
+    def match_loose(self, ingredient: str) -> bool:
+        """Direct or partial match in either direction against raw deal names."""
+        if not self.deal_names:
+            return False
+        ingredient_lower = ingredient.lower().strip()
+        
+        if self._name_automaton.find_any(ingredient_lower) is not None:
+            return True
+        if ingredient_lower in self._name_haystack:
+            return True
+        return any(
+            word in self._name_haystack
+            for word in ingredient_lower.split()
+            if len(word) > 3
+        )
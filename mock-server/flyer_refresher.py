@@ -0,0 +1,340 @@
+"""
+Background Flyer Refresher
+Keeps a warm, on-disk snapshot of weekly deals so plan requests never scrape inline.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from flyer_scraper import FlyerScraperService, normalize_postal_prefix
+
+logger = logging.getLogger(__name__)
+
+# Bump when the snapshot file layout changes; older files are ignored
+SNAPSHOT_SCHEMA_VERSION = 1
+
+# Canadian forward sortation area, e.g. "H2X"
+_FSA_PATTERN = re.compile(r"^[A-Z]\d[A-Z]$")
+
+
+class FlyerRefreshScheduler:
+    """Periodically scrapes every supported store for recently seen postal prefixes.
+    
+    A prefix seen for the first time is refreshed on its own right away; the
+    full sweep over every prefix only runs every `interval_seconds`.
+    
+    Results are kept in memory, primed into the shared deals cache and saved
+    as a versioned JSON snapshot, which is reloaded on startup so a restart
+    serves warm deals immediately instead of hitting the grocery sites cold.
+    """
+    
+    def __init__(
+        self,
+        snapshot_path: str,
+        interval_seconds: int = 6 * 3600,
+        prefix_ttl_days: int = 14,
+        max_prefixes: int = 200
+    ):
+        self.snapshot_path = snapshot_path
+        self.interval_seconds = interval_seconds
+        self.prefix_ttl_seconds = prefix_ttl_days * 24 * 3600
+        self.max_prefixes = max_prefixes
+        # "store|PREFIX" -> {"store", "postal_prefix", "deals", "fetched_at", "used_fallback"}
+        self.entries: Dict[str, dict] = {}
+        # Postal prefix -> last time a request asked for it
+        self.postal_prefixes: Dict[str, float] = {}
+        # New prefixes waiting for their first refresh
+        self._pending_prefixes: Set[str] = set()
+        self.version = 0
+        self.last_refresh_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+    
+    @classmethod
+    def from_env(cls) -> "FlyerRefreshScheduler":
+        """Build a scheduler configured from FLYER_REFRESH_* environment variables."""
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "flyer_snapshot.json")
+        return cls(
+            snapshot_path=os.getenv("FLYER_SNAPSHOT_PATH") or default_path,
+            interval_seconds=int(os.getenv("FLYER_REFRESH_INTERVAL_SECONDS", str(6 * 3600))),
+            prefix_ttl_days=int(os.getenv("FLYER_REFRESH_PREFIX_TTL_DAYS", "14")),
+            max_prefixes=int(os.getenv("FLYER_REFRESH_MAX_PREFIXES", "200"))
+        )
+    
+    @staticmethod
+    def _entry_key(store_key: str, postal_prefix: str) -> str:
+        return f"{store_key}|{postal_prefix}"
+    
+    async def start(self):
+        """Load the last snapshot and start the periodic refresh task."""
+        if self._task is not None:
+            return
+        await asyncio.to_thread(self.load_snapshot)
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Flyer refresher started: {len(self.entries)} snapshot entries, "
+            f"{len(self.postal_prefixes)} postal prefixes, every {self.interval_seconds}s"
+        )
+    
+    async def stop(self):
+        if self._task is None:
+            return
+        # The flag also covers a cancel swallowed by wait_for racing the wake event
+        self._stopping = True
+        self._wake.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    async def _run(self):
+        # Refresh right away only if the saved snapshot is missing or stale
+        if self.last_refresh_at is None or time.time() - self.last_refresh_at >= self.interval_seconds:
+            await self._refresh_safely()
+        
+        while True:
+            # New prefixes wake the loop early without pushing back the next full sweep
+            next_full_at = (self.last_refresh_at or time.time()) + self.interval_seconds
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, next_full_at - time.time()))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._stopping:
+                return
+            if time.time() >= next_full_at:
+                await self._refresh_safely()
+            elif self._pending_prefixes:
+                prefixes = sorted(self._pending_prefixes)
+                self._pending_prefixes.clear()
+                await self._refresh_safely(prefixes)
+    
+    async def _refresh_safely(self, prefixes: Optional[List[str]] = None):
+        try:
+            if prefixes is None:
+                await self.refresh_all()
+            else:
+                await self.refresh_prefixes(prefixes)
+        except Exception as e:
+            logger.error(f"Flyer refresh failed: {e}")
+    
+    def record_postal_code(self, postal_code: str) -> bool:
+        """Remember a postal prefix so it gets refreshed. Returns True if it is new.
+        
+        Only well-formed FSAs are tracked, and at most `max_prefixes` of them:
+        past that, new prefixes are served without being refreshed.
+        """
+        prefix = normalize_postal_prefix(postal_code)
+        if not _FSA_PATTERN.match(prefix):
+            return False
+        is_new = prefix not in self.postal_prefixes
+        if is_new and len(self.postal_prefixes) >= self.max_prefixes:
+            self._active_prefixes()
+            if len(self.postal_prefixes) >= self.max_prefixes:
+                logger.debug(f"Not tracking postal prefix {prefix}: {self.max_prefixes} prefixes already tracked")
+                return False
+        self.postal_prefixes[prefix] = time.time()
+        return is_new
+    
+    async def get_deals(self, store_name: str, postal_code: str) -> List[dict]:
+        """Return deals for a store from the warm snapshot.
+        
+        Unseen postal prefixes are served the same chain's flyer from another
+        prefix, with every deal flagged `other_region` since it may not apply
+        here, and queued for a background refresh. Only a store with no
+        snapshot data at all is scraped inline.
+        """
+        scraper_class, store_key = FlyerScraperService.resolve_store(store_name)
+        prefix = normalize_postal_prefix(postal_code)
+        
+        if scraper_class and self.record_postal_code(postal_code) and self._wake is not None:
+            self._pending_prefixes.add(prefix)
+            self._wake.set()
+        
+        if scraper_class:
+            deals = FlyerScraperService.deals_cache.get((store_key, prefix))
+            if deals is not None:
+                return [dict(deal) for deal in deals]
+            entry = self._latest_entry_for_store(store_key)
+            if entry is not None:
+                logger.info(f"Serving {store_key} deals from {entry['postal_prefix']} to unseen prefix {prefix}")
+                return [{**deal, "other_region": True} for deal in entry["deals"]]
+        
+        return await FlyerScraperService.get_weekly_deals_async(store_name, postal_code)
+    
+    async def get_multi_store_deals(
+        self,
+        store_names: List[str],
+        postal_code: str,
+        deadline_seconds: Optional[float] = None
+    ) -> dict:
+        """Merged deals for several stores, each served from the warm snapshot when possible."""
+        return await FlyerScraperService.get_multi_store_deals_async(
+            store_names,
+            postal_code,
+            deadline_seconds=deadline_seconds,
+            fetch_deals=self.get_deals
+        )
+    
+    def _latest_entry_for_store(self, store_key: str) -> Optional[dict]:
+        now = time.time()
+        cache = FlyerScraperService.deals_cache
+        candidates = [
+            e for e in self.entries.values()
+            if e["store"] == store_key and not e["used_fallback"] and cache.expires_at(e["fetched_at"]) > now
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda e: e["fetched_at"])
+    
+    def _active_prefixes(self) -> List[str]:
+        cutoff = time.time() - self.prefix_ttl_seconds
+        for prefix, last_seen in list(self.postal_prefixes.items()):
+            if last_seen < cutoff:
+                del self.postal_prefixes[prefix]
+        return sorted(self.postal_prefixes)
+    
+    async def refresh_all(self):
+        """Scrape every supported store for every active postal prefix and save a snapshot."""
+        prefixes = self._active_prefixes()
+        if not prefixes:
+            logger.info("Flyer refresh skipped: no postal prefixes seen yet")
+            return
+        self._pending_prefixes.clear()
+        await self._refresh(prefixes, full=True)
+    
+    async def refresh_prefixes(self, prefixes: Iterable[str]):
+        """Scrape every supported store for the given postal prefixes only and save a snapshot."""
+        await self._refresh(list(prefixes), full=False)
+    
+    async def _refresh(self, prefixes: List[str], full: bool):
+        jobs = [
+            (store_key, scraper_class, prefix)
+            for prefix in prefixes
+            for store_key, scraper_class in FlyerScraperService.SUPPORTED_STORES.items()
+        ]
+        logger.info(f"Refreshing {len(jobs)} flyers ({len(prefixes)} prefixes)")
+        
+        results = await asyncio.gather(
+            *[self._scrape(scraper_class, prefix) for _, scraper_class, prefix in jobs],
+            return_exceptions=True
+        )
+        
+        updated = 0
+        for (store_key, _, prefix), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error(f"Refresh failed for {store_key} {prefix}: {result}")
+                continue
+            deals, used_fallback = result
+            key = self._entry_key(store_key, prefix)
+            previous = self.entries.get(key)
+            # Never replace real flyer data with canned fallback items
+            if used_fallback and previous is not None and not previous["used_fallback"]:
+                continue
+            entry = {
+                "store": store_key,
+                "postal_prefix": prefix,
+                "deals": deals,
+                "fetched_at": time.time(),
+                "used_fallback": used_fallback,
+            }
+            self.entries[key] = entry
+            self._prime_cache(entry)
+            updated += 1
+        
+        if full:
+            self.last_refresh_at = time.time()
+        # Copy the maps on the loop; only the finished dict goes to the writer thread
+        snapshot = self.build_snapshot()
+        await asyncio.to_thread(self.write_snapshot, snapshot)
+        logger.info(f"Flyer refresh done: {updated}/{len(jobs)} entries updated (snapshot v{self.version})")
+    
+    @staticmethod
+    async def _scrape(scraper_class, prefix: str) -> Tuple[List[dict], bool]:
+        scraper = scraper_class(prefix)
+        deals = FlyerScraperService.items_to_deals(await scraper.scrape_async())
+        return deals, scraper.used_fallback or not deals
+    
+    @staticmethod
+    def _prime_cache(entry: dict):
+        cache = FlyerScraperService.deals_cache
+        cache.set(
+            (entry["store"], entry["postal_prefix"]),
+            entry["deals"],
+            cache.fallback_ttl_seconds if entry["used_fallback"] else None,
+            fetched_at=entry["fetched_at"]
+        )
+    
+    def build_snapshot(self) -> dict:
+        """The current entries as the next snapshot version.
+        
+        Both maps are copied: entries are replaced, never mutated, so a
+        shallow copy is stable while request handlers keep updating them.
+        """
+        self.version += 1
+        return {
+            "schema_version": SNAPSHOT_SCHEMA_VERSION,
+            "version": self.version,
+            "generated_at": datetime.now().isoformat(),
+            "last_refresh_at": self.last_refresh_at,
+            "postal_prefixes": dict(self.postal_prefixes),
+            "entries": dict(self.entries),
+        }
+    
+    def write_snapshot(self, snapshot: dict):
+        """Atomically write a snapshot built by `build_snapshot()` to disk."""
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+    
+    def load_snapshot(self) -> bool:
+        """Load the last saved snapshot, if any. Returns True when one was loaded."""
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Could not read flyer snapshot {self.snapshot_path}: {e}")
+            return False
+        
+        if snapshot.get("schema_version") != SNAPSHOT_SCHEMA_VERSION:
+            logger.warning(f"Ignoring flyer snapshot with schema {snapshot.get('schema_version')}")
+            return False
+        
+        self.version = snapshot.get("version", 0)
+        self.last_refresh_at = snapshot.get("last_refresh_at")
+        self.postal_prefixes = {
+            prefix: last_seen
+            for prefix, last_seen in snapshot.get("postal_prefixes", {}).items()
+            if _FSA_PATTERN.match(prefix)
+        }
+        self.entries = dict(snapshot.get("entries", {}))
+        for entry in self.entries.values():
+            self._prime_cache(entry)
+        logger.info(f"Loaded flyer snapshot v{self.version} with {len(self.entries)} entries")
+        return True
+    
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "snapshot_version": self.version,
+            "entries": len(self.entries),
+            "postal_prefixes": len(self.postal_prefixes),
+            "last_refresh_at": self.last_refresh_at,
+        }
@@ -3,13 +3,27 @@ Flyer Scraper Service for Grocery Store Weekly Deals
 Supports major Quebec grocery chains: IGA, Metro, Provigo, Maxi
 """
 
+import asyncio
+import importlib.util
+import httpx
 import requests
 from bs4 import BeautifulSoup
-from typing import List, Dict, Optional
+from deal_matcher import DealMatcher
+from typing import Any, Awaitable, Callable, List, Dict, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import os
 import re
-from urllib.parse import urljoin, quote
+import threading
+import time
+from urllib.parse import urljoin, quote, urlparse
 import logging
 
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # Fall back to BeautifulSoup's pure-Python parser
+    lxml_etree = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -25,19 +39,315 @@ class FlyerItem:
         return f"FlyerItem(name='{self.name}', price={self.price}, discount={self.discount_percent}%)"
 
 
+# Shared deadline for a multi-store lookup; slower stores are reported as timed out
+FLYER_MULTI_STORE_DEADLINE_SECONDS = float(os.getenv("FLYER_MULTI_STORE_DEADLINE_SECONDS", "8"))
+
+# Scrapes that missed a multi-store deadline keep running to warm the cache
+_straggler_tasks: set = set()
+
+# Shared async HTTP client for flyer scraping (created lazily on first use)
+_async_client: Optional[httpx.AsyncClient] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+FLYER_HTTP_MAX_PER_HOST = int(os.getenv("FLYER_HTTP_MAX_PER_HOST", "4"))
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the process-wide httpx client used by async scrapes.
+    
+    Connections are kept alive and reused across scrapes; HTTP/2 is enabled
+    when the optional `h2` package is installed.
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            follow_redirects=True
+        )
+    return _async_client
+
+
+async def close_async_client():
+    """Close the shared client (called on app shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    _host_semaphores.clear()
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    """Per-host concurrency limit so one chain's site never gets hammered."""
+    host = urlparse(url).netloc
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(FLYER_HTTP_MAX_PER_HOST)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+
+class FlyerPageValidators:
+    """HTTP validators (ETag / Last-Modified) and parsed items per flyer URL.
+    
+    Lets scrapers send conditional requests and reuse the previous parse
+    when the site answers 304 Not Modified.
+    """
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[str], Optional[str], List[FlyerItem]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.modified = 0
+    
+    def request_headers(self, url: str) -> Dict[str, str]:
+        """Conditional headers for the last known version of `url`."""
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return {}
+        etag, last_modified, _ = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+    
+    def cached_items(self, url: str) -> Optional[List[FlyerItem]]:
+        """Items parsed from the version of `url` the validators describe."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            self._entries.move_to_end(url)
+            self.not_modified += 1
+            return list(entry[2])
+    
+    def store(self, url: str, headers, items: List[FlyerItem]):
+        """Remember the response validators, if the site sent any, with its parsed items."""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        with self._lock:
+            self.modified += 1
+            if not etag and not last_modified:
+                self._entries.pop(url, None)
+                return
+            self._entries[url] = (etag, last_modified, list(items))
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "not_modified": self.not_modified,
+                "modified": self.modified
+            }
+
+
 class GroceryStoreScraper:
     """Base class for grocery store scrapers"""
     
+    # Whether an empty parse should be replaced by fallback items
+    fallback_when_empty = True
+    
+    # Selectors, compiled once per scraper class - overridden by subclasses
+    CARD_TAGS = ('div', 'article')
+    CARD_CLASS_RE = re.compile(r'product|item', re.I)
+    NAME_TAGS = ('h2', 'h3', 'span')
+    NAME_CLASS_RE = re.compile(r'name|title', re.I)
+    PRICE_TAGS: Optional[Tuple[str, ...]] = None  # None = flyer has no usable prices
+    PRICE_CLASS_RE: Optional[re.Pattern] = None
+    PRICE_RE = re.compile(r'(\d+[.,]\d{2})')
+    MAX_ITEMS = 50
+    # Bytes fed to the streaming parser at a time
+    PARSE_CHUNK_SIZE = 64 * 1024
+    
+    # Shared by every scraper instance so refreshes can send conditional requests
+    validators = FlyerPageValidators()
+    
     def __init__(self, store_name: str, postal_code: str):
         self.store_name = store_name.lower().strip()
         self.postal_code = postal_code.upper().replace(" ", "")
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         }
+        # Set when scrape() had to return fallback items instead of real flyer data
+        self.used_fallback = False
+    
+    @property
+    def flyer_url(self) -> str:
+        """URL of the weekly flyer page - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement flyer_url")
+    
+    def parse_flyer(self, content: bytes) -> List[FlyerItem]:
+        """Extract sale items from the flyer HTML using the class selectors."""
+        if lxml_etree is not None:
+            cards = self._extract_cards_lxml(content)
+        else:
+            cards = self._extract_cards_bs4(content)
+        
+        items = []
+        for name, price_text in cards:
+            try:
+                price = None
+                if price_text:
+                    price_match = self.PRICE_RE.search(price_text)
+                    if price_match:
+                        price = float(price_match.group(1).replace(',', '.'))
+                
+                if name and len(name) > 2:
+                    items.append(FlyerItem(name=name, price=price))
+            except Exception as e:
+                logger.debug(f"Error parsing {self.display_name} product card: {e}")
+                continue
+        
+        return items
+    
+    def _extract_cards_lxml(self, content: bytes) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Stream the page through lxml and stop once MAX_ITEMS product cards are complete.
+        
+        Returns (name_text, price_text) for each card, in document order.
+        """
+        parser = lxml_etree.HTMLPullParser(events=('start', 'end'))
+        cards = []
+        open_cards = set()
+        
+        def consume_events():
+            for event, element in parser.read_events():
+                if event == 'start':
+                    if len(cards) < self.MAX_ITEMS and self._matches(element, self.CARD_TAGS, self.CARD_CLASS_RE):
+                        cards.append(element)
+                        open_cards.add(element)
+                else:
+                    open_cards.discard(element)
+        
+        for offset in range(0, len(content), self.PARSE_CHUNK_SIZE):
+            parser.feed(content[offset:offset + self.PARSE_CHUNK_SIZE])
+            consume_events()
+            if len(cards) >= self.MAX_ITEMS and not open_cards:
+                break  # Every card we need is fully parsed - skip the rest of the page
+        else:
+            parser.close()
+            consume_events()
+        
+        results = []
+        for card in cards:
+            name_elem = self._find_descendant(card, self.NAME_TAGS, self.NAME_CLASS_RE)
+            if name_elem is None:
+                continue
+            price_text = None
+            if self.PRICE_TAGS:
+                price_elem = self._find_descendant(card, self.PRICE_TAGS, self.PRICE_CLASS_RE)
+                if price_elem is not None:
+                    price_text = self._element_text(price_elem)
+            results.append((self._element_text(name_elem), price_text))
+        return results
+    
+    @staticmethod
+    def _matches(element, tags: Tuple[str, ...], class_re: re.Pattern) -> bool:
+        return element.tag in tags and bool(class_re.search(element.get('class') or ''))
+    
+    @classmethod
+    def _find_descendant(cls, element, tags: Tuple[str, ...], class_re: re.Pattern):
+        for descendant in element.iterdescendants():
+            if isinstance(descendant.tag, str) and cls._matches(descendant, tags, class_re):
+                return descendant
+        return None
+    
+    @staticmethod
+    def _element_text(element) -> str:
+        # Same result as BeautifulSoup's get_text(strip=True)
+        return "".join(text.strip() for text in element.itertext())
+    
+    def _extract_cards_bs4(self, content: bytes) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Pure-Python fallback used when lxml is not installed."""
+        soup = BeautifulSoup(content, 'html.parser')
+        results = []
+        
+        for card in soup.find_all(list(self.CARD_TAGS), class_=self.CARD_CLASS_RE, limit=self.MAX_ITEMS):
+            name_elem = card.find(list(self.NAME_TAGS), class_=self.NAME_CLASS_RE)
+            if not name_elem:
+                continue
+            price_text = None
+            if self.PRICE_TAGS:
+                price_elem = card.find(list(self.PRICE_TAGS), class_=self.PRICE_CLASS_RE)
+                if price_elem:
+                    price_text = price_elem.get_text(strip=True)
+            results.append((name_elem.get_text(strip=True), price_text))
+        return results
+    
+    def _get_fallback_items(self) -> List[FlyerItem]:
+        self.used_fallback = True
+        return []
+    
+    def _finish(self, items: List[FlyerItem]) -> List[FlyerItem]:
+        logger.info(f"Scraped {len(items)} items from {self.display_name}")
+        if not items and self.fallback_when_empty:
+            return self._get_fallback_items()
+        return items
+    
+    @property
+    def display_name(self) -> str:
+        return type(self).__name__.replace("Scraper", "")
+    
+    def _request_headers(self, url: str) -> Dict[str, str]:
+        return {**self.headers, **self.validators.request_headers(url)}
+    
+    def _not_modified_items(self, url: str, status_code: int) -> Optional[List[FlyerItem]]:
+        """Previously parsed items when the flyer answered 304, else None."""
+        if status_code != 304:
+            return None
+        items = self.validators.cached_items(url)
+        if items is None:
+            # Our copy was evicted between the request and the response
+            raise RuntimeError(f"{self.display_name} flyer answered 304 but no parsed copy is cached")
+        logger.info(f"{self.display_name} flyer not modified, reusing {len(items)} parsed items")
+        return items
     
     def scrape(self) -> List[FlyerItem]:
-        """Main scraping method - to be implemented by subclasses"""
-        raise NotImplementedError("Subclasses must implement scrape()")
+        """Scrape the weekly flyer synchronously (blocking HTTP)."""
+        try:
+            logger.info(f"Scraping {self.display_name} for postal code {self.postal_code}")
+            url = self.flyer_url
+            response = requests.get(url, headers=self._request_headers(url), timeout=10)
+            items = self._not_modified_items(url, response.status_code)
+            if items is None:
+                response.raise_for_status()
+                items = self.parse_flyer(response.content)
+                self.validators.store(url, response.headers, items)
+            return self._finish(items)
+        except Exception as e:
+            logger.error(f"Error scraping {self.display_name}: {e}")
+            return self._get_fallback_items()
+    
+    async def scrape_async(self) -> List[FlyerItem]:
+        """Scrape the weekly flyer on the shared async client.
+        
+        The download runs on the event loop; only the CPU-bound HTML parse
+        is handed to a worker thread.
+        """
+        try:
+            logger.info(f"Scraping {self.display_name} for postal code {self.postal_code} (async)")
+            url = self.flyer_url
+            async with _host_semaphore(url):
+                response = await get_async_client().get(url, headers=self._request_headers(url))
+            items = self._not_modified_items(url, response.status_code)
+            if items is None:
+                response.raise_for_status()
+                items = await asyncio.to_thread(self.parse_flyer, response.content)
+                self.validators.store(url, response.headers, items)
+            return self._finish(items)
+        except Exception as e:
+            logger.error(f"Error scraping {self.display_name}: {e}")
+            return self._get_fallback_items()
     
     def normalize_ingredient_name(self, name: str) -> str:
         """Normalize ingredient names for better matching"""
@@ -52,58 +362,27 @@ class GroceryStoreScraper:
 class IGAScraper(GroceryStoreScraper):
     """Scraper for IGA stores"""
     
+    # IGA keeps whatever was parsed, even an empty list
+    fallback_when_empty = False
+    
+    CARD_CLASS_RE = re.compile(r'product|item|card|flyer-item', re.I)
+    NAME_TAGS = ('h2', 'h3', 'h4', 'p', 'span')
+    NAME_CLASS_RE = re.compile(r'name|title|product', re.I)
+    PRICE_TAGS = ('span', 'div', 'p')
+    PRICE_CLASS_RE = re.compile(r'price|cost', re.I)
+    
     def __init__(self, postal_code: str):
         super().__init__("IGA", postal_code)
         self.base_url = "https://www.iga.net"
     
-    def scrape(self) -> List[FlyerItem]:
-        """Scrape IGA weekly flyer"""
-        try:
-            logger.info(f"Scraping IGA for postal code {self.postal_code}")
-            
-            # IGA flyer URL structure
-            url = f"{self.base_url}/en/online_flyer"
-            
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            items = []
-            
-            # Look for product listings - adapt selectors based on actual HTML structure
-            product_cards = soup.find_all(['div', 'article'], class_=re.compile(r'product|item|card|flyer-item', re.I))
-            
-            for card in product_cards[:50]:  # Limit to first 50 items
-                try:
-                    # Extract product name
-                    name_elem = card.find(['h2', 'h3', 'h4', 'p', 'span'], class_=re.compile(r'name|title|product', re.I))
-                    if name_elem:
-                        name = name_elem.get_text(strip=True)
-                        
-                        # Extract price if available
-                        price_elem = card.find(['span', 'div', 'p'], class_=re.compile(r'price|cost', re.I))
-                        price = None
-                        if price_elem:
-                            price_text = price_elem.get_text(strip=True)
-                            price_match = re.search(r'(\d+[.,]\d{2})', price_text)
-                            if price_match:
-                                price = float(price_match.group(1).replace(',', '.'))
-                        
-                        if name and len(name) > 2:
-                            items.append(FlyerItem(name=name, price=price))
-                except Exception as e:
-                    logger.debug(f"Error parsing IGA product card: {e}")
-                    continue
-            
-            logger.info(f"Scraped {len(items)} items from IGA")
-            return items
-            
-        except Exception as e:
-            logger.error(f"Error scraping IGA: {e}")
-            return self._get_fallback_items()
+    @property
+    def flyer_url(self) -> str:
+        # IGA flyer URL structure
+        return f"{self.base_url}/en/online_flyer"
     
     def _get_fallback_items(self) -> List[FlyerItem]:
         """Return common sale items as fallback"""
+        self.used_fallback = True
         return [
             FlyerItem("chicken breast", 8.99, 20),
             FlyerItem("salmon fillet", 9.99, 25),
@@ -121,53 +400,21 @@ class IGAScraper(GroceryStoreScraper):
 class MetroScraper(GroceryStoreScraper):
     """Scraper for Metro stores"""
     
+    CARD_CLASS_RE = re.compile(r'product|item|tile', re.I)
+    NAME_TAGS = ('h2', 'h3', 'h4', 'span')
+    PRICE_TAGS = ('span', 'div')
+    PRICE_CLASS_RE = re.compile(r'price', re.I)
+    
     def __init__(self, postal_code: str):
         super().__init__("Metro", postal_code)
         self.base_url = "https://www.metro.ca"
     
-    def scrape(self) -> List[FlyerItem]:
-        """Scrape Metro weekly flyer"""
-        try:
-            logger.info(f"Scraping Metro for postal code {self.postal_code}")
-            
-            url = f"{self.base_url}/en/flyer"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            items = []
-            
-            # Look for product listings
-            product_cards = soup.find_all(['div', 'article'], class_=re.compile(r'product|item|tile', re.I))
-            
-            for card in product_cards[:50]:
-                try:
-                    name_elem = card.find(['h2', 'h3', 'h4', 'span'], class_=re.compile(r'name|title', re.I))
-                    if name_elem:
-                        name = name_elem.get_text(strip=True)
-                        
-                        price_elem = card.find(['span', 'div'], class_=re.compile(r'price', re.I))
-                        price = None
-                        if price_elem:
-                            price_text = price_elem.get_text(strip=True)
-                            price_match = re.search(r'(\d+[.,]\d{2})', price_text)
-                            if price_match:
-                                price = float(price_match.group(1).replace(',', '.'))
-                        
-                        if name and len(name) > 2:
-                            items.append(FlyerItem(name=name, price=price))
-                except Exception as e:
-                    logger.debug(f"Error parsing Metro product: {e}")
-                    continue
-            
-            logger.info(f"Scraped {len(items)} items from Metro")
-            return items if items else self._get_fallback_items()
-            
-        except Exception as e:
-            logger.error(f"Error scraping Metro: {e}")
-            return self._get_fallback_items()
+    @property
+    def flyer_url(self) -> str:
+        return f"{self.base_url}/en/flyer"
     
     def _get_fallback_items(self) -> List[FlyerItem]:
+        self.used_fallback = True
         return [
             FlyerItem("chicken thighs", 7.99, 25),
             FlyerItem("beef steak", 12.99, 20),
@@ -187,37 +434,12 @@ class ProvigoScraper(GroceryStoreScraper):
         super().__init__("Provigo", postal_code)
         self.base_url = "https://www.provigo.ca"
     
-    def scrape(self) -> List[FlyerItem]:
-        try:
-            logger.info(f"Scraping Provigo for postal code {self.postal_code}")
-            url = f"{self.base_url}/en/flyer"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            items = []
-            
-            product_cards = soup.find_all(['div', 'article'], class_=re.compile(r'product|item', re.I))
-            
-            for card in product_cards[:50]:
-                try:
-                    name_elem = card.find(['h2', 'h3', 'span'], class_=re.compile(r'name|title', re.I))
-                    if name_elem:
-                        name = name_elem.get_text(strip=True)
-                        if name and len(name) > 2:
-                            items.append(FlyerItem(name=name))
-                except Exception as e:
-                    logger.debug(f"Error parsing Provigo product: {e}")
-                    continue
-            
-            logger.info(f"Scraped {len(items)} items from Provigo")
-            return items if items else self._get_fallback_items()
-            
-        except Exception as e:
-            logger.error(f"Error scraping Provigo: {e}")
-            return self._get_fallback_items()
+    @property
+    def flyer_url(self) -> str:
+        return f"{self.base_url}/en/flyer"
     
     def _get_fallback_items(self) -> List[FlyerItem]:
+        self.used_fallback = True
         return [
             FlyerItem("chicken legs", 6.99, 30),
             FlyerItem("ground pork", 5.49, 20),
@@ -234,37 +456,12 @@ class MaxiScraper(GroceryStoreScraper):
         super().__init__("Maxi", postal_code)
         self.base_url = "https://www.maxi.ca"
     
-    def scrape(self) -> List[FlyerItem]:
-        try:
-            logger.info(f"Scraping Maxi for postal code {self.postal_code}")
-            url = f"{self.base_url}/en/flyer"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            items = []
-            
-            product_cards = soup.find_all(['div', 'article'], class_=re.compile(r'product|item', re.I))
-            
-            for card in product_cards[:50]:
-                try:
-                    name_elem = card.find(['h2', 'h3', 'span'], class_=re.compile(r'name|title', re.I))
-                    if name_elem:
-                        name = name_elem.get_text(strip=True)
-                        if name and len(name) > 2:
-                            items.append(FlyerItem(name=name))
-                except Exception as e:
-                    logger.debug(f"Error parsing Maxi product: {e}")
-                    continue
-            
-            logger.info(f"Scraped {len(items)} items from Maxi")
-            return items if items else self._get_fallback_items()
-            
-        except Exception as e:
-            logger.error(f"Error scraping Maxi: {e}")
-            return self._get_fallback_items()
+    @property
+    def flyer_url(self) -> str:
+        return f"{self.base_url}/en/flyer"
     
     def _get_fallback_items(self) -> List[FlyerItem]:
+        self.used_fallback = True
         return [
             FlyerItem("turkey breast", 8.99, 25),
             FlyerItem("shrimp", 11.99, 20),
@@ -273,6 +470,239 @@ class MaxiScraper(GroceryStoreScraper):
         ]
 
 
+def normalize_postal_prefix(postal_code: str) -> str:
+    """Reduce a postal code to its forward sortation area (e.g. 'J5B 2J3' -> 'J5B').
+    
+    All addresses in the same FSA get the same regional flyer, so the prefix
+    is what we key cached deals on.
+    """
+    return (postal_code or "").upper().replace(" ", "")[:3]
+
+
+def split_store_names(value: Any) -> List[str]:
+    """Turn a store preference into a list of store names.
+    
+    Accepts a list, or free text such as "IGA, Metro" / "IGA et Maxi".
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'\s*(?:[,;/+&]|\bet\b|\band\b)\s*', value, flags=re.I)
+    return [name.strip() for name in value if name and name.strip()]
+
+
+def next_flyer_rollover(now: Optional[datetime] = None, rollover_weekday: int = 3) -> datetime:
+    """Return the next moment the weekly flyers change (Thursday midnight by default)."""
+    now = now or datetime.now()
+    days_ahead = (rollover_weekday - now.weekday()) % 7
+    rollover = (now + timedelta(days=days_ahead)).replace(hour=0, minute=0, second=0, microsecond=0)
+    if rollover <= now:
+        rollover += timedelta(days=7)
+    return rollover
+
+
+def _resolve_waiter(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FlyerDealsCache:
+    """Process-wide TTL + LRU cache for weekly deals, keyed by (store, postal prefix).
+    
+    Entries expire at the next flyer rollover or after `ttl_seconds`, whichever
+    comes first. Concurrent misses on the same key are single-flighted: the
+    first caller scrapes while the others wait for its result. Sync and async
+    callers share one in-flight map, so there is one scrape per key whichever
+    path starts it.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: int = 7 * 24 * 3600,
+        fallback_ttl_seconds: int = 15 * 60,
+        rollover_weekday: int = 3
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.fallback_ttl_seconds = fallback_ttl_seconds
+        self.rollover_weekday = rollover_weekday
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        # Set when the scrape for a key finishes, whether it cached anything or not
+        self._in_flight: Dict[Tuple[str, str], threading.Event] = {}
+        # Futures of coroutines waiting on an in-flight key, resolved on their own loop
+        self._async_waiters: Dict[Tuple[str, str], List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+    
+    @classmethod
+    def from_env(cls) -> "FlyerDealsCache":
+        """Build a cache configured from FLYER_CACHE_* environment variables."""
+        return cls(
+            max_entries=int(os.getenv("FLYER_CACHE_MAX_ENTRIES", "256")),
+            ttl_seconds=int(os.getenv("FLYER_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            fallback_ttl_seconds=int(os.getenv("FLYER_CACHE_FALLBACK_TTL_SECONDS", str(15 * 60))),
+            rollover_weekday=int(os.getenv("FLYER_ROLLOVER_WEEKDAY", "3"))
+        )
+    
+    def expires_at(self, fetched_at: Optional[float] = None, ttl_seconds: Optional[int] = None) -> float:
+        """When data scraped at `fetched_at` goes stale: TTL or next flyer rollover."""
+        fetched_at = fetched_at or time.time()
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        rollover = next_flyer_rollover(
+            datetime.fromtimestamp(fetched_at),
+            rollover_weekday=self.rollover_weekday
+        ).timestamp()
+        return min(fetched_at + ttl_seconds, rollover)
+    
+    def get(self, key: Tuple[str, str]) -> Optional[Any]:
+        """Return the cached value for `key`, or None if missing or expired."""
+        with self._lock:
+            return self._get_locked(key)
+    
+    def _get_locked(self, key: Tuple[str, str]) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(
+        self,
+        key: Tuple[str, str],
+        value: Any,
+        ttl_seconds: Optional[int] = None,
+        fetched_at: Optional[float] = None
+    ):
+        """Store `value` under `key`, evicting the least recently used entries if full.
+        
+        `fetched_at` backdates the entry (e.g. when loading a saved snapshot) so
+        it still expires relative to when the flyer was actually scraped.
+        """
+        expires_at = self.expires_at(fetched_at, ttl_seconds)
+        if expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def _claim(self, key: Tuple[str, str]) -> Tuple[Optional[Any], Optional[threading.Event], bool]:
+        """Cached value, or the in-flight event for `key` and whether the caller must scrape."""
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value, None, False
+            event = self._in_flight.get(key)
+            if event is None:
+                self.misses += 1
+                event = threading.Event()
+                self._in_flight[key] = event
+                return None, event, True
+            self.coalesced += 1
+            return None, event, False
+    
+    def _release(self, key: Tuple[str, str], event: threading.Event):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            waiters = self._async_waiters.pop(key, [])
+        event.set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_waiter, future)
+            except RuntimeError:
+                pass  # Waiter's loop already closed
+    
+    def _async_waiter(self, key: Tuple[str, str], event: threading.Event) -> Optional[asyncio.Future]:
+        """Future resolved when the scrape behind `event` finishes, or None if it already has."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight.get(key) is not event:
+                return None
+            future = loop.create_future()
+            self._async_waiters.setdefault(key, []).append((loop, future))
+            return future
+    
+    def get_or_load(self, key: Tuple[str, str], loader: Callable[[], Tuple[Any, bool]]) -> Any:
+        """Return the cached value for `key`, calling `loader` once on a miss.
+        
+        `loader` returns (value, is_fallback); fallback values are kept only
+        for `fallback_ttl_seconds` so a failed scrape is retried soon.
+        """
+        while True:
+            value, event, is_leader = self._claim(key)
+            if value is not None:
+                return value
+            
+            if not is_leader:
+                # Another thread is already scraping this key - wait for it
+                event.wait()
+                with self._lock:
+                    value = self._get_locked(key)
+                if value is not None:
+                    return value
+                # Leader failed without caching anything: try again ourselves
+                continue
+            
+            try:
+                value, is_fallback = loader()
+                self.set(key, value, self.fallback_ttl_seconds if is_fallback else None)
+                return value
+            finally:
+                self._release(key, event)
+    
+    async def get_or_load_async(self, key: Tuple[str, str], loader: Callable[[], Awaitable[Tuple[Any, bool]]]) -> Any:
+        """Async counterpart of `get_or_load` for scrapes running on the event loop."""
+        while True:
+            value, event, is_leader = self._claim(key)
+            if value is not None:
+                return value
+            
+            if not is_leader:
+                # Another task or thread is already scraping this key - wait for it
+                # on the loop: blocking a pool thread could starve the leader's scrape
+                future = self._async_waiter(key, event)
+                if future is not None:
+                    await future
+                with self._lock:
+                    value = self._get_locked(key)
+                if value is not None:
+                    return value
+                # Leader failed without caching anything: try again ourselves
+                continue
+            
+            try:
+                value, is_fallback = await loader()
+                self.set(key, value, self.fallback_ttl_seconds if is_fallback else None)
+                return value
+            finally:
+                self._release(key, event)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+
 class FlyerScraperService:
     """Main service for scraping grocery store flyers"""
     
@@ -283,6 +713,9 @@ class FlyerScraperService:
         'maxi': MaxiScraper,
     }
     
+    # Shared across requests: flyers only change weekly
+    deals_cache = FlyerDealsCache.from_env()
+    
     @classmethod
     def get_weekly_deals(cls, store_name: str, postal_code: str) -> List[Dict[str, any]]:
         """
@@ -295,30 +728,188 @@ class FlyerScraperService:
         Returns:
             List of dictionaries with item information
         """
-        store_key = store_name.lower().strip()
+        scraper_class, store_key = cls.resolve_store(store_name)
         
-        # Try to find matching store
-        scraper_class = None
-        for key, scraper in cls.SUPPORTED_STORES.items():
-            if key in store_key or store_key in key:
-                scraper_class = scraper
-                break
+        if not scraper_class:
+            logger.warning(f"Unsupported store: {store_name}. Using fallback data.")
+            return cls._unsupported_store_deals()
+        
+        cache_key = (store_key, normalize_postal_prefix(postal_code))
+        deals = cls.deals_cache.get_or_load(
+            cache_key,
+            lambda: cls._scrape_deals(scraper_class, postal_code)
+        )
+        
+        # Hand out copies so callers can't mutate the shared cached entries
+        return [dict(deal) for deal in deals]
+    
+    @classmethod
+    async def get_weekly_deals_async(cls, store_name: str, postal_code: str) -> List[Dict[str, any]]:
+        """
+        Async version of get_weekly_deals - scrapes on the shared httpx client
+        instead of tying up a worker thread for the whole download.
+        """
+        scraper_class, store_key = cls.resolve_store(store_name)
         
         if not scraper_class:
             logger.warning(f"Unsupported store: {store_name}. Using fallback data.")
-            # Return generic fallback items
-            return [
-                {"name": "chicken breast", "price": 8.99, "is_on_sale": True},
-                {"name": "salmon", "price": 9.99, "is_on_sale": True},
-                {"name": "ground beef", "price": 5.99, "is_on_sale": True},
-                {"name": "broccoli", "price": 2.99, "is_on_sale": True},
-                {"name": "carrots", "price": 1.99, "is_on_sale": True},
-            ]
+            return cls._unsupported_store_deals()
         
-        # Scrape the store
-        scraper = scraper_class(postal_code)
-        items = scraper.scrape()
+        cache_key = (store_key, normalize_postal_prefix(postal_code))
+        deals = await cls.deals_cache.get_or_load_async(
+            cache_key,
+            lambda: cls._scrape_deals_async(scraper_class, postal_code)
+        )
+        
+        return [dict(deal) for deal in deals]
+    
+    @classmethod
+    async def get_multi_store_deals_async(
+        cls,
+        store_names: List[str],
+        postal_code: str,
+        deadline_seconds: Optional[float] = None,
+        fetch_deals: Optional[Callable[[str, str], Awaitable[List[Dict[str, Any]]]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Get deals for several stores at once, merged into one deal list
+        
+        Every store is fetched concurrently under a single deadline, so the
+        call costs the slowest store's latency rather than the sum. Stores
+        that miss the deadline or fail are reported and left out of the
+        merge; their scrapes keep running in the background so the cache is
+        warm for the next request.
+        
+        Args:
+            store_names: Store names as entered by the user (e.g. ['IGA', 'Metro'])
+            postal_code: Postal/ZIP code for location
+            deadline_seconds: Overall time budget (FLYER_MULTI_STORE_DEADLINE_SECONDS by default)
+            fetch_deals: Coroutine function (store_name, postal_code) -> deals;
+                defaults to get_weekly_deals_async
+            
+        Returns:
+            {"deals": merged deals, "stores": per-store status, "partial": bool}
+        """
+        if deadline_seconds is None:
+            deadline_seconds = FLYER_MULTI_STORE_DEADLINE_SECONDS
+        fetch_deals = fetch_deals or cls.get_weekly_deals_async
+        
+        # Resolve first so "IGA" and "iga extra" are only fetched once
+        stores: Dict[str, str] = {}
+        statuses: Dict[str, Dict[str, Any]] = {}
+        for store_name in store_names:
+            scraper_class, store_key = cls.resolve_store(store_name)
+            if not scraper_class:
+                logger.warning(f"Unsupported store in multi-store lookup: {store_name}")
+                statuses.setdefault(store_key, {"store": store_name, "status": "unsupported", "deal_count": 0})
+            elif store_key not in stores:
+                stores[store_key] = scraper_class.__name__.replace("Scraper", "")
+        
+        tasks = {
+            store_key: asyncio.create_task(fetch_deals(store_key, postal_code))
+            for store_key in stores
+        }
+        done, pending = (set(), set())
+        if tasks:
+            done, pending = await asyncio.wait(tasks.values(), timeout=deadline_seconds)
+        
+        store_deals: Dict[str, List[Dict[str, Any]]] = {}
+        for store_key, task in tasks.items():
+            display_name = stores[store_key]
+            if task in pending:
+                logger.warning(f"{display_name} flyer missed the {deadline_seconds}s deadline")
+                statuses[store_key] = {"store": display_name, "status": "timeout", "deal_count": 0}
+                _straggler_tasks.add(task)
+                task.add_done_callback(cls._discard_straggler)
+            elif task.exception() is not None:
+                logger.error(f"Error fetching {display_name} flyer: {task.exception()}")
+                statuses[store_key] = {"store": display_name, "status": "error", "deal_count": 0}
+            else:
+                store_deals[display_name] = task.result()
+                statuses[store_key] = {"store": display_name, "status": "ok", "deal_count": len(task.result())}
+        
+        return {
+            "deals": cls.merge_store_deals(store_deals),
+            "stores": list(statuses.values()),
+            "partial": any(status["status"] != "ok" for status in statuses.values())
+        }
+    
+    @staticmethod
+    def _discard_straggler(task: asyncio.Task):
+        _straggler_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Background flyer fetch failed: {task.exception()}")
+    
+    @staticmethod
+    def merge_store_deals(store_deals: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Merge per-store deal lists into one list with one entry per item
+        
+        Each merged deal keeps the lowest known price in "price", the store
+        offering it in "store", and every store's price in "prices"
+        (cheapest first, unknown prices last). A deal stays flagged
+        "other_region" only if every flyer listing it came from another region.
+        """
+        # name -> {store: best price seen in that store's flyer}
+        prices_by_name: Dict[str, Dict[str, Optional[float]]] = {}
+        regional_names = set()
+        
+        for store, deals in store_deals.items():
+            for deal in deals:
+                name = (deal.get("name") or "").lower().strip()
+                if not name:
+                    continue
+                if not deal.get("other_region"):
+                    regional_names.add(name)
+                store_prices = prices_by_name.setdefault(name, {})
+                price = deal.get("price")
+                current = store_prices.get(store)
+                if store not in store_prices or (price is not None and (current is None or price < current)):
+                    store_prices[store] = price
+        
+        merged = []
+        for name, store_prices in prices_by_name.items():
+            prices = sorted(
+                ({"store": store, "price": price} for store, price in store_prices.items()),
+                key=lambda p: (p["price"] is None, p["price"] or 0.0)
+            )
+            merged_deal = {
+                "name": name,
+                "price": prices[0]["price"],
+                "store": prices[0]["store"],
+                "is_on_sale": True,
+                "prices": prices
+            }
+            if name not in regional_names:
+                merged_deal["other_region"] = True
+            merged.append(merged_deal)
+        
+        return merged
+    
+    @classmethod
+    def resolve_store(cls, store_name: str) -> Tuple[Optional[type], str]:
+        """Find the scraper for a store name, returning (scraper_class, store_key)."""
+        store_key = store_name.lower().strip()
         
+        # Try to find matching store
+        for key, scraper in cls.SUPPORTED_STORES.items():
+            if key in store_key or store_key in key:
+                return scraper, key
+        return None, store_key
+    
+    @staticmethod
+    def _unsupported_store_deals() -> List[Dict[str, any]]:
+        # Return generic fallback items
+        return [
+            {"name": "chicken breast", "price": 8.99, "is_on_sale": True},
+            {"name": "salmon", "price": 9.99, "is_on_sale": True},
+            {"name": "ground beef", "price": 5.99, "is_on_sale": True},
+            {"name": "broccoli", "price": 2.99, "is_on_sale": True},
+            {"name": "carrots", "price": 1.99, "is_on_sale": True},
+        ]
+    
+    @staticmethod
+    def items_to_deals(items: List[FlyerItem]) -> List[Dict[str, Any]]:
         # Convert to dictionary format
         return [
             {
@@ -329,6 +920,19 @@ class FlyerScraperService:
             for item in items
         ]
     
+    @classmethod
+    def _scrape_deals(cls, scraper_class, postal_code: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """Scrape a store and return (deals, used_fallback)."""
+        scraper = scraper_class(postal_code)
+        deals = cls.items_to_deals(scraper.scrape())
+        return deals, scraper.used_fallback or not deals
+    
+    @classmethod
+    async def _scrape_deals_async(cls, scraper_class, postal_code: str) -> Tuple[List[Dict[str, Any]], bool]:
+        scraper = scraper_class(postal_code)
+        deals = cls.items_to_deals(await scraper.scrape_async())
+        return deals, scraper.used_fallback or not deals
+    
     @classmethod
     def match_ingredients_with_sales(cls, ingredients: List[str], sale_items: List[Dict]) -> Dict[str, bool]:
         """
@@ -341,26 +945,13 @@ class FlyerScraperService:
         Returns:
             Dictionary mapping ingredient names to sale status
         """
-        matches = {}
-        
-        for ingredient in ingredients:
-            ingredient_lower = ingredient.lower().strip()
-            is_on_sale = False
-            
-            # Check for matches
-            for sale_item in sale_items:
-                sale_name = sale_item['name'].lower().strip()
-                
-                # Direct match or partial match
-                if (sale_name in ingredient_lower or 
-                    ingredient_lower in sale_name or
-                    any(word in sale_name for word in ingredient_lower.split() if len(word) > 3)):
-                    is_on_sale = True
-                    break
-            
-            matches[ingredient] = is_on_sale
+        # Compile the sale names once, then match each ingredient in one pass
+        matcher = DealMatcher(sale_item['name'] for sale_item in sale_items)
         
-        return matches
+        return {
+            ingredient: matcher.match_loose(ingredient)
+            for ingredient in ingredients
+        }
 
 
 # Example usage
@@ -0,0 +1,806 @@
+"""
+OpenAI gateway for the Planea backend.
+
+Every chat completion goes through `LLMGateway.chat_completion`, tagged with
+the endpoint it serves; `LLMGateway.generate` constrains the answer to a
+pydantic model through OpenAI structured outputs and returns it validated.
+Endpoints that opt in get a content-addressed response cache: identical
+(model, messages, temperature, max_tokens, ...) requests are answered from
+memory (or the optional disk tier) instead of paying another OpenAI round
+trip. Calls that do go out are admitted by a process-wide scheduler that
+keeps us under our OpenAI rate limits, retried with backoff on transient
+errors, and short-circuited while OpenAI is down.
+"""
+
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple, Type, TypeVar
+
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+# Endpoints cached by default and their TTL in seconds. Only endpoints whose
+# output is acceptable to repeat for identical prompts are listed.
+DEFAULT_CACHE_TTLS = {
+    "recipe_from_title": 3600,
+    "meal_prep_concepts": 3600,
+    "chat": 600,
+    "kit_today_preparation": 24 * 3600,
+    "kit_weekly_reheating": 24 * 3600,
+    "kit_cooking_phases": 24 * 3600,
+}
+
+
+# Scheduling priority per endpoint (lower runs first). Interactive chat goes
+# ahead of single recipes, which go ahead of bulk plan / kit generation.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+PRIORITY_BULK = 2
+
+ENDPOINT_PRIORITIES = {
+    "chat": PRIORITY_INTERACTIVE,
+    "chat_modification": PRIORITY_INTERACTIVE,
+    "recipe": PRIORITY_STANDARD,
+    "recipe_from_title": PRIORITY_STANDARD,
+    "recipe_from_image": PRIORITY_STANDARD,
+    "plan_recipe": PRIORITY_BULK,
+    "meal_prep_blueprint": PRIORITY_BULK,
+    "meal_prep_concepts": PRIORITY_BULK,
+    "kit_today_preparation": PRIORITY_BULK,
+    "kit_weekly_reheating": PRIORITY_BULK,
+    "kit_cooking_phases": PRIORITY_BULK,
+}
+
+# Who the current API request is for; set per request so outbound calls are
+# queued fairly between users
+llm_user: contextvars.ContextVar[str] = contextvars.ContextVar("llm_user", default="anonymous")
+
+# Rough token cost of an image part in a vision request
+IMAGE_TOKEN_ESTIMATE = 1000
+
+
+def estimate_tokens(request: Dict[str, Any]) -> int:
+    """Upper-bound token estimate for a completion request (prompt + max_tokens)."""
+    prompt_chars = 0
+    images = 0
+    for message in request.get("messages", []):
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            prompt_chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    prompt_chars += len(part.get("text", ""))
+                else:
+                    images += 1
+    # ~4 characters per token for English/French prose
+    return prompt_chars // 4 + images * IMAGE_TOKEN_ESTIMATE + int(request.get("max_tokens") or 1000)
+
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units."""
+    
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = per_minute
+        self.updated_at = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def seconds_until(self, amount: float) -> float:
+        """0 if `amount` can be taken now, else how long until it can."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+    
+    def take(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+    
+    def give_back(self, amount: float):
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class _Waiter:
+    __slots__ = ("future", "user", "priority", "tokens", "enqueued_at")
+    
+    def __init__(self, future: asyncio.Future, user: str, priority: int, tokens: int):
+        self.future = future
+        self.user = user
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundScheduler:
+    """Admission control for outbound OpenAI calls.
+    
+    A call may start when a concurrency slot is free and both the
+    requests-per-minute and tokens-per-minute buckets can pay for it.
+    Waiting calls are served by priority, then round-robin between users so
+    one user's 21-slot plan can't starve everybody else's.
+    """
+    
+    def __init__(self, max_concurrency: int = 16, requests_per_minute: float = 500, tokens_per_minute: float = 150000):
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        # priority -> user -> FIFO of waiters; dict order is the round-robin order
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        self._in_flight = 0
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+        self._recent_waits: Deque[float] = deque(maxlen=500)
+        self.admitted = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+    
+    @classmethod
+    def from_env(cls) -> "OutboundScheduler":
+        """Build a scheduler configured from OPENAI_* environment variables."""
+        return cls(
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+            requests_per_minute=float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500")),
+            tokens_per_minute=float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "150000"))
+        )
+    
+    async def acquire(self, user: str, priority: int, tokens: int):
+        """Wait until a call estimated at `tokens` may start."""
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), user, priority, tokens)
+        self._queues.setdefault(priority, OrderedDict()).setdefault(user, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as we were cancelled: hand the slot back
+                self.release(tokens, tokens)
+            else:
+                self._remove(waiter)
+            raise
+    
+    def release(self, estimated_tokens: int, actual_tokens: Optional[int] = None):
+        """Free the call's slot and settle the token estimate against actual usage."""
+        self._in_flight -= 1
+        if actual_tokens is not None and actual_tokens < estimated_tokens:
+            self.token_bucket.give_back(estimated_tokens - actual_tokens)
+        elif actual_tokens is not None and actual_tokens > estimated_tokens:
+            self.token_bucket.take(actual_tokens - estimated_tokens)
+        self._dispatch()
+    
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return users[next(iter(users))][0]
+        return None
+    
+    def _pop(self, waiter: _Waiter):
+        users = self._queues[waiter.priority]
+        queue = users.pop(waiter.user)
+        queue.popleft()
+        if queue:
+            users[waiter.user] = queue  # Back of the round-robin order
+    
+    def _remove(self, waiter: _Waiter):
+        users = self._queues.get(waiter.priority, {})
+        queue = users.get(waiter.user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del users[waiter.user]
+        self._dispatch()
+    
+    def _dispatch(self):
+        if self._wake_handle is not None:
+            self._wake_handle.cancel()
+            self._wake_handle = None
+        
+        while self._in_flight < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            delay = max(self.request_bucket.seconds_until(1), self.token_bucket.seconds_until(waiter.tokens))
+            if delay > 0:
+                # Over budget: try again once the buckets have refilled enough
+                self._wake_handle = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            
+            self._pop(waiter)
+            self.request_bucket.take(1)
+            self.token_bucket.take(waiter.tokens)
+            self._in_flight += 1
+            
+            waited = time.monotonic() - waiter.enqueued_at
+            self.admitted += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self._recent_waits.append(waited)
+            waiter.future.set_result(None)
+    
+    def stats(self) -> Dict[str, Any]:
+        depth_by_priority = {
+            priority: sum(len(queue) for queue in users.values())
+            for priority, users in sorted(self._queues.items())
+        }
+        recent = sorted(self._recent_waits)
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": sum(depth_by_priority.values()),
+            "queue_depth_by_priority": depth_by_priority,
+            "queued_users": len({user for users in self._queues.values() for user in users}),
+            "admitted": self.admitted,
+            "avg_wait_ms": round(1000 * self.total_wait_seconds / self.admitted, 1) if self.admitted else 0.0,
+            "p95_wait_ms": round(1000 * recent[int(0.95 * (len(recent) - 1))], 1) if recent else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait_seconds, 1),
+            "requests_available": int(self.request_bucket.available),
+            "tokens_available": int(self.token_bucket.available)
+        }
+
+
+class LLMUnavailableError(Exception):
+    """Raised without calling OpenAI while the circuit breaker is open."""
+    
+    def __init__(self, retry_after_seconds: float):
+        super().__init__(f"OpenAI is temporarily unavailable, retry in {retry_after_seconds:.0f}s")
+        self.retry_after_seconds = retry_after_seconds
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Rate limits, 5xx, timeouts and connection drops are worth retrying."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-requested delay from Retry-After / retry-after-ms, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None  # HTTP-date form: fall back to our own backoff
+    return None
+
+
+class CircuitBreaker:
+    """Fails fast after `failure_threshold` consecutive upstream failures.
+    
+    Only outages count (5xx, timeouts, connection errors); 429 rate limits
+    are retried after a backoff without affecting the breaker.
+    
+    Once open, calls are rejected for `cooldown_seconds`; then a single probe
+    call is let through (half-open) and its outcome closes or re-opens the
+    circuit.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.times_opened = 0
+        self._probe_in_flight = False
+    
+    def before_call(self):
+        """Raise LLMUnavailableError if the call must not go out."""
+        if self.state == self.CLOSED:
+            return
+        remaining = self.opened_at + self.cooldown_seconds - time.monotonic()
+        if self.state == self.OPEN and remaining <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        raise LLMUnavailableError(max(remaining, 1.0))
+    
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        self.consecutive_failures += 1
+        was_probe = self._probe_in_flight
+        self._probe_in_flight = False
+        if was_probe or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+            if self.state != self.OPEN:
+                logger.warning(f"OpenAI circuit opened after {self.consecutive_failures} consecutive failures")
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+    
+    def record_neutral(self):
+        """The call ended without telling us anything about upstream health."""
+        self._probe_in_flight = False
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+
+def parse_cache_ttls(value: Optional[str]) -> Dict[str, float]:
+    """Parse "endpoint=ttl_seconds,..." (e.g. "chat=600,recipe_from_title=3600").
+    
+    An empty string disables caching for every endpoint; None keeps the defaults.
+    """
+    if value is None:
+        return dict(DEFAULT_CACHE_TTLS)
+    ttls = {}
+    for part in value.split(","):
+        endpoint, _, ttl = part.strip().partition("=")
+        if not endpoint:
+            continue
+        try:
+            ttls[endpoint] = float(ttl)
+        except ValueError:
+            logger.warning(f"Ignoring invalid LLM cache TTL for '{endpoint}': {ttl!r}")
+    return ttls
+
+
+class LLMResponseCache:
+    """TTL + LRU cache of chat completions keyed by a hash of the request.
+    
+    The memory tier is bounded to `max_entries`. When `disk_dir` is set,
+    entries are also written there as JSON so they survive restarts and
+    are shared by workers on the same machine.
+    """
+    
+    def __init__(self, max_entries: int = 512, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Tuple[float, ChatCompletion]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(**request: Any) -> str:
+        """Content address of a completion request (model, messages, temperature, max_tokens, ...)."""
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        """Memory-tier lookup; returns None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+    
+    async def get_async(self, key: str) -> Optional[ChatCompletion]:
+        """Memory lookup, then the disk tier (promoting disk hits to memory)."""
+        response = self.get(key)
+        if response is not None:
+            return response
+        
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None:
+                expires_at, response = entry
+                self._store_memory(key, response, expires_at)
+                with self._lock:
+                    self.disk_hits += 1
+                return response
+        
+        self._count_miss()
+        return None
+    
+    async def set_async(self, key: str, response: ChatCompletion, ttl_seconds: float):
+        expires_at = time.time() + ttl_seconds
+        self._store_memory(key, response, expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, response, expires_at)
+    
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+    
+    def _store_memory(self, key: str, response: ChatCompletion, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+    
+    def _read_disk(self, key: str) -> Optional[Tuple[float, ChatCompletion]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["expires_at"] <= time.time():
+                os.remove(path)
+                return None
+            return data["expires_at"], ChatCompletion.model_validate(data["response"])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable LLM cache entry {key}: {e}")
+            return None
+    
+    def _write_disk(self, key: str, response: ChatCompletion, expires_at: float):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "response": response.model_dump(mode="json")}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write LLM cache entry {key}: {e}")
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_tier": bool(self.disk_dir)
+            }
+
+
+StructuredModel = TypeVar("StructuredModel", bound=BaseModel)
+
+
+class StructuredOutputError(ValueError):
+    """OpenAI refused, or its answer was cut off before the object was complete."""
+
+
+def strict_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """JSON schema of `model` in the subset accepted by OpenAI's strict mode.
+    
+    Every property is required (optional fields are nullable instead), no
+    additional properties are allowed, and defaults / titles are dropped.
+    """
+    return _strict_schema_node(model.model_json_schema())
+
+
+def _strict_schema_node(node: Any) -> Any:
+    if isinstance(node, list):
+        return [_strict_schema_node(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    strict = {}
+    for key, value in node.items():
+        if key in ("default", "title"):
+            continue
+        if key in ("properties", "$defs"):
+            strict[key] = {name: _strict_schema_node(sub) for name, sub in value.items()}
+        else:
+            strict[key] = _strict_schema_node(value)
+    if strict.get("type") == "object":
+        strict["additionalProperties"] = False
+        strict["required"] = list(strict.get("properties", {}))
+    return strict
+
+
+@functools.lru_cache(maxsize=None)
+def structured_response_format(model: Type[BaseModel]) -> Dict[str, Any]:
+    """`response_format` that makes OpenAI answer with a `model` instance."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "strict": True,
+            "schema": strict_json_schema(model)
+        }
+    }
+
+
+def parse_structured_output(response: ChatCompletion, model: Type[StructuredModel]) -> StructuredModel:
+    """Validate a structured-output completion as `model` in one step."""
+    choice = response.choices[0]
+    if choice.message.refusal:
+        raise StructuredOutputError(f"OpenAI refused to answer: {choice.message.refusal}")
+    if choice.finish_reason == "length":
+        raise StructuredOutputError("Answer truncated by max_tokens")
+    try:
+        return model.model_validate_json(choice.message.content or "")
+    except ValidationError as e:
+        raise StructuredOutputError(f"Answer does not match {model.__name__}: {e}") from e
+
+
+class LLMGateway:
+    """Single entry point for outbound chat completions."""
+    
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        cache: Optional[LLMResponseCache] = None,
+        cache_ttls: Optional[Dict[str, float]] = None,
+        scheduler: Optional[OutboundScheduler] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = 3,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 20.0
+    ):
+        self.client = client
+        self.cache = cache or LLMResponseCache()
+        self.cache_ttls = DEFAULT_CACHE_TTLS if cache_ttls is None else cache_ttls
+        self.scheduler = scheduler or OutboundScheduler()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.retries = 0
+        # Input tokens sent, and how many of them OpenAI served from its prompt cache
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+    
+    @classmethod
+    def from_env(cls, client: AsyncOpenAI) -> "LLMGateway":
+        """Build a gateway configured from LLM_CACHE_* and OPENAI_* environment variables.
+        
+        The client should be created with max_retries=0: retries are handled
+        here so they respect the scheduler and the circuit breaker.
+        """
+        cache = LLMResponseCache(
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+            disk_dir=os.getenv("LLM_CACHE_DIR") or None
+        )
+        return cls(
+            client,
+            cache=cache,
+            cache_ttls=parse_cache_ttls(os.getenv("LLM_CACHE_ENDPOINTS")),
+            scheduler=OutboundScheduler.from_env(),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("OPENAI_BREAKER_FAILURE_THRESHOLD", "5")),
+                cooldown_seconds=float(os.getenv("OPENAI_BREAKER_COOLDOWN_SECONDS", "30"))
+            ),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+        )
+    
+    async def chat_completion(self, endpoint: str, **request: Any) -> ChatCompletion:
+        """Create a chat completion for `endpoint`, served from cache when it opted in.
+        
+        Takes the same keyword arguments as `client.chat.completions.create`.
+        """
+        ttl_seconds = self.cache_ttls.get(endpoint, 0)
+        if ttl_seconds <= 0:
+            return await self._create(endpoint, request)
+        
+        key = self.cache.make_key(**request)
+        cached = await self.cache.get_async(key)
+        if cached is not None:
+            logger.info(f"LLM cache hit for {endpoint}")
+            return cached
+        
+        response = await self._create(endpoint, request)
+        # Don't pin truncated or filtered answers for the whole TTL
+        if response.choices and response.choices[0].finish_reason == "stop":
+            await self.cache.set_async(key, response, ttl_seconds)
+        return response
+    
+    async def generate(self, endpoint: str, response_model: Type[StructuredModel], **request: Any) -> StructuredModel:
+        """Chat completion constrained to the JSON schema of `response_model`, returned validated.
+        
+        Raises StructuredOutputError if OpenAI refuses or runs out of tokens.
+        """
+        response = await self.chat_completion(
+            endpoint,
+            response_format=structured_response_format(response_model),
+            **request
+        )
+        return parse_structured_output(response, response_model)
+    
+    async def _create(self, endpoint: str, request: Dict[str, Any]) -> ChatCompletion:
+        """Send a request to OpenAI, retrying transient failures with jittered backoff."""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = await self._send(endpoint, request)
+            except asyncio.CancelledError:
+                self.breaker.record_neutral()
+                raise
+            except Exception as e:
+                delay = self._retry_delay(endpoint, attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return response
+    
+    async def chat_completion_stream(self, endpoint: str, **request: Any) -> AsyncIterator[str]:
+        """Stream the text of a chat completion as it is generated.
+        
+        Same scheduling, retries and breaker as `chat_completion`; a failed
+        attempt is only retried if nothing has been streamed yet. Cached
+        answers arrive as a single chunk, and completed streams are cached
+        for endpoints that opted in.
+        """
+        ttl_seconds = self.cache_ttls.get(endpoint, 0)
+        key = None
+        if ttl_seconds > 0:
+            key = self.cache.make_key(**request)
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                logger.info(f"LLM cache hit for {endpoint}")
+                yield cached.choices[0].message.content or ""
+                return
+        
+        parts: List[str] = []
+        finish_reason = None
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            estimated_tokens = estimate_tokens(request)
+            try:
+                await self.scheduler.acquire(
+                    llm_user.get(),
+                    ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_STANDARD),
+                    estimated_tokens
+                )
+            except asyncio.CancelledError:
+                # Give back the half-open probe slot if we held it while queued
+                self.breaker.record_neutral()
+                raise
+            actual_tokens = None
+            stream = None
+            try:
+                stream = await self.client.chat.completions.create(
+                    **request,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        actual_tokens = chunk.usage.total_tokens
+                        self._record_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    finish_reason = choice.finish_reason or finish_reason
+                    if choice.delta and choice.delta.content:
+                        parts.append(choice.delta.content)
+                        yield choice.delta.content
+            except Exception as e:
+                delay = None if parts else self._retry_delay(endpoint, attempt, e)
+                if delay is None:
+                    if parts:
+                        self.breaker.record_neutral()
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled, or the consumer stopped reading: drop the
+                # connection so OpenAI stops generating the rest
+                self.breaker.record_neutral()
+                if stream is not None:
+                    await stream.close()
+                raise
+            finally:
+                self.scheduler.release(estimated_tokens, actual_tokens)
+            self.breaker.record_success()
+            break
+        
+        if key is not None and finish_reason == "stop":
+            await self.cache.set_async(key, ChatCompletion.model_validate({
+                "id": f"stream-{key[:16]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", ""),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": finish_reason,
+                    "message": {"role": "assistant", "content": "".join(parts)}
+                }]
+            }), ttl_seconds)
+    
+    def _record_usage(self, usage: Any):
+        self.prompt_tokens += usage.prompt_tokens
+        details = usage.prompt_tokens_details
+        if details is not None and details.cached_tokens:
+            self.cached_prompt_tokens += details.cached_tokens
+    
+    def prompt_cache_stats(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "cached_ratio": round(self.cached_prompt_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0
+        }
+    
+    def _retry_delay(self, endpoint: str, attempt: int, error: Exception) -> Optional[float]:
+        """Record a failed attempt; return how long to wait before retrying, or None to give up."""
+        if not is_transient_error(error):
+            self.breaker.record_neutral()
+            return None
+        if isinstance(error, openai.RateLimitError):
+            # Throttling, not an outage: back off (honouring Retry-After) and
+            # retry without counting it toward the breaker
+            self.breaker.record_neutral()
+        else:
+            self.breaker.record_failure()
+        # If the breaker opened meanwhile, the retry is rejected by
+        # before_call() unless the cooldown is over by then
+        if attempt >= self.max_retries:
+            return None
+        delay = self._backoff_delay(attempt, error)
+        self.retries += 1
+        logger.warning(f"OpenAI {endpoint} call failed ({type(error).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+    
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.backoff_max_seconds * 3))
+        return delay
+    
+    async def _send(self, endpoint: str, request: Dict[str, Any]) -> ChatCompletion:
+        """Send one request to OpenAI once the scheduler admits it."""
+        estimated_tokens = estimate_tokens(request)
+        await self.scheduler.acquire(
+            llm_user.get(),
+            ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_STANDARD),
+            estimated_tokens
+        )
+        actual_tokens = None
+        try:
+            response = await self.client.chat.completions.create(**request)
+            if response.usage is not None:
+                actual_tokens = response.usage.total_tokens
+                self._record_usage(response.usage)
+            return response
+        finally:
+            self.scheduler.release(estimated_tokens, actual_tokens)
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
+from typing import Any, Callable, List, Literal, Optional
 from datetime import date, datetime
 import os
 import uuid
@@ -9,8 +9,21 @@ from dotenv import load_dotenv
 from openai import AsyncOpenAI
 import json
 import asyncio
+import contextvars
 import random
-from flyer_scraper import FlyerScraperService
+from flyer_scraper import FlyerScraperService, GroceryStoreScraper, close_async_client, split_store_names
+from flyer_refresher import FlyerRefreshScheduler
+from deal_matcher import DealMatcher
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailableError, llm_user, structured_response_format
+from request_coalescing import InFlightRequests, coalesce_requests
+from recipe_stream import IncrementalJSONObjectParser, MalformedJSONStreamError
+from chat_intents import ChatIntents, intent_engine
+from recipe_index import RecipeTitleIndex
+from conversation_store import ConversationSession, conversation_store_from_env
+from chat_memory import ChatMemoryPolicy
+from prompt_templates import ADAPTIVE_STORAGE_RULES, COMPLEXITY_RULES, MEAL_PREP_RULES, prompt_language, recipe_prompts
+from functools import lru_cache
+from contextlib import aclosing, asynccontextmanager
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -23,7 +36,17 @@ load_dotenv()
 # Initialize rate limiter
 limiter = Limiter(key_func=get_remote_address)
 
-app = FastAPI(title="Planea AI Server", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep flyer deals warm in the background so requests never scrape inline
+    if os.getenv("FLYER_REFRESH_ENABLED", "true").lower() == "true":
+        await flyer_refresher.start()
+    yield
+    await flyer_refresher.stop()
+    # Release pooled flyer scraping connections
+    await close_async_client()
+
+app = FastAPI(title="Planea AI Server", version="1.0.0", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -54,6 +77,9 @@ async def validate_client_and_add_security_headers(request: Request, call_next):
             content={"detail": "Unauthorized client. Please use the official Planea app."}
         )
     
+    # Outbound OpenAI calls made for this request are queued fairly per client
+    llm_user.set(get_remote_address(request))
+    
     response = await call_next(request)
     
     # Add security headers
@@ -78,11 +104,41 @@ if not VALID_DEV_CODES:
 
 
 # Initialize OpenAI client (async for parallel processing)
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Retries are done by the gateway below (backoff + circuit breaker), not the SDK
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+# Every completion goes through the gateway (response cache for opted-in
+# endpoints, rate-limit aware scheduling for everything that reaches OpenAI)
+llm = LLMGateway.from_env(client)
+
+# Duplicate generations (client retries while the first attempt still runs) share one result
+in_flight_requests = InFlightRequests(result_ttl_seconds=float(os.getenv("IDEMPOTENT_RESULT_TTL_SECONDS", "120")))
+
+# Rounds of generation per plan slot; later rounds only retry the failed slots
+PLAN_SLOT_ATTEMPTS = int(os.getenv("PLAN_SLOT_ATTEMPTS", "2"))
+
+# Max meal prep kit sections (today prep / weekly reheating) generated at once per plan
+MEAL_PREP_KIT_CONCURRENCY = int(os.getenv("MEAL_PREP_KIT_CONCURRENCY", "4"))
+
+# Per-phase time limits (seconds) for meal prep kit sections; a phase that runs
+# over falls back to its empty structure without affecting the others
+KIT_PHASE_TIMEOUTS = {
+    "cooking_phases": float(os.getenv("KIT_COOKING_PHASES_TIMEOUT_SECONDS", "60")),
+    "today_preparation": float(os.getenv("KIT_TODAY_PREPARATION_TIMEOUT_SECONDS", "60")),
+    "weekly_reheating": float(os.getenv("KIT_WEEKLY_REHEATING_TIMEOUT_SECONDS", "45")),
+}
 
 # Initialize flyer scraper service
 flyer_scraper = FlyerScraperService()
 
+# Background flyer refresher (warm deals snapshot, started with the app)
+flyer_refresher = FlyerRefreshScheduler.from_env()
+
+# Chat sessions: history and user context kept server-side by conversation id
+chat_sessions = conversation_store_from_env()
+# Chat prompt budgets: verbatim history, running summary and per-mode token caps
+chat_memory = ChatMemoryPolicy.from_env()
+
 # Translation dictionary for ingredients (EN <-> FR)
 INGREDIENT_TRANSLATIONS = {
     # Proteins (EN -> FR)
@@ -188,6 +244,8 @@ class PlanRequest(BaseModel):
     constraints: dict = Field(default_factory=dict)
     language: str = "fr"
     preferences: dict = Field(default_factory=dict)
+    # Return the recipes that succeeded plus `failed_slots` instead of failing the whole plan
+    allow_partial: bool = False
 
 class Ingredient(BaseModel):
     name: str
@@ -216,6 +274,37 @@ class Recipe(BaseModel):
     is_freezable: Optional[bool] = None
     storage_note: Optional[str] = None
 
+# Shape OpenAI is asked to produce for a recipe (structured outputs). Deal
+# and meal prep properties are filled in by the server afterwards.
+class GeneratedIngredient(BaseModel):
+    name: str
+    quantity: float
+    unit: str
+    category: str
+
+class GeneratedRecipe(BaseModel):
+    title: str
+    servings: int
+    total_minutes: int
+    ingredients: List[GeneratedIngredient]
+    steps: List[str]
+    equipment: List[str]
+    tags: List[str]
+    calories_per_serving: Optional[int]
+    protein_per_serving: Optional[int]
+    carbs_per_serving: Optional[int]
+    fat_per_serving: Optional[int]
+    
+    def to_recipe(self, language: str) -> Recipe:
+        """Build the API recipe, filling blank units and categories."""
+        recipe = Recipe(**self.model_dump())
+        for ingredient in recipe.ingredients:
+            if not ingredient.unit:
+                ingredient.unit = "unité" if language == "fr" else "unit"
+            if not ingredient.category:
+                ingredient.category = "autre" if language == "fr" else "other"
+        return recipe
+
 class PlanItem(BaseModel):
     weekday: Weekday
     meal_type: MealType
@@ -223,9 +312,19 @@ class PlanItem(BaseModel):
     is_meal_prep: bool = False
     meal_prep_group_id: Optional[str] = None
 
+class PlanSlotFailure(BaseModel):
+    slot_index: int  # Position in PlanRequest.slots
+    weekday: Weekday
+    meal_type: MealType
+    is_meal_prep: bool = False
+    meal_prep_group_id: Optional[str] = None
+    error: str
+    status_code: int = 500
+
 class PlanResponse(BaseModel):
     items: List[PlanItem]
     meal_prep_kits: Optional[List[dict]] = None  # NEW: Include meal prep preparation data
+    failed_slots: List[PlanSlotFailure] = Field(default_factory=list)  # Only with allow_partial
 
 class RecipeRequest(BaseModel):
     idea: str
@@ -236,162 +335,190 @@ class RecipeRequest(BaseModel):
     preferences: dict = Field(default_factory=dict)
 
 
-async def mark_ingredients_on_sale(recipe: Recipe, preferences: dict) -> Recipe:
-    """Mark ingredients that are on sale based on weekly flyers."""
+# Fallback deals used when the flyer scrape comes back empty
+FALLBACK_SALE_DEALS = [
+    {"name": "poulet", "price": 8.99, "is_on_sale": True},
+    {"name": "chicken", "price": 8.99, "is_on_sale": True},
+    {"name": "saumon", "price": 9.99, "is_on_sale": True},
+    {"name": "salmon", "price": 9.99, "is_on_sale": True},
+    {"name": "boeuf haché", "price": 5.99, "is_on_sale": True},
+    {"name": "ground beef", "price": 5.99, "is_on_sale": True},
+    {"name": "porc", "price": 6.99, "is_on_sale": True},
+    {"name": "pork", "price": 6.99, "is_on_sale": True},
+    {"name": "brocoli", "price": 2.99, "is_on_sale": True},
+    {"name": "broccoli", "price": 2.99, "is_on_sale": True},
+    {"name": "carottes", "price": 1.99, "is_on_sale": True},
+    {"name": "carrots", "price": 1.99, "is_on_sale": True},
+    {"name": "tomates", "price": 3.49, "is_on_sale": True},
+    {"name": "tomatoes", "price": 3.49, "is_on_sale": True},
+    {"name": "pommes de terre", "price": 4.99, "is_on_sale": True},
+    {"name": "potatoes", "price": 4.99, "is_on_sale": True},
+    {"name": "oignons", "price": 2.49, "is_on_sale": True},
+    {"name": "onions", "price": 2.49, "is_on_sale": True},
+    {"name": "poivrons", "price": 3.99, "is_on_sale": True},
+    {"name": "peppers", "price": 3.99, "is_on_sale": True},
+]
+
+# Words to ignore when matching (qualifiers, descriptors)
+SALE_MATCH_IGNORE_WORDS = {
+    # French
+    'frais', 'fraîche', 'fraîches', 'surgelé', 'surgelés', 'surgelée', 'surgelées',
+    'congelé', 'congelés', 'congelée', 'congelées', 'décortiqué', 'décortiqués', 
+    'décortiquée', 'décortiquées', 'épluché', 'épluchés', 'épluchée', 'épluchées',
+    'coupé', 'coupés', 'coupée', 'coupées', 'tranché', 'tranchés', 'tranchée', 'tranchées',
+    'haché', 'hachés', 'hachée', 'hachées', 'émincé', 'émincés', 'émincée', 'émincées',
+    'bio', 'biologique', 'biologiques', 'local', 'locaux', 'locale', 'locales',
+    'extra', 'gros', 'grosse', 'grosses', 'petit', 'petits', 'petite', 'petites',
+    'jeune', 'jeunes', 'entier', 'entiers', 'entière', 'entières', 'blanc', 'blancs', 'blanche', 'blanches',
+    # English
+    'fresh', 'frozen', 'peeled', 'deveined', 'shelled', 'cleaned', 'trimmed',
+    'chopped', 'diced', 'sliced', 'minced', 'shredded', 'grated',
+    'organic', 'local', 'extra', 'large', 'small', 'medium', 'whole', 'boneless', 'skinless'
+}
+
+
+@lru_cache(maxsize=64)
+def get_deal_matcher(deal_names: tuple) -> DealMatcher:
+    """Compiled matcher for a deal snapshot, shared by every request that sees the same deals."""
+    return DealMatcher(deal_names, INGREDIENT_TRANSLATIONS, SALE_MATCH_IGNORE_WORDS)
+
+
+class FlyerDealContext:
+    """Flyer deals fetched once per request and shared by every recipe marked in it.
     
-    print(f"\n🔍 DEBUG - mark_ingredients_on_sale called")
-    print(f"  Preferences received: {preferences}")
+    Holds the raw deals (for prompts) and the compiled deal matcher with
+    EN <-> FR translations (for on-sale matching), so a plan scrapes and
+    normalizes the flyer exactly once no matter how many recipes it has.
+    """
+    
+    def __init__(self, store_name: str, postal_code: str, deals: List[dict]):
+        self.store_name = store_name
+        self.postal_code = postal_code
+        self.deals = deals
+        self.matcher = get_deal_matcher(tuple(
+            deal.get('name', '') if isinstance(deal, dict) else str(deal)
+            for deal in deals
+        ))
+        print(f"\n📦 {len(deals)} deals → {len(self.matcher)} match terms (with translations)")
+    
+    @property
+    def deal_names(self) -> List[str]:
+        names = []
+        for deal in self.deals:
+            deal_name = deal.get('name', '') if isinstance(deal, dict) else str(deal)
+            if deal_name:
+                names.append(deal_name)
+        return names
+    
+    def mark_recipe(self, recipe: Recipe) -> Recipe:
+        """Mark the ingredients of a single recipe that match a deal."""
+        for ingredient in recipe.ingredients:
+            matched = self.matcher.match(ingredient.name)
+            if matched is not None:
+                ingredient.is_on_sale = True
+                print(f"  ✓ Marked '{ingredient.name}' as ON SALE (matched '{matched}')")
+        
+        return recipe
+    
+    def mark_recipes(self, recipes: List[Recipe]) -> List[Recipe]:
+        """Mark every recipe of a plan in one pass over the shared deal matcher."""
+        for recipe in recipes:
+            self.mark_recipe(recipe)
+        return recipes
+
+
+async def fetch_flyer_deal_context(preferences: dict) -> Optional[FlyerDealContext]:
+    """Scrape the user's flyer once and build the shared deal context.
+    
+    Returns None when weekly flyers are disabled, the store or postal code
+    is missing, or the scrape fails, so callers can skip sale marking.
+    """
     
     # Check if flyer deals feature is enabled
     if not preferences or not preferences.get("useWeeklyFlyers"):
         print(f"  ❌ Weekly flyers NOT enabled (useWeeklyFlyers={preferences.get('useWeeklyFlyers') if preferences else 'None'})")
-        return recipe
+        return None
     
     print(f"  ✅ Weekly flyers enabled!")
     
     # Get postal code and store
     postal_code = preferences.get("postalCode")
     store_name = preferences.get("preferredGroceryStore")
+    # Users who shop at several chains can list them ("IGA, Metro") or send a list
+    store_names = split_store_names(preferences.get("preferredGroceryStores") or store_name)
     
     print(f"  📍 Postal code: {postal_code}")
-    print(f"  🏪 Store: {store_name}")
+    print(f"  🏪 Store: {', '.join(store_names) or store_name}")
     
-    if not postal_code or not store_name:
+    if not postal_code or not store_names:
         print("  ❌ Flyer deals requested but postal code or store not provided")
-        return recipe
+        return None
     
     try:
         # Fetch weekly deals
-        print(f"Fetching deals for {store_name} at {postal_code}...")
-        deals = await asyncio.to_thread(
-            flyer_scraper.get_weekly_deals,
-            store_name=store_name,
-            postal_code=postal_code
-        )
+        print(f"Fetching deals for {', '.join(store_names)} at {postal_code}...")
+        if len(store_names) > 1:
+            result = await flyer_refresher.get_multi_store_deals(store_names, postal_code)
+            for status in result["stores"]:
+                print(f"  🏪 {status['store']}: {status['status']} ({status['deal_count']} deals)")
+            deals = result["deals"]
+            store_name = ", ".join(store_names)
+        else:
+            store_name = store_names[0]
+            deals = await flyer_refresher.get_deals(
+                store_name=store_name,
+                postal_code=postal_code
+            )
+        
+        # A flyer borrowed from another postal region may not apply here:
+        # use it for nothing rather than mark its items on sale
+        regional_deals = [deal for deal in deals if not (isinstance(deal, dict) and deal.get("other_region"))]
+        if deals and not regional_deals:
+            print(f"  ⚠️ Only another region's flyer is known for {store_name} at {postal_code} yet, not marking deals")
+            return None
+        deals = regional_deals
         
         if not deals:
             print(f"⚠️ No deals found for {store_name} via scraping, using fallback data...")
             # Use fallback data - common items typically on sale
-            deals = [
-                {"name": "poulet", "price": 8.99, "is_on_sale": True},
-                {"name": "chicken", "price": 8.99, "is_on_sale": True},
-                {"name": "saumon", "price": 9.99, "is_on_sale": True},
-                {"name": "salmon", "price": 9.99, "is_on_sale": True},
-                {"name": "boeuf haché", "price": 5.99, "is_on_sale": True},
-                {"name": "ground beef", "price": 5.99, "is_on_sale": True},
-                {"name": "porc", "price": 6.99, "is_on_sale": True},
-                {"name": "pork", "price": 6.99, "is_on_sale": True},
-                {"name": "brocoli", "price": 2.99, "is_on_sale": True},
-                {"name": "broccoli", "price": 2.99, "is_on_sale": True},
-                {"name": "carottes", "price": 1.99, "is_on_sale": True},
-                {"name": "carrots", "price": 1.99, "is_on_sale": True},
-                {"name": "tomates", "price": 3.49, "is_on_sale": True},
-                {"name": "tomatoes", "price": 3.49, "is_on_sale": True},
-                {"name": "pommes de terre", "price": 4.99, "is_on_sale": True},
-                {"name": "potatoes", "price": 4.99, "is_on_sale": True},
-                {"name": "oignons", "price": 2.49, "is_on_sale": True},
-                {"name": "onions", "price": 2.49, "is_on_sale": True},
-                {"name": "poivrons", "price": 3.99, "is_on_sale": True},
-                {"name": "peppers", "price": 3.99, "is_on_sale": True},
-            ]
+            deals = FALLBACK_SALE_DEALS
             print(f"✅ Using {len(deals)} fallback deals for testing")
         
         print(f"Found {len(deals)} deals")
-        
-        # Normalize deals for comparison with translation support
-        normalized_deals = set()
-        print(f"\n📦 Deals found (with translations):")
-        for deal in deals:
-            # Extract the name from the deal dictionary
-            deal_name = deal.get('name', '') if isinstance(deal, dict) else str(deal)
-            normalized = deal_name.lower().strip()
-            normalized_deals.add(normalized)
-            
-            # Add translation (EN <-> FR)
-            translation = translate_ingredient(normalized, "fr")
-            if translation != normalized:
-                normalized_deals.add(translation)
-                print(f"  - {deal_name} → {translation}")
-            else:
-                translation = translate_ingredient(normalized, "en")
-                if translation != normalized:
-                    normalized_deals.add(translation)
-                    print(f"  - {deal_name} → {translation}")
-                else:
-                    print(f"  - {deal_name}")
-            
-            # Also add individual words for partial matching
-            for word in normalized.split():
-                if len(word) > 3:  # Only words longer than 3 chars
-                    normalized_deals.add(word)
-                    word_translation = translate_ingredient(word, "fr")
-                    if word_translation != word:
-                        normalized_deals.add(word_translation)
-                    else:
-                        word_translation = translate_ingredient(word, "en")
-                        if word_translation != word:
-                            normalized_deals.add(word_translation)
-        
-        print(f"\n🔍 Recipe ingredients to check:")
-        for ingredient in recipe.ingredients:
-            print(f"  - {ingredient.name}")
-        
-        # Words to ignore when matching (qualifiers, descriptors)
-        ignore_words = {
-            # French
-            'frais', 'fraîche', 'fraîches', 'surgelé', 'surgelés', 'surgelée', 'surgelées',
-            'congelé', 'congelés', 'congelée', 'congelées', 'décortiqué', 'décortiqués', 
-            'décortiquée', 'décortiquées', 'épluché', 'épluchés', 'épluchée', 'épluchées',
-            'coupé', 'coupés', 'coupée', 'coupées', 'tranché', 'tranchés', 'tranchée', 'tranchées',
-            'haché', 'hachés', 'hachée', 'hachées', 'émincé', 'émincés', 'émincée', 'émincées',
-            'bio', 'biologique', 'biologiques', 'local', 'locaux', 'locale', 'locales',
-            'extra', 'gros', 'grosse', 'grosses', 'petit', 'petits', 'petite', 'petites',
-            'jeune', 'jeunes', 'entier', 'entiers', 'entière', 'entières', 'blanc', 'blancs', 'blanche', 'blanches',
-            # English
-            'fresh', 'frozen', 'peeled', 'deveined', 'shelled', 'cleaned', 'trimmed',
-            'chopped', 'diced', 'sliced', 'minced', 'shredded', 'grated',
-            'organic', 'local', 'extra', 'large', 'small', 'medium', 'whole', 'boneless', 'skinless'
-        }
-        
-        # Mark ingredients that are on sale
-        for ingredient in recipe.ingredients:
-            ing_name = ingredient.name.lower().strip()
-            
-            # Check for exact or partial match
-            is_on_sale = False
-            
-            # Check exact match first
-            if ing_name in normalized_deals:
-                is_on_sale = True
-            else:
-                # Extract keywords from ingredient name (remove qualifiers)
-                ing_words = set(ing_name.split())
-                # Remove common qualifiers
-                ing_keywords = {w for w in ing_words if w not in ignore_words and len(w) > 3}
-                
-                # Check if any keyword matches a deal
-                for keyword in ing_keywords:
-                    if keyword in normalized_deals:
-                        is_on_sale = True
-                        print(f"    - Matched keyword '{keyword}' from '{ing_name}' with deals")
-                        break
-                
-                # Also check if any deal is a substring of the ingredient
-                if not is_on_sale:
-                    for deal in normalized_deals:
-                        if len(deal) > 4 and deal in ing_name:
-                            is_on_sale = True
-                            print(f"    - Matched substring '{deal}' in '{ing_name}'")
-                            break
-            
-            if is_on_sale:
-                ingredient.is_on_sale = True
-                print(f"  ✓ Marked '{ingredient.name}' as ON SALE")
-        
-        return recipe
+        return FlyerDealContext(store_name, postal_code, deals)
         
     except Exception as e:
         print(f"Error fetching flyer deals: {e}")
+        return None
+
+
+async def mark_ingredients_on_sale(
+    recipe: Recipe,
+    preferences: dict,
+    deal_context: Optional[FlyerDealContext] = None
+) -> Recipe:
+    """Mark ingredients that are on sale based on weekly flyers.
+    
+    Pass a `deal_context` from `fetch_flyer_deal_context` to reuse deals
+    already fetched for this request; otherwise the flyer is scraped here.
+    """
+    
+    print(f"\n🔍 DEBUG - mark_ingredients_on_sale called")
+    print(f"  Preferences received: {preferences}")
+    
+    if deal_context is None:
+        deal_context = await fetch_flyer_deal_context(preferences)
+    if deal_context is None:
+        return recipe
+    
+    print(f"\n🔍 Recipe ingredients to check:")
+    for ingredient in recipe.ingredients:
+        print(f"  - {ingredient.name}")
+    
+    try:
+        return deal_context.mark_recipe(recipe)
+    except Exception as e:
+        print(f"Error marking flyer deals: {e}")
         # Return recipe unchanged if there's an error
         return recipe
 
@@ -458,6 +585,19 @@ def distribute_proteins_for_plan(slots: List[Slot], preferences: dict) -> List[s
     return suggested_proteins
 
 
+class BlueprintEntry(BaseModel):
+    recipe_index: int
+    cuisine: str
+    protein: str
+    dish_type: str
+    cooking_method: str
+    vegetable_focus: str
+    description: str
+
+class DiversityBlueprint(BaseModel):
+    recipes: List[BlueprintEntry]
+
+
 async def generate_meal_prep_diversity_blueprint(
     num_recipes: int,
     constraints: dict,
@@ -586,38 +726,40 @@ This rule is NON-NEGOTIABLE. If you use a forbidden protein, the blueprint will
    - Four, poêle, mijoteuse, grill, vapeur, cru (salades)
    - Équilibrer entre four et stovetop
 
-Retourne UNIQUEMENT un array JSON avec cette structure EXACTE:
+Retourne UNIQUEMENT un objet JSON avec cette structure EXACTE:
 
-[
-  {{
-    "recipe_index": 1,
-    "cuisine": "Asiatique",
-    "protein": "poulet",
-    "dish_type": "sauté",
-    "cooking_method": "poêle",
-    "vegetable_focus": "brocoli et poivrons",
-    "description": "Sauté de poulet au brocoli style teriyaki"
-  }},
-  {{
-    "recipe_index": 2,
-    "cuisine": "Méditerranéenne",
-    "protein": "saumon",
-    "dish_type": "grillé",
-    "cooking_method": "four",
-    "vegetable_focus": "tomates et olives",
-    "description": "Saumon grillé aux herbes avec légumes rôtis"
-  }},
-  {{
-    "recipe_index": 3,
-    "cuisine": "Mexicaine",
-    "protein": "boeuf",
-    "dish_type": "mijoté",
-    "cooking_method": "mijoteuse",
-    "vegetable_focus": "haricots et poivrons",
-    "description": "Chili de boeuf mexicain"
-  }},
-  ... ({num_recipes} recettes au total)
-]
+{{
+  "recipes": [
+    {{
+      "recipe_index": 1,
+      "cuisine": "Asiatique",
+      "protein": "poulet",
+      "dish_type": "sauté",
+      "cooking_method": "poêle",
+      "vegetable_focus": "brocoli et poivrons",
+      "description": "Sauté de poulet au brocoli style teriyaki"
+    }},
+    {{
+      "recipe_index": 2,
+      "cuisine": "Méditerranéenne",
+      "protein": "saumon",
+      "dish_type": "grillé",
+      "cooking_method": "four",
+      "vegetable_focus": "tomates et olives",
+      "description": "Saumon grillé aux herbes avec légumes rôtis"
+    }},
+    {{
+      "recipe_index": 3,
+      "cuisine": "Mexicaine",
+      "protein": "boeuf",
+      "dish_type": "mijoté",
+      "cooking_method": "mijoteuse",
+      "vegetable_focus": "haricots et poivrons",
+      "description": "Chili de boeuf mexicain"
+    }},
+    ... ({num_recipes} recettes au total)
+  ]
+}}
 
 IMPORTANT:
 - Génère EXACTEMENT {num_recipes} recettes
@@ -656,29 +798,31 @@ IMPORTANT:
    - Oven, pan, slow cooker, grill, steam, raw (salads)
    - Balance between oven and stovetop
 
-Return ONLY a JSON array with this EXACT structure:
+Return ONLY a JSON object with this EXACT structure:
 
-[
-  {{
-    "recipe_index": 1,
-    "cuisine": "Asian",
-    "protein": "chicken",
-    "dish_type": "stir-fry",
-    "cooking_method": "pan",
-    "vegetable_focus": "broccoli and peppers",
-    "description": "Teriyaki chicken stir-fry with broccoli"
-  }},
-  {{
-    "recipe_index": 2,
-    "cuisine": "Mediterranean",
-    "protein": "salmon",
-    "dish_type": "grilled",
-    "cooking_method": "oven",
-    "vegetable_focus": "tomatoes and olives",
-    "description": "Herb-grilled salmon with roasted vegetables"
-  }},
-  ... ({num_recipes} recipes total)
-]
+{{
+  "recipes": [
+    {{
+      "recipe_index": 1,
+      "cuisine": "Asian",
+      "protein": "chicken",
+      "dish_type": "stir-fry",
+      "cooking_method": "pan",
+      "vegetable_focus": "broccoli and peppers",
+      "description": "Teriyaki chicken stir-fry with broccoli"
+    }},
+    {{
+      "recipe_index": 2,
+      "cuisine": "Mediterranean",
+      "protein": "salmon",
+      "dish_type": "grilled",
+      "cooking_method": "oven",
+      "vegetable_focus": "tomatoes and olives",
+      "description": "Herb-grilled salmon with roasted vegetables"
+    }},
+    ... ({num_recipes} recipes total)
+  ]
+}}
 
 IMPORTANT:
 - Generate EXACTLY {num_recipes} recipes
@@ -687,7 +831,9 @@ IMPORTANT:
 - Optimize for meal prep (storage, reheating)"""
     
     try:
-        response = await client.chat.completions.create(
+        generated = await llm.generate(
+            "meal_prep_blueprint",
+            DiversityBlueprint,
             model="gpt-4o",
             messages=[
                 {
@@ -702,28 +848,7 @@ IMPORTANT:
             temperature=1.0,  # Maximum creativity
             max_tokens=2000
         )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Extract JSON
-        if "```json" in content:
-            parts = content.split("```json")
-            if len(parts) > 1:
-                json_part = parts[1].split("```")[0]
-                content = json_part.strip()
-        elif content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        # Find JSON array
-        start_idx = content.find('[')
-        end_idx = content.rfind(']')
-        if start_idx != -1 and end_idx != -1:
-            content = content[start_idx:end_idx+1]
-        
-        blueprint = json.loads(content)
+        blueprint = [entry.model_dump() for entry in generated.recipes]
         
         # CRITICAL VALIDATION: Check if AI respected user's protein preferences
         if user_proteins:
@@ -918,7 +1043,8 @@ async def generate_recipe_with_openai(
     selected_concept: dict = None,
     blueprint_recipe: dict = None,
     is_meal_prep: bool = False,  # NEW: Is this a meal prep recipe?
-    meal_prep_group_id: str = None  # NEW: Group ID for meal prep batches
+    meal_prep_group_id: str = None,  # NEW: Group ID for meal prep batches
+    on_field: Optional[Callable[[str, Any], None]] = None  # Called with each top-level field as it streams in
 ) -> Recipe:
     """Generate a single recipe using OpenAI with diversity awareness (async).
     
@@ -956,45 +1082,7 @@ async def generate_recipe_with_openai(
     
     print(f"🎯 Recipe complexity for {weekday or 'unknown'}: {complexity_level} (max {max_time} min)")
     
-    # Build complexity-specific instructions
-    if complexity_level == "simple":
-        complexity_instructions_fr = f"""RECETTE SIMPLE et RAPIDE (max {max_time} minutes):
-- Techniques basiques: grillé, poêlé, sauté, rôti, vapeur
-- Formats acceptés: protéine + légumes, salades composées, omelettes, sandwiches élaborés
-- Sauces simples autorisées: vinaigrettes, marinades rapides, réductions simples"""
-        
-        complexity_instructions_en = f"""SIMPLE and QUICK recipe (max {max_time} minutes):
-- Basic techniques: grilled, pan-fried, sautéed, roasted, steamed
-- Accepted formats: protein + vegetables, composed salads, omelets, elaborate sandwiches
-- Simple sauces allowed: vinaigrettes, quick marinades, simple reductions"""
-    
-    elif complexity_level == "medium":
-        complexity_instructions_fr = f"""RECETTE DE COMPLEXITÉ MOYENNE (max {max_time} minutes):
-- Inclure UNE sauce ou garniture élaborée
-- Formats privilégiés: pâtes avec sauce, sautés asiatiques, tacos élaborés, bowls composés
-- Techniques intermédiaires: mijoter brièvement, réduire, caraméliser, gratiner rapidement
-- Minimum 6-7 ingrédients différents pour créer des profils de saveurs intéressants"""
-        
-        complexity_instructions_en = f"""MEDIUM COMPLEXITY recipe (max {max_time} minutes):
-- Include ONE elaborate sauce or garnish
-- Preferred formats: pasta with sauce, Asian stir-fries, elaborate tacos, composed bowls
-- Intermediate techniques: brief simmering, reducing, caramelizing, quick gratinating
-- Minimum 6-7 different ingredients to create interesting flavor profiles"""
-    
-    else:  # complex
-        complexity_instructions_fr = f"""RECETTE ÉLABORÉE (max {max_time} minutes):
-- PRIVILÉGIER ABSOLUMENT: casseroles, lasagnes, gratins, plats mijotés, pâtes au four
-- Sauces riches et complexes: béchamel, sauce tomate maison, crème réduites, bouillons mijotés
-- Techniques avancées: étages de saveurs, cuisson au four, assemblage complexe
-- Minimum 8-10 ingrédients variés incluant herbes, épices, condiments spéciaux
-- Créer des profils de saveurs multicouches: umami, acidité, douceur, épices"""
-        
-        complexity_instructions_en = f"""ELABORATE recipe (max {max_time} minutes):
-- ABSOLUTELY PRIORITIZE: casseroles, lasagnas, gratins, braised dishes, baked pasta
-- Rich and complex sauces: béchamel, homemade tomato sauce, reduced creams, simmered broths
-- Advanced techniques: flavor layering, oven cooking, complex assembly
-- Minimum 8-10 varied ingredients including herbs, spices, special condiments
-- Create multi-layered flavor profiles: umami, acidity, sweetness, spices"""
+    complexity_instructions = COMPLEXITY_RULES[prompt_language(language)][complexity_level].format(max_time=max_time)
     
     # Build constraints text - CRITICAL: Make allergens/evictions VERY prominent
     constraints_text = ""
@@ -1098,282 +1186,14 @@ async def generate_recipe_with_openai(
                 preferences_text += f"CRITICAL - USER'S PREFERRED PROTEINS: {proteins}. YOU MUST ONLY USE THESE PROTEINS. "
                 print(f"  ✅ Added preferredProteins from constraints to prompt: {proteins}")
     
-    # Build protein portions guide
-    protein_portions_text = "\n\nCRITICAL - PROTEIN PORTIONS PER PERSON:\n"
-    protein_portions_text += "You MUST include adequate protein in each recipe following these guidelines:\n"
-    protein_portions_text += "- Chicken (breast, thigh): 150-200g per person (250-300g if bone-in)\n"
-    protein_portions_text += "- Beef (steak, roast): 180-220g per person\n"
-    protein_portions_text += "- Pork (chops, tenderloin): 160-200g per person\n"
-    protein_portions_text += "- Lamb: 180-200g per person\n"
-    protein_portions_text += "- Fish (fillet): 150-180g per person (300-350g if whole fish)\n"
-    protein_portions_text += "- Shrimp/Prawns: 120-150g per person\n"
-    protein_portions_text += "- Tofu: 120-150g per person\n"
-    protein_portions_text += "- Tempeh/Seitan: 100-130g per person\n"
-    protein_portions_text += "- Eggs: 2-3 large eggs per person\n"
-    protein_portions_text += "- Ground meat (beef, pork, chicken): 150-180g per person\n"
-    protein_portions_text += "These portions ensure adequate protein intake for a satisfying meal.\n"
-    
-    # Build accompaniment guidance for intelligent side dish suggestions
-    accompaniment_guidance_fr = """
-
-🍽️ ÉQUILIBRE DU REPAS (pour Dîner et Souper - Guidage Intelligent):
-
-ÉVALUE si le repas BÉNÉFICIERAIT d'un féculent/accompagnement:
-
-✅ INCLURE un féculent SI le plat en bénéficierait:
-- Protéine grillée/rôtie simple (ex: poulet grillé → ajouter riz basmati ou pommes de terre rôties)
-- Plat en sauce (ex: curry de poulet → servir avec riz basmati ou naan)
-- Sauté asiatique (ex: boeuf aux légumes → avec riz jasmin ou nouilles de riz)
-- Viande mijotée (ex: boeuf braisé → avec purée de pommes de terre ou polenta crémeuse)
-- Poisson au four (ex: saumon → avec quinoa ou riz sauvage)
-- Repas qui semble "léger" sans glucides
-
-❌ PAS NÉCESSAIRE si déjà complet:
-- Pâtes bolognaise, carbonara, etc. (les pâtes SONT le féculent)
-- Pizza, lasagne, cannelloni (déjà substantiel avec pâtes)
-- Quiche, tarte salée (pâte = glucides)
-- Bol-repas avec plusieurs composantes (ex: bowl poke avec riz déjà inclus)
-- Salade-repas copieuse avec légumineuses ou croûtons
-
-🌾 OPTIONS DE FÉCULENTS (portions par personne):
-
-CLASSIQUES (privilégier selon le type de plat):
-- Riz blanc, basmati, jasmin: 60-80g sec (180-240g cuit)
-- Riz brun: 60-75g sec (pour plats santé)
-- Pâtes (spaghetti, penne, etc.): 80-100g sec
-- Pommes de terre: 150-200g (rôties, en purée, bouillies)
-- Patates douces: 150-180g (rôties ou en purée)
-- Quinoa: 60-75g sec (pour bols santé)
-- Couscous: 60-80g sec (avec plats méditerranéens)
-- Polenta: 50-60g sec (avec plats mijotés italiens)
-
-ALTERNATIVES LOW-CARB (pour préférences diététiques):
-- Riz de chou-fleur: 150-200g (alternative au riz)
-- Courgettes spiralisées (zoodles): 200-250g (alternative aux pâtes)
-- Purée de chou-fleur: 200g (alternative à la purée)
-- Courge spaghetti: 200g (alternative aux pâtes)
-
-💡 PRINCIPE CLÉS:
-- Pense "repas complet, équilibré et satisfaisant"
-- Le féculent n'est PAS obligatoire, mais souvent recommandé
-- Adapte le choix au style du plat (riz asiatique, pâtes italiennes, pommes de terre françaises)
-- Si tu ajoutes un féculent, intègre-le naturellement dans les instructions
-"""
-
-    accompaniment_guidance_en = """
-
-🍽️ MEAL BALANCE (for Lunch and Dinner - Intelligent Guidance):
-
-EVALUATE if the meal would BENEFIT from a starch/side dish:
-
-✅ INCLUDE a starch IF it would enhance the meal:
-- Simple grilled/roasted protein (e.g., grilled chicken → add basmati rice or roasted potatoes)
-- Saucy dish (e.g., chicken curry → serve with basmati rice or naan)
-- Asian stir-fry (e.g., beef with vegetables → with jasmine rice or rice noodles)
-- Braised meat (e.g., braised beef → with mashed potatoes or creamy polenta)
-- Baked fish (e.g., salmon → with quinoa or wild rice)
-- Meal that feels "light" without carbs
-
-❌ NOT NECESSARY if already complete:
-- Pasta bolognese, carbonara, etc. (pasta IS the starch)
-- Pizza, lasagna, cannelloni (already substantial with pasta)
-- Quiche, savory tart (crust = carbs)
-- Bowl meals with multiple components (e.g., poke bowl with rice already included)
-- Hearty salad with legumes or croutons
-
-🌾 STARCH OPTIONS (portions per person):
-
-CLASSICS (choose based on dish style):
-- White, basmati, jasmine rice: 60-80g dry (180-240g cooked)
-- Brown rice: 60-75g dry (for healthy dishes)
-- Pasta (spaghetti, penne, etc.): 80-100g dry
-- Potatoes: 150-200g (roasted, mashed, boiled)
-- Sweet potatoes: 150-180g (roasted or mashed)
-- Quinoa: 60-75g dry (for healthy bowls)
-- Couscous: 60-80g dry (with Mediterranean dishes)
-- Polenta: 50-60g dry (with Italian braised dishes)
-
-LOW-CARB ALTERNATIVES (for dietary preferences):
-- Cauliflower rice: 150-200g (rice alternative)
-- Spiralized zucchini (zoodles): 200-250g (pasta alternative)
-- Cauliflower mash: 200g (mashed potato alternative)
-- Spaghetti squash: 200g (pasta alternative)
-
-💡 KEY PRINCIPLES:
-- Think "complete, balanced, and satisfying meal"
-- Starch is NOT mandatory, but often recommended
-- Match the choice to dish style (Asian rice, Italian pasta, French potatoes)
-- If you add a starch, integrate it naturally into the instructions
-"""
-    
     # Map meal_type to English name - BEFORE meal prep block
     meal_type_name = {"BREAKFAST": "breakfast", "LUNCH": "lunch", "DINNER": "dinner"}.get(meal_type, meal_type.lower())
     
-    # Build storage instructions for meal prep with adaptive shelf life
+    # Adaptive shelf life and meal prep rules (static per language)
     storage_instructions = ""
     if min_shelf_life_required > 3:
-        if language == "fr":
-            storage_instructions = f"""
-
-🥡 CONSERVATION ADAPTATIVE (CRITIQUE):
-Cette recette sera consommée le jour {min_shelf_life_required} après préparation.
-Elle DOIT ABSOLUMENT:
-- Se conserver {min_shelf_life_required} jours au frigo, OU
-- Être congélable
-
-TYPES DE RECETTES PRIVILÉGIÉS pour longue conservation:
-- Soupes, ragoûts, chilis
-- Plats mijotés (curry, tajines)
-- Casseroles, lasagnes, gratins
-- Pâtes au four
-
-ÉVITER: salades, poisson frais, fruits de mer non congelés
-"""
-        else:
-            storage_instructions = f"""
-
-🥡 ADAPTIVE STORAGE (CRITICAL):
-This recipe will be consumed on day {min_shelf_life_required} after preparation.
-It MUST:
-- Keep {min_shelf_life_required} days in fridge, OR
-- Be freezable
-
-PRIORITIZE for long storage:
-- Soups, stews, chilis
-- Braised dishes (curries, tagines)
-- Casseroles, lasagnas, gratins
-- Baked pasta
-
-AVOID: salads, fresh fish, non-frozen seafood
-"""
-    
-    # Build MEAL PREP instructions if this is a meal prep recipe
-    meal_prep_instructions = ""
-    if is_meal_prep:
-        if language == "fr":
-            meal_prep_instructions = """
-
-🍱🍱🍱 RECETTE MEAL PREP - INSTRUCTIONS DÉTAILLÉES 🍱🍱🍱
-
-Tu DOIS créer une recette optimisée pour le MEAL PREP avec instructions séparées "AUJOURD'HUI" vs "CE SOIR".
-
-🔥 FORMAT OBLIGATOIRE POUR LES ÉTAPES (steps):
-
-Les étapes doivent inclure des SECTIONS CLAIREMENT MARQUÉES:
-
-**📅 AUJOURD'HUI (Préparation à l'avance):**
-1. [Étape de préparation 1]
-2. [Étape de préparation 2]
-3. [Conservation au frigo]
-
-**🌙 CE SOIR (Jour de consommation):**
-1. [Réchauffage ou finition]
-2. [Service]
-
-EXEMPLE CONCRET - Poulet rôti avec légumes:
-
-steps: [
-  "📅 AUJOURD'HUI (Préparation à l'avance):",
-  "1. Assaisonner poulet (600g) avec sel, poivre, paprika et herbes",
-  "2. Rôtir poulet au four 200°C pendant 30 min jusqu'à cuisson complète",
-  "3. Pendant ce temps: rôtir brocoli et carottes sur une autre plaque 20 min",
-  "4. Cuire quinoa (300g): rincer, puis 2 volumes d'eau, bouillir 15 min",
-  "5. Laisser refroidir tous les éléments 10-15 min",
-  "6. Portionner dans 4 contenants hermétiques: poulet + légumes + quinoa",
-  "7. Conserver au frigo jusqu'à 4 jours",
-  "",
-  "🌙 CE SOIR (Jour de consommation):",
-  "1. Réchauffer 1 portion au micro-ondes 2-3 min OU à la poêle 5-8 min",
-  "2. Servir immédiatement"
-]
-
-EXEMPLE CONCRET - Saumon avec légumes (poisson frais):
-
-steps: [
-  "📅 AUJOURD'HUI (Préparation à l'avance):",
-  "1. Préparer marinade: mélanger huile d'olive, jus de citron, ail émincé, aneth",
-  "2. Placer saumon dans un contenant, verser marinade, couvrir, réfrigérer",
-  "3. Laver brocoli, couper en bouquets, conserver au frigo",
-  "4. Cuire riz (300g) et portionner dans 4 contenants",
-  "",
-  "🌙 CE SOIR (Jour de consommation):",
-  "1. Sortir saumon mariné du frigo",
-  "2. Cuire saumon à la poêle ou au four 12-15 min",
-  "3. Pendant ce temps: faire sauter brocoli 5-8 min",
-  "4. Réchauffer portion de riz au micro-ondes 2 min",
-  "5. Assembler et servir"
-]
-
-
-Cette recette DOIT être optimisée pour le MEAL PREP:
-
-RÈGLES MEAL PREP OBLIGATOIRES:
-1. Conservation: Recette qui se conserve bien 3-5 jours au frigo
-2. Réchauffage: Se réchauffe facilement (micro-ondes ou poêle)
-3. Texture: Maintient sa qualité après conservation
-4. Portionnement: Facile à diviser en portions individuelles
-
-TYPES DE RECETTES MEAL PREP IDÉALES:
-✅ Plats complets en une préparation:
-   - Bols protéinés (protéine + légumes + féculent)
-   - Plats mijotés (curry, tajines, chilis)
-   - Casseroles et gratins
-   - Pâtes au four
-   - Sautés asiatiques avec sauce
-
-✅ Techniques meal prep friendly:
-   - Rôtir au four (facile à faire en grandes quantités)
-   - Mijoter (améliore avec le temps)
-   - Cuire en sauce (protège de la sécheresse)
-
-❌ ÉVITER pour meal prep:
-   - Recettes avec éléments crus/frais à ajouter au dernier moment
-   - Salades vertes (se flétrit)
-   - Poisson délicat (perd texture, sauf congelé)
-   - Recettes qui deviennent pâteuses
-
-INSTRUCTIONS SPÉCIALES:
-- Intégrer les légumes DANS le plat (pas à part)
-- Sauce généreuse pour maintenir l'humidité
-- Assaisonnement marqué (s'atténue avec le temps)
-"""
-        else:
-            meal_prep_instructions = """
-
-🍱🍱🍱 MEAL PREP RECIPE - CRITICAL OPTIMIZATION 🍱🍱🍱
-
-This recipe MUST be optimized for MEAL PREP:
-
-MANDATORY MEAL PREP RULES:
-1. Storage: Recipe keeps well 3-5 days in fridge
-2. Reheating: Easy to reheat (microwave or pan)
-3. Texture: Maintains quality after storage
-4. Portioning: Easy to divide into individual portions
-
-IDEAL MEAL PREP RECIPE TYPES:
-✅ Complete one-pot dishes:
-   - Protein bowls (protein + vegetables + starch)
-   - Braised dishes (curries, tagines, chilis)
-   - Casseroles and gratins
-   - Baked pasta
-   - Asian stir-fries with sauce
-
-✅ Meal prep friendly techniques:
-   - Roasting in oven (easy to make in large quantities)
-   - Braising (improves with time)
-   - Cooking in sauce (prevents dryness)
-
-❌ AVOID for meal prep:
-   - Recipes with fresh elements to add last minute
-   - Green salads (wilts)
-   - Delicate fish (loses texture, unless frozen)
-   - Recipes that become mushy
-
-SPECIAL INSTRUCTIONS:
-- Integrate vegetables INTO the dish (not separate)
-- Generous sauce to maintain moisture
-- Bold seasoning (diminishes over time)
-"""
+        storage_instructions = ADAPTIVE_STORAGE_RULES[prompt_language(language)].format(days=min_shelf_life_required)
+    meal_prep_instructions = MEAL_PREP_RULES[prompt_language(language)] + "\n\n" if is_meal_prep else ""
     
     # Build diversity text for suggested proteins
     diversity_text = ""
@@ -1388,178 +1208,66 @@ SPECIAL INSTRUCTIONS:
         diversity_text += "- Each recipe must be distinct from others\n"
         diversity_text += "- Use maximum creativity without limitations\n"
     
-    # Build the prompt based on language (OUTSIDE the if is_meal_prep block)
+    # Only the per-request details are assembled here; the invariant
+    # instructions are the precompiled "plan_recipe" system prompt. Meal prep
+    # rules come first so meal prep recipes share a longer cached prefix.
+    request_details = "\n\n".join(
+        section.strip()
+        for section in (constraints_text, complexity_instructions, preferences_text, storage_instructions, diversity_text)
+        if section.strip()
+    )
     if language == "en":
         unit_system_text = "metric (grams, ml)" if units == "METRIC" else "imperial (oz, cups)"
         
-        prompt = f"""Generate a {meal_type_name} recipe in English for {servings} people.
-
-{constraints_text}{complexity_instructions_en}
-{preferences_text}{protein_portions_text}{accompaniment_guidance_en}{storage_instructions}{meal_prep_instructions}{diversity_text}
-
-CRITICAL - PREPARATION STEPS: The recipe MUST start with detailed preparation steps:
-- First steps should describe ALL ingredient preparations (cutting, dicing, chopping, grating, etc.)
-- Be specific about cuts: "dice carrots into 1cm cubes", "grate 100g cheese", "finely chop 2 onions"
-- Include prep for ALL ingredients before cooking steps
-- Then include cooking/assembly steps with exact times, temperatures, and techniques
-
-Return ONLY a valid JSON object with this exact structure (no text before or after):
-{{
-    "title": "Creative and appetizing recipe name",
-    "servings": {servings},
-    "total_minutes": 30,
-    "ingredients": [
-        {{"name": "ingredient", "quantity": 200, "unit": "g", "category": "vegetables"}}
-    ],
-    "steps": [
-        "Preparation: Dice the carrots into 1cm cubes. Finely chop the onion. Grate the cheese.",
-        "Preparation: Cut the chicken into bite-sized pieces and season with salt and pepper.",
-        "Heat oil in a large pan over medium-high heat...",
-        "Add the diced carrots and cook for 5 minutes...",
-        "Finish with grated cheese and serve..."
-    ],
-    "equipment": ["pan", "pot"],
-    "tags": ["easy", "quick"],
-    "calories_per_serving": 450,
-    "protein_per_serving": 35,
-    "carbs_per_serving": 40,
-    "fat_per_serving": 15
-}}
-
-CRITICAL - NUTRITIONAL CALCULATION:
-Calculate approximate nutritional values per serving using USDA database knowledge:
-- calories_per_serving: Total calories per serving (integer)
-- protein_per_serving: Protein in grams per serving (integer)
-- carbs_per_serving: Carbohydrates in grams per serving (integer)
-- fat_per_serving: Fat in grams per serving (integer)
-Base calculations on the actual ingredients and quantities in the recipe.
+        prompt = f"""{meal_prep_instructions}Generate a {meal_type_name} recipe in English for {servings} people ("servings": {servings}).
 
-Use the {unit_system_text} system.
-Possible ingredient categories: vegetables, fruits, meats, fish, dairy, dry goods, condiments, canned goods.
+{request_details}
 
-IMPORTANT: Generate at least 6-8 detailed steps with EXPLICIT preparation steps at the beginning."""
+Use the {unit_system_text} system."""
     else:  # French
         unit_system_text = "métrique (grammes, ml)" if units == "METRIC" else "impérial (oz, cups)"
         
-        prompt = f"""Génère une recette de {meal_type_name} en français pour {servings} personnes.
+        prompt = f"""{meal_prep_instructions}Génère une recette de {meal_type_name} en français pour {servings} personnes ("servings": {servings}).
 
-{constraints_text}{complexity_instructions_fr}
-{preferences_text}{protein_portions_text}{accompaniment_guidance_fr}{storage_instructions}{meal_prep_instructions}{diversity_text}
+{request_details}
 
-CRITIQUE - ÉTAPES DE PRÉPARATION: La recette DOIT commencer par des étapes de préparation détaillées:
-- Les premières étapes doivent décrire TOUTES les préparations d'ingrédients (couper, émincer, hacher, râper, etc.)
-- Sois précis sur les coupes: "couper les carottes en dés de 1cm", "râper 100g de fromage", "émincer finement 2 oignons"
-- Inclure la préparation de TOUS les ingrédients avant les étapes de cuisson
-- Ensuite inclure les étapes de cuisson/assemblage avec temps exacts, températures et techniques
-
-Retourne UNIQUEMENT un objet JSON valide avec cette structure exacte (sans texte avant ou après):
-{{
-    "title": "Nom créatif et appétissant de la recette",
-    "servings": {servings},
-    "total_minutes": 30,
-    "ingredients": [
-        {{"name": "ingrédient", "quantity": 200, "unit": "g", "category": "légumes"}}
-    ],
-    "steps": [
-        "Préparation: Couper les carottes en dés de 1cm. Émincer finement l'oignon. Râper le fromage.",
-        "Préparation: Couper le poulet en morceaux et assaisonner de sel et poivre.",
-        "Faire chauffer l'huile dans une grande poêle à feu moyen-vif...",
-        "Ajouter les carottes en dés et cuire 5 minutes...",
-        "Terminer avec le fromage râpé et servir..."
-    ],
-    "equipment": ["poêle", "casserole"],
-    "tags": ["facile", "rapide"],
-    "calories_per_serving": 450,
-    "protein_per_serving": 35,
-    "carbs_per_serving": 40,
-    "fat_per_serving": 15
-}}
-
-CRITIQUE - CALCUL NUTRITIONNEL:
-Calcule les valeurs nutritionnelles approximatives par portion en utilisant tes connaissances de la base USDA:
-- calories_per_serving: Calories totales par portion (entier)
-- protein_per_serving: Protéines en grammes par portion (entier)
-- carbs_per_serving: Glucides en grammes par portion (entier)
-- fat_per_serving: Lipides en grammes par portion (entier)
-Base les calculs sur les ingrédients et quantités réels de la recette.
-
-Utilise le système {unit_system_text}.
-Catégories d'ingrédients possibles: légumes, fruits, viandes, poissons, produits laitiers, sec, condiments, conserves.
-
-IMPORTANT: Génère au moins 6-8 étapes détaillées avec des étapes de préparation EXPLICITES au début."""
+Utilise le système {unit_system_text}."""
 
     try:
-        response = await client.chat.completions.create(
+        # The answer is constrained to the GeneratedRecipe schema and parsed
+        # while it streams: fields are reported as soon as they are complete
+        # and malformed output stops the stream at once
+        parser = IncrementalJSONObjectParser(on_field=on_field)
+        deltas = llm.chat_completion_stream(
+            "plan_recipe",
             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Tu es un chef cuisinier créatif et expert qui génère des recettes uniques et détaillées en JSON. Tu varies toujours les ingrédients, cuisines et techniques."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=recipe_prompts.messages("plan_recipe", language, prompt),
             temperature=1.0,  # Maximum creativity and diversity
-            max_tokens=1200  # Increased for detailed steps
+            max_tokens=1200,  # Increased for detailed steps
+            response_format=structured_response_format(GeneratedRecipe)
         )
         
-        content = response.choices[0].message.content.strip()
-        
-        # Enhanced JSON extraction - handle various formats
-        # Remove markdown code blocks if present
-        if "```json" in content:
-            # Extract content between ```json and ```
-            parts = content.split("```json")
-            if len(parts) > 1:
-                json_part = parts[1].split("```")[0]
-                content = json_part.strip()
-        elif content.startswith("```"):
-            # Handle generic code blocks
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        # Remove any leading/trailing non-JSON text
-        # Find the first { and last }
-        start_idx = content.find('{')
-        end_idx = content.rfind('}')
-        if start_idx != -1 and end_idx != -1:
-            content = content[start_idx:end_idx+1]
-        
         try:
-            recipe_data = json.loads(content)
-        except json.JSONDecodeError as e:
+            async with aclosing(deltas):
+                # The schema ends the answer at the closing brace; reading on
+                # only collects the usage chunk
+                async for delta in deltas:
+                    parser.feed(delta)
+            recipe_data = parser.finish()
+        except MalformedJSONStreamError as e:
             print(f"JSON decode error: {e}")
-            print(f"Problematic content: {content[:500]}...")
+            print(f"Problematic content: {parser.received[:500]}...")
             raise HTTPException(status_code=500, detail=f"Failed to parse recipe JSON: {str(e)}")
         
-        # Ensure all ingredients have required fields AND fix invalid quantities
-        for ingredient in recipe_data.get("ingredients", []):
-            if "unit" not in ingredient or not ingredient.get("unit"):
-                ingredient["unit"] = "unité"
-            if "category" not in ingredient or not ingredient.get("category"):
-                ingredient["category"] = "autre"
-            
-            # CRITICAL FIX: Convert non-numeric quantities to default values
-            quantity = ingredient.get("quantity")
-            if isinstance(quantity, str):
-                # Handle "au goût", "to taste", etc.
-                quantity_lower = quantity.lower().strip()
-                if any(phrase in quantity_lower for phrase in ['au goût', 'to taste', 'goût', 'taste']):
-                    ingredient["quantity"] = 1.0  # Default to 1
-                    if not ingredient.get("unit") or ingredient["unit"] == "unité":
-                        ingredient["unit"] = "pincée" if language == "fr" else "pinch"
-                else:
-                    # Try to extract a number from the string
-                    import re
-                    numbers = re.findall(r'\d+\.?\d*', quantity)
-                    if numbers:
-                        ingredient["quantity"] = float(numbers[0])
-                    else:
-                        # Fallback to 1 if no number found
-                        ingredient["quantity"] = 1.0
-            elif quantity is None:
-                ingredient["quantity"] = 1.0
-        
-        return Recipe(**recipe_data)
+        return GeneratedRecipe.model_validate(recipe_data).to_recipe(language)
         
+    except LLMUnavailableError as e:
+        print(f"⛔ OpenAI circuit open, not generating {meal_type}: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after_seconds))}
+        )
     except Exception as e:
         print(f"❌ CRITICAL ERROR generating recipe with OpenAI: {e}")
         print(f"   Meal type: {meal_type}, Language: {language}")
@@ -1571,69 +1279,57 @@ IMPORTANT: Génère au moins 6-8 étapes détaillées avec des étapes de prépa
         )
 
 
-@app.post("/ai/plan", response_model=PlanResponse)
-@limiter.limit("10/minute")
-async def ai_plan(request: Request, req: PlanRequest):
-    """Generate a meal plan using OpenAI with parallel generation and diversity seeds."""
+def plan_slot_failure(idx: int, slot: Slot, error: BaseException) -> PlanSlotFailure:
+    """Describe a slot that could not be generated, for partial plan responses."""
+    if isinstance(error, HTTPException):
+        status_code, message = error.status_code, str(error.detail)
+    else:
+        status_code, message = 500, str(error) or type(error).__name__
+    return PlanSlotFailure(
+        slot_index=idx,
+        weekday=slot.weekday,
+        meal_type=slot.meal_type,
+        is_meal_prep=slot.is_meal_prep,
+        meal_prep_group_id=slot.meal_prep_group_id,
+        error=message,
+        status_code=status_code
+    )
+
+
+class PlanGeneration:
+    """Shared state for generating the recipes of one plan.
     
-    # Get flyer deals BEFORE generating recipes if feature is enabled
-    flyer_deals = []
-    if req.preferences and req.preferences.get("useWeeklyFlyers"):
-        postal_code = req.preferences.get("postalCode")
-        store_name = req.preferences.get("preferredGroceryStore")
-        
-        if postal_code and store_name:
-            try:
-                print(f"\n🛒 Pre-fetching deals for meal plan generation...")
-                deals = await asyncio.to_thread(
-                    flyer_scraper.get_weekly_deals,
-                    store_name=store_name,
-                    postal_code=postal_code
-                )
-                
-                if not deals:
-                    # Use fallback data
-                    deals = [
-                        {"name": "poulet", "price": 8.99},
-                        {"name": "chicken", "price": 8.99},
-                        {"name": "turkey", "price": 8.99},
-                        {"name": "dinde", "price": 8.99},
-                        {"name": "saumon", "price": 9.99},
-                        {"name": "salmon", "price": 9.99},
-                        {"name": "crevettes", "price": 11.99},
-                        {"name": "shrimp", "price": 11.99},
-                        {"name": "boeuf haché", "price": 5.99},
-                        {"name": "ground beef", "price": 5.99},
-                        {"name": "porc", "price": 6.99},
-                        {"name": "pork", "price": 6.99},
-                        {"name": "brocoli", "price": 2.99},
-                        {"name": "broccoli", "price": 2.99},
-                        {"name": "carottes", "price": 1.99},
-                        {"name": "carrots", "price": 1.99},
-                        {"name": "tomates", "price": 3.49},
-                        {"name": "tomatoes", "price": 3.49},
-                        {"name": "épinards", "price": 2.99},
-                        {"name": "spinach", "price": 2.99},
-                        {"name": "chou-fleur", "price": 3.99},
-                        {"name": "cauliflower", "price": 3.99},
-                    ]
-                
-                # Extract deal names
-                for deal in deals:
-                    deal_name = deal.get('name', '') if isinstance(deal, dict) else str(deal)
-                    if deal_name:
-                        flyer_deals.append(deal_name)
-                
-                print(f"✅ Found {len(flyer_deals)} deals to suggest to recipes: {flyer_deals[:10]}")
-            except Exception as e:
-                print(f"⚠️ Error pre-fetching deals: {e}")
+    Holds the pre-fetched flyer deals and the protein distribution so
+    /ai/plan and /ai/plan/stream generate, retry and finish slots the
+    same way.
+    """
     
-    # Distribute proteins across the plan for variety
-    suggested_proteins = distribute_proteins_for_plan(req.slots, req.preferences)
+    def __init__(self, req: PlanRequest, deal_context: Optional[FlyerDealContext], suggested_proteins: List[str]):
+        self.req = req
+        self.deal_context = deal_context
+        self.suggested_proteins = suggested_proteins
+    
+    @classmethod
+    async def start(cls, req: PlanRequest) -> "PlanGeneration":
+        # Get flyer deals BEFORE generating recipes if feature is enabled.
+        # The same context is reused to mark every recipe on sale afterwards,
+        # so the flyer is scraped and normalized only once per plan.
+        deal_context = None
+        if req.preferences and req.preferences.get("useWeeklyFlyers"):
+            print(f"\n🛒 Pre-fetching deals for meal plan generation...")
+            deal_context = await fetch_flyer_deal_context(req.preferences)
+            if deal_context:
+                flyer_deals = deal_context.deal_names
+                print(f"✅ Found {len(flyer_deals)} deals to suggest to recipes: {flyer_deals[:10]}")
+        
+        # Distribute proteins across the plan for variety
+        suggested_proteins = distribute_proteins_for_plan(req.slots, req.preferences)
+        return cls(req, deal_context, suggested_proteins)
     
-    # Generate all recipes in parallel with diversity seeds and protein guidance
-    tasks = [
-        generate_recipe_with_openai(
+    def generate_slot(self, idx: int, on_field: Optional[Callable[[str, Any], None]] = None):
+        req = self.req
+        slot = req.slots[idx]
+        return generate_recipe_with_openai(
             meal_type=slot.meal_type,
             constraints=req.constraints,
             units=req.units,
@@ -1642,48 +1338,53 @@ async def ai_plan(request: Request, req: PlanRequest):
             diversity_seed=idx,  # Each recipe gets a different seed for variety
             language=req.language,
             preferences=req.preferences,
-            suggested_protein=suggested_proteins[idx],
-            other_plan_proteins=[p for i, p in enumerate(suggested_proteins) if i != idx],
+            suggested_protein=self.suggested_proteins[idx],
+            other_plan_proteins=[p for i, p in enumerate(self.suggested_proteins) if i != idx],
             weekday=slot.weekday,  # Pass weekday for complexity determination
             is_meal_prep=slot.is_meal_prep,  # NEW: Pass meal prep flag
-            meal_prep_group_id=slot.meal_prep_group_id  # NEW: Pass group ID
+            meal_prep_group_id=slot.meal_prep_group_id,  # NEW: Pass group ID
+            on_field=on_field
         )
-        for idx, slot in enumerate(req.slots)
-    ]
     
-    # Execute all API calls in parallel
-    recipes = await asyncio.gather(*tasks)
-    
-    # Mark ingredients on sale if feature is enabled
-    for recipe in recipes:
-        await mark_ingredients_on_sale(recipe, req.preferences)
+    async def generate_slot_with_retries(self, idx: int, on_field: Optional[Callable[[str, Any], None]] = None) -> Recipe:
+        """Generate one slot, retrying it alone (up to PLAN_SLOT_ATTEMPTS) if it fails."""
+        for attempt in range(PLAN_SLOT_ATTEMPTS):
+            try:
+                return await self.generate_slot(idx, on_field)
+            except Exception as e:
+                # No point retrying while OpenAI is known to be down
+                if attempt + 1 >= PLAN_SLOT_ATTEMPTS or llm.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                print(f"\n🔁 Retrying slot {idx} after error: {e}")
     
-    # CRITICAL: Map meal prep properties from slots to recipes
-    for slot, recipe in zip(req.slots, recipes):
+    def finish_item(self, idx: int, recipe: Recipe) -> PlanItem:
+        """Mark deals and copy the slot's meal prep properties onto a generated recipe."""
+        slot = self.req.slots[idx]
+        
+        # Mark ingredients on sale against the pre-fetched deals
+        if self.deal_context:
+            try:
+                self.deal_context.mark_recipe(recipe)
+            except Exception as e:
+                print(f"Error marking flyer deals: {e}")
+        
+        # CRITICAL: Map meal prep properties from slots to recipes
         recipe.is_meal_prep = slot.is_meal_prep
         recipe.meal_prep_group_id = slot.meal_prep_group_id
-    
-    # Build response with meal prep properties
-    items = [
-        PlanItem(
+        
+        return PlanItem(
             weekday=slot.weekday,
             meal_type=slot.meal_type,
             recipe=recipe,
             is_meal_prep=slot.is_meal_prep,
             meal_prep_group_id=slot.meal_prep_group_id
         )
-        for slot, recipe in zip(req.slots, recipes)
-    ]
-    
-    # Log ingredient categories for debugging
-    print("\n=== SHOPPING LIST DEBUG - Ingredient Categories ===")
-    for item in items:
-        print(f"\nRecipe: {item.recipe.title}")
-        for ing in item.recipe.ingredients:
-            print(f"  - {ing.name}: category='{ing.category}'")
-    print("=== END SHOPPING LIST DEBUG ===\n")
+
+
+async def build_meal_prep_kits(items: List[PlanItem], language: str) -> List[dict]:
+    """Generate a meal prep kit for every meal_prep_group_id found in the plan items."""
     
-    # NEW: Detect meal prep groups and generate kits
+    # Detect meal prep groups and generate kits
     meal_prep_kits = []
     meal_prep_groups = {}
     
@@ -1696,7 +1397,8 @@ async def ai_plan(request: Request, req: PlanRequest):
     
     print(f"\n🍱 Detected {len(meal_prep_groups)} meal prep groups")
     
-    # Generate kit data for each group
+    # Build kit data for each group
+    group_specs = []
     for group_id, group_items in meal_prep_groups.items():
         print(f"\n📦 Generating kit for group: {group_id} ({len(group_items)} meals)")
         
@@ -1735,9 +1437,36 @@ async def ai_plan(request: Request, req: PlanRequest):
                 }
             })
         
-        # Generate today preparation and weekly reheating
-        today_preparation = await generate_today_preparation(kit_recipes, req.language)
-        weekly_reheating = await generate_weekly_reheating(kit_recipes, days_in_group, meals_in_group, req.language)
+        group_specs.append((group_id, kit_recipes, days_in_group, meals_in_group))
+    
+    # Generate today preparation and weekly reheating for every group at once,
+    # bounded so a plan with many groups doesn't flood OpenAI
+    kit_semaphore = asyncio.Semaphore(MEAL_PREP_KIT_CONCURRENCY)
+    
+    async def bounded(coro):
+        async with kit_semaphore:
+            return await coro
+    
+    kit_sections = await asyncio.gather(*(
+        section
+        for _, kit_recipes, days_in_group, meals_in_group in group_specs
+        for section in (
+            bounded(run_kit_phase(
+                "today_preparation",
+                generate_today_preparation(kit_recipes, language),
+                fallback_today_preparation
+            )),
+            bounded(run_kit_phase(
+                "weekly_reheating",
+                generate_weekly_reheating(kit_recipes, days_in_group, meals_in_group, language),
+                fallback_weekly_reheating
+            ))
+        )
+    ))
+    
+    # Results come back in group order: (today, reheating) per group
+    for idx, (group_id, kit_recipes, days_in_group, meals_in_group) in enumerate(group_specs):
+        today_preparation, weekly_reheating = kit_sections[2 * idx], kit_sections[2 * idx + 1]
         
         # Create kit
         kit = {
@@ -1751,9 +1480,165 @@ async def ai_plan(request: Request, req: PlanRequest):
         }
         
         meal_prep_kits.append(kit)
-        print(f"  ✅ Kit generated with {len(kit_recipes)} recipes")
+        print(f"  ✅ Kit generated for {group_id} with {len(kit_recipes)} recipes")
+    
+    return meal_prep_kits
+
+
+@app.post("/ai/plan", response_model=PlanResponse)
+@limiter.limit("10/minute")
+@coalesce_requests(in_flight_requests, "plan")
+async def ai_plan(request: Request, req: PlanRequest):
+    """Generate a meal plan using OpenAI with parallel generation and diversity seeds."""
+    
+    generation = await PlanGeneration.start(req)
+    
+    # Generate all recipes in parallel with diversity seeds and protein guidance.
+    # Slots that fail are retried on their own; successful recipes are kept.
+    results = await asyncio.gather(
+        *(generation.generate_slot_with_retries(idx) for idx in range(len(req.slots))),
+        return_exceptions=True
+    )
+    pending = [idx for idx, result in enumerate(results) if isinstance(result, BaseException)]
+    
+    failed_slots = []
+    if pending:
+        print(f"❌ {len(pending)} slot(s) failed after {PLAN_SLOT_ATTEMPTS} attempts")
+        if not req.allow_partial or len(pending) == len(req.slots):
+            raise results[pending[0]]
+        # Degraded response: keep what succeeded and list the rest so the
+        # client regenerates only those slots via /ai/regenerate-meal
+        failed_slots = [
+            plan_slot_failure(idx, req.slots[idx], results[idx])
+            for idx in pending
+        ]
+    
+    # Only successful slots go into the plan, with meal prep properties
+    items = [
+        generation.finish_item(idx, result)
+        for idx, result in enumerate(results)
+        if not isinstance(result, BaseException)
+    ]
+    
+    # Log ingredient categories for debugging
+    print("\n=== SHOPPING LIST DEBUG - Ingredient Categories ===")
+    for item in items:
+        print(f"\nRecipe: {item.recipe.title}")
+        for ing in item.recipe.ingredients:
+            print(f"  - {ing.name}: category='{ing.category}'")
+    print("=== END SHOPPING LIST DEBUG ===\n")
+    
+    # Generate kits for meal prep groups
+    meal_prep_kits = await build_meal_prep_kits(items, req.language)
+    
+    return PlanResponse(
+        items=items,
+        meal_prep_kits=meal_prep_kits if meal_prep_kits else None,
+        failed_slots=failed_slots
+    )
+
+
+def wants_event_stream(request: Request) -> bool:
+    """SSE if the client asks for text/event-stream (or ?format=sse), else NDJSON."""
+    return (
+        "text/event-stream" in request.headers.get("Accept", "")
+        or request.query_params.get("format") == "sse"
+    )
+
+
+def format_stream_event(event: dict, sse: bool) -> str:
+    """Serialize one event as an SSE frame or an NDJSON line."""
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    if sse:
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def event_stream_response(events, sse: bool) -> StreamingResponse:
+    """Wrap an async iterator of event dicts in a non-buffered streaming response."""
+    async def body():
+        async for event in events:
+            yield format_stream_event(event, sse)
+    
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/ai/plan/stream")
+@limiter.limit("10/minute")
+async def ai_plan_stream(request: Request, req: PlanRequest):
+    """Streaming variant of /ai/plan.
+    
+    Emits a `preview` event with each slot's title as soon as it has been
+    streamed, one `item` event per slot once its recipe is generated and
+    marked (`slot_failed` for slots that could not be generated), then one
+    `kit` event per meal prep kit, then a `done` event. NDJSON by default,
+    SSE when the client accepts text/event-stream.
+    """
+    
+    async def events():
+        generation = await PlanGeneration.start(req)
+        previews = asyncio.Queue()
+        
+        def preview_title(idx: int):
+            def on_field(key: str, value: Any):
+                if key == "title":
+                    previews.put_nowait({"type": "preview", "slot_index": idx, "title": value})
+            return on_field
+        
+        tasks = {
+            asyncio.create_task(generation.generate_slot_with_retries(idx, preview_title(idx))): idx
+            for idx in range(len(req.slots))
+        }
+        items = {}
+        failed_slots = []
+        next_preview = asyncio.create_task(previews.get())
+        
+        try:
+            pending = set(tasks)
+            while pending:
+                done, _ = await asyncio.wait(pending | {next_preview}, return_when=asyncio.FIRST_COMPLETED)
+                if next_preview in done:
+                    done.discard(next_preview)
+                    yield next_preview.result()
+                    while not previews.empty():
+                        yield previews.get_nowait()
+                    next_preview = asyncio.create_task(previews.get())
+                pending -= done
+                for task in sorted(done, key=tasks.get):
+                    idx = tasks[task]
+                    if task.exception() is not None:
+                        failure = plan_slot_failure(idx, req.slots[idx], task.exception())
+                        failed_slots.append(failure)
+                        yield {"type": "slot_failed", **failure.model_dump(mode="json")}
+                    else:
+                        item = generation.finish_item(idx, task.result())
+                        items[idx] = item
+                        yield {"type": "item", "slot_index": idx, "item": item.model_dump(mode="json")}
+            
+            # Kits need every recipe of their group, so they come after the items
+            meal_prep_kits = await build_meal_prep_kits([items[idx] for idx in sorted(items)], req.language)
+            for kit in meal_prep_kits:
+                yield {"type": "kit", "kit": kit}
+            
+            yield {
+                "type": "done",
+                "item_count": len(items),
+                "failed_slots": [failure.model_dump(mode="json") for failure in failed_slots]
+            }
+        except Exception as e:
+            print(f"❌ Error streaming plan: {e}")
+            yield {"type": "error", "detail": str(e)}
+        finally:
+            # Client went away or we failed: stop paying for unfinished slots
+            next_preview.cancel()
+            for task in tasks:
+                task.cancel()
     
-    return PlanResponse(items=items, meal_prep_kits=meal_prep_kits if meal_prep_kits else None)
+    return event_stream_response(events(), wants_event_stream(request))
 
 
 class RegenerateMealRequest(BaseModel):
@@ -1769,6 +1654,7 @@ class RegenerateMealRequest(BaseModel):
 
 @app.post("/ai/regenerate-meal", response_model=Recipe)
 @limiter.limit("20/minute")
+@coalesce_requests(in_flight_requests, "regenerate_meal")
 async def regenerate_meal(request: Request, req: RegenerateMealRequest):
     """Regenerate a single meal with diversity."""
     
@@ -1823,8 +1709,18 @@ async def regenerate_meal(request: Request, req: RegenerateMealRequest):
 
 @app.post("/ai/recipe", response_model=Recipe)
 @limiter.limit("15/minute")
+@coalesce_requests(in_flight_requests, "recipe")
 async def ai_recipe(request: Request, req: RecipeRequest):
     """Generate a single recipe from a prompt using OpenAI (async)."""
+    return await generate_recipe_from_idea(req)
+
+
+async def generate_recipe_from_idea(req: RecipeRequest) -> Recipe:
+    """Recipe for `req.idea` (shared by /ai/recipe and the chat add-meal flow).
+    
+    Ingredients are not marked on sale here: the chat flow fetches the flyer
+    deals once, while the recipe is generated, and marks them itself.
+    """
     
     # Build preferences text from preferences dict
     preferences_text = ""
@@ -1851,21 +1747,6 @@ async def ai_recipe(request: Request, req: RecipeRequest):
         if req.preferences.get("kidFriendly"):
             preferences_text += "Kid-friendly meals preferred. "
     
-    # Build protein portions guide
-    protein_portions_text = "\n\nCRITICAL - PROTEIN PORTIONS PER PERSON:\n"
-    protein_portions_text += "You MUST include adequate protein in each recipe following these guidelines:\n"
-    protein_portions_text += "- Chicken (breast, thigh): 150-200g per person (250-300g if bone-in)\n"
-    protein_portions_text += "- Beef (steak, roast): 180-220g per person\n"
-    protein_portions_text += "- Pork (chops, tenderloin): 160-200g per person\n"
-    protein_portions_text += "- Lamb: 180-200g per person\n"
-    protein_portions_text += "- Fish (fillet): 150-180g per person (300-350g if whole fish)\n"
-    protein_portions_text += "- Shrimp/Prawns: 120-150g per person\n"
-    protein_portions_text += "- Tofu: 120-150g per person\n"
-    protein_portions_text += "- Tempeh/Seitan: 100-130g per person\n"
-    protein_portions_text += "- Eggs: 2-3 large eggs per person\n"
-    protein_portions_text += "- Ground meat (beef, pork, chicken): 150-180g per person\n"
-    protein_portions_text += "These portions ensure adequate protein intake for a satisfying meal.\n"
-    
     # Language-specific handling
     if req.language == "en":
         constraints_text = ""
@@ -1882,51 +1763,11 @@ async def ai_recipe(request: Request, req: RecipeRequest):
         unit_system = "metric (grams, ml)" if req.units == "METRIC" else "imperial (oz, cups)"
         
         prompt = f"""Generate a recipe in English based on this idea: "{req.idea}"
-        
-For {req.servings} people.
-{constraints_text}
 
-CRITICAL - PREPARATION STEPS: The recipe MUST start with detailed preparation steps:
-- First steps should describe ALL ingredient preparations (cutting, dicing, chopping, grating, etc.)
-- Be specific about cuts: "dice carrots into 1cm cubes", "grate 100g cheese", "finely chop 2 onions"
-- Include prep for ALL ingredients before cooking steps
-- Then include cooking/assembly steps with exact times, temperatures, and techniques
-
-Return ONLY a valid JSON object with this exact structure:
-{{
-    "title": "Recipe name",
-    "servings": {req.servings},
-    "total_minutes": 30,
-    "ingredients": [
-        {{"name": "ingredient", "quantity": 200, "unit": "g", "category": "vegetables"}}
-    ],
-    "steps": [
-        "Preparation: Dice the carrots into 1cm cubes. Finely chop the onion...",
-        "Heat oil in a large pan...",
-        "Add ingredients and cook..."
-    ],
-    "equipment": ["pan", "pot"],
-    "tags": ["easy"],
-    "calories_per_serving": 450,
-    "protein_per_serving": 35,
-    "carbs_per_serving": 40,
-    "fat_per_serving": 15
-}}
-
-CRITICAL - NUTRITIONAL CALCULATION:
-Calculate approximate nutritional values per serving using USDA database knowledge:
-- calories_per_serving: Total calories per serving (integer)
-- protein_per_serving: Protein in grams per serving (integer)
-- carbs_per_serving: Carbohydrates in grams per serving (integer)
-- fat_per_serving: Fat in grams per serving (integer)
-Base calculations on the actual ingredients and quantities in the recipe.
-
-Use the {unit_system} system.
-Categories: vegetables, fruits, meats, fish, dairy, dry goods, condiments, canned goods.
+For {req.servings} people ("servings": {req.servings}).
+{constraints_text}{preferences_text}
 
-IMPORTANT: Generate at least 5-7 detailed steps with EXPLICIT preparation steps at the beginning."""
-        
-        system_prompt = "You are a creative and expert chef who generates unique and detailed recipes in JSON."
+Use the {unit_system} system."""
         
     else:
         # French version
@@ -1945,71 +1786,21 @@ IMPORTANT: Generate at least 5-7 detailed steps with EXPLICIT preparation steps
         
         prompt = f"""Génère une recette en français basée sur cette idée: "{req.idea}"
 
-Pour {req.servings} personnes.
-{constraints_text}{preferences_text}{protein_portions_text}
-
-CRITIQUE - ÉTAPES DE PRÉPARATION: La recette DOIT commencer par des étapes de préparation détaillées:
-- Les premières étapes doivent décrire TOUTES les préparations d'ingrédients (couper, émincer, hacher, râper, etc.)
-- Sois précis sur les coupes: "couper les carottes en dés de 1cm", "râper 100g de fromage", "émincer finement 2 oignons"
-- Inclure la préparation de TOUS les ingrédients avant les étapes de cuisson
-- Ensuite inclure les étapes de cuisson/assemblage avec temps exacts, températures et techniques
-
-Retourne UNIQUEMENT un objet JSON valide avec cette structure exacte:
-{{
-    "title": "Nom de la recette",
-    "servings": {req.servings},
-    "total_minutes": 30,
-    "ingredients": [
-        {{"name": "ingrédient", "quantity": 200, "unit": "g", "category": "légumes"}}
-    ],
-    "steps": [
-        "Préparation: Couper les carottes en dés de 1cm. Émincer finement l'oignon...",
-        "Faire chauffer l'huile dans une grande poêle...",
-        "Ajouter les ingrédients et cuire..."
-    ],
-    "equipment": ["poêle", "casserole"],
-    "tags": ["facile"],
-    "calories_per_serving": 450,
-    "protein_per_serving": 35,
-    "carbs_per_serving": 40,
-    "fat_per_serving": 15
-}}
-
-CRITIQUE - CALCUL NUTRITIONNEL:
-Calcule les valeurs nutritionnelles approximatives par portion en utilisant tes connaissances de la base USDA:
-- calories_per_serving: Calories totales par portion (entier)
-- protein_per_serving: Protéines en grammes par portion (entier)
-- carbs_per_serving: Glucides en grammes par portion (entier)
-- fat_per_serving: Lipides en grammes par portion (entier)
-Base les calculs sur les ingrédients et quantités réels de la recette.
-
-Utilise le système {unit_system}.
-Catégories: légumes, fruits, viandes, poissons, produits laitiers, sec, condiments, conserves.
+Pour {req.servings} personnes ("servings": {req.servings}).
+{constraints_text}{preferences_text}
 
-IMPORTANT: Génère au moins 5-7 étapes détaillées avec des étapes de préparation EXPLICITES au début."""
+Utilise le système {unit_system}."""
 
     try:
-        response = await client.chat.completions.create(
+        generated = await llm.generate(
+            "recipe",
+            GeneratedRecipe,
             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Tu es un chef cuisinier créatif et expert qui génère des recettes uniques et détaillées en JSON."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=recipe_prompts.messages("recipe", req.language, prompt),
             temperature=1.0,  # Maximum creativity and diversity
             max_tokens=1200  # Increased for detailed steps
         )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        recipe_data = json.loads(content)
-        return Recipe(**recipe_data)
+        return generated.to_recipe(req.language)
         
     except Exception as e:
         print(f"Error generating recipe: {e}")
@@ -2027,6 +1818,7 @@ class RecipeFromTitleRequest(BaseModel):
 
 @app.post("/ai/recipe-from-title", response_model=Recipe)
 @limiter.limit("15/minute")
+@coalesce_requests(in_flight_requests, "recipe_from_title")
 async def ai_recipe_from_title(request: Request, req: RecipeFromTitleRequest):
     """Generate a complete recipe from just a title using OpenAI."""
     
@@ -2060,21 +1852,6 @@ async def ai_recipe_from_title(request: Request, req: RecipeFromTitleRequest):
         if req.preferences.get("kidFriendly"):
             preferences_text += "Kid-friendly meals preferred. "
     
-    # Build protein portions guide
-    protein_portions_text = "\n\nCRITICAL - PROTEIN PORTIONS PER PERSON:\n"
-    protein_portions_text += "You MUST include adequate protein in each recipe following these guidelines:\n"
-    protein_portions_text += "- Chicken (breast, thigh): 150-200g per person (250-300g if bone-in)\n"
-    protein_portions_text += "- Beef (steak, roast): 180-220g per person\n"
-    protein_portions_text += "- Pork (chops, tenderloin): 160-200g per person\n"
-    protein_portions_text += "- Lamb: 180-200g per person\n"
-    protein_portions_text += "- Fish (fillet): 150-180g per person (300-350g if whole fish)\n"
-    protein_portions_text += "- Shrimp/Prawns: 120-150g per person\n"
-    protein_portions_text += "- Tofu: 120-150g per person\n"
-    protein_portions_text += "- Tempeh/Seitan: 100-130g per person\n"
-    protein_portions_text += "- Eggs: 2-3 large eggs per person\n"
-    protein_portions_text += "- Ground meat (beef, pork, chicken): 150-180g per person\n"
-    protein_portions_text += "These portions ensure adequate protein intake for a satisfying meal.\n"
-    
     # Language-specific handling
     if req.language == "en":
         constraints_text = ""
@@ -2092,54 +1869,15 @@ async def ai_recipe_from_title(request: Request, req: RecipeFromTitleRequest):
         
         prompt = f"""Generate a complete recipe in English with this exact title: "{req.title}"
 
-For {req.servings} people.
-{constraints_text}{preferences_text}{protein_portions_text}
-
-CRITICAL - PREPARATION STEPS: The recipe MUST start with detailed preparation steps:
-- First steps should describe ALL ingredient preparations (cutting, dicing, chopping, grating, etc.)
-- Be specific about cuts: "dice carrots into 1cm cubes", "grate 100g cheese", "finely chop 2 onions"
-- Include prep for ALL ingredients before cooking steps
-- Then include cooking/assembly steps with exact times, temperatures, and techniques
-
-Return ONLY a valid JSON object with this exact structure:
-{{
-    "title": "{req.title}",
-    "servings": {req.servings},
-    "total_minutes": 30,
-    "ingredients": [
-        {{"name": "ingredient", "quantity": 200, "unit": "g", "category": "vegetables"}}
-    ],
-    "steps": [
-        "Preparation: Dice the carrots into 1cm cubes. Finely chop the onion...",
-        "Heat oil in a large pan...",
-        "Add ingredients and cook..."
-    ],
-    "equipment": ["pan", "pot"],
-    "tags": ["easy"],
-    "calories_per_serving": 450,
-    "protein_per_serving": 35,
-    "carbs_per_serving": 40,
-    "fat_per_serving": 15
-}}
-
-CRITICAL - NUTRITIONAL CALCULATION:
-Calculate approximate nutritional values per serving using USDA database knowledge:
-- calories_per_serving: Total calories per serving (integer)
-- protein_per_serving: Protein in grams per serving (integer)
-- carbs_per_serving: Carbohydrates in grams per serving (integer)
-- fat_per_serving: Fat in grams per serving (integer)
-Base calculations on the actual ingredients and quantities in the recipe.
+For {req.servings} people ("servings": {req.servings}).
+{constraints_text}{preferences_text}
 
 Use the {unit_system} system.
-Categories: vegetables, fruits, meats, fish, dairy, dry goods, condiments, canned goods.
 
 IMPORTANT: 
 - Use EXACTLY the title provided: "{req.title}"
-- Generate at least 5-7 detailed steps with EXPLICIT preparation steps at the beginning
 - Create realistic and appropriate ingredients for this dish"""
         
-        system_prompt = "You are a creative and expert chef who generates unique and detailed recipes in JSON based on dish names."
-        
     else:
         # French version
         constraints_text = ""
@@ -2157,87 +1895,29 @@ IMPORTANT:
         
         prompt = f"""Génère une recette complète en français avec ce titre exact: "{req.title}"
 
-Pour {req.servings} personnes.
-{constraints_text}{preferences_text}{protein_portions_text}
-
-CRITIQUE - ÉTAPES DE PRÉPARATION: La recette DOIT commencer par des étapes de préparation détaillées:
-- Les premières étapes doivent décrire TOUTES les préparations d'ingrédients (couper, émincer, hacher, râper, etc.)
-- Sois précis sur les coupes: "couper les carottes en dés de 1cm", "râper 100g de fromage", "émincer finement 2 oignons"
-- Inclure la préparation de TOUS les ingrédients avant les étapes de cuisson
-- Ensuite inclure les étapes de cuisson/assemblage avec temps exacts, températures et techniques
-
-Retourne UNIQUEMENT un objet JSON valide avec cette structure exacte:
-{{
-    "title": "{req.title}",
-    "servings": {req.servings},
-    "total_minutes": 30,
-    "ingredients": [
-        {{"name": "ingrédient", "quantity": 200, "unit": "g", "category": "légumes"}}
-    ],
-    "steps": [
-        "Préparation: Couper les carottes en dés de 1cm. Émincer finement l'oignon...",
-        "Faire chauffer l'huile dans une grande poêle...",
-        "Ajouter les ingrédients et cuire..."
-    ],
-    "equipment": ["poêle", "casserole"],
-    "tags": ["facile"],
-    "calories_per_serving": 450,
-    "protein_per_serving": 35,
-    "carbs_per_serving": 40,
-    "fat_per_serving": 15
-}}
-
-CRITIQUE - CALCUL NUTRITIONNEL:
-Calcule les valeurs nutritionnelles approximatives par portion en utilisant tes connaissances de la base USDA:
-- calories_per_serving: Calories totales par portion (entier)
-- protein_per_serving: Protéines en grammes par portion (entier)
-- carbs_per_serving: Glucides en grammes par portion (entier)
-- fat_per_serving: Lipides en grammes par portion (entier)
-Base les calculs sur les ingrédients et quantités réels de la recette.
+Pour {req.servings} personnes ("servings": {req.servings}).
+{constraints_text}{preferences_text}
 
 Utilise le système {unit_system}.
-Catégories: légumes, fruits, viandes, poissons, produits laitiers, sec, condiments, conserves.
 
 IMPORTANT: 
 - Utilise EXACTEMENT le titre fourni: "{req.title}"
-- Génère au moins 5-7 étapes détaillées avec des étapes de préparation EXPLICITES au début
 - Crée des ingrédients réalistes et appropriés pour ce plat"""
-        
-        system_prompt = "Tu es un chef cuisinier créatif et expert qui génère des recettes uniques et détaillées en JSON à partir de noms de plats."
 
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1200
-        )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        recipe_data = json.loads(content)
+    try:
+        generated = await llm.generate(
+            "recipe_from_title",
+            GeneratedRecipe,
+            model="gpt-4o",
+            messages=recipe_prompts.messages("recipe_from_title", req.language, prompt),
+            temperature=0.7,
+            max_tokens=1200
+        )
         
         # Ensure the title matches exactly what was requested
-        recipe_data["title"] = req.title
-        
-        # Ensure all ingredients have required fields
-        for ingredient in recipe_data.get("ingredients", []):
-            if "unit" not in ingredient or not ingredient.get("unit"):
-                ingredient["unit"] = "unité" if req.language == "fr" else "unit"
-            if "category" not in ingredient or not ingredient.get("category"):
-                ingredient["category"] = "autre" if req.language == "fr" else "other"
+        generated.title = req.title
         
-        return Recipe(**recipe_data)
+        return generated.to_recipe(req.language)
         
     except Exception as e:
         print(f"Error generating recipe from title: {e}")
@@ -2255,6 +1935,7 @@ class RecipeFromImageRequest(BaseModel):
 
 @app.post("/ai/recipe-from-image", response_model=Recipe)
 @limiter.limit("10/minute")
+@coalesce_requests(in_flight_requests, "recipe_from_image")
 async def ai_recipe_from_image(request: Request, req: RecipeFromImageRequest):
     """Generate a recipe from a fridge photo using OpenAI Vision."""
     
@@ -2461,7 +2142,9 @@ Catégories: légumes, fruits, viandes, poissons, produits laitiers, sec, condim
 
     try:
         # Use OpenAI Vision API to analyze the image
-        response = await client.chat.completions.create(
+        generated = await llm.generate(
+            "recipe_from_image",
+            GeneratedRecipe,
             model="gpt-4o",
             messages=[
                 {
@@ -2488,26 +2171,7 @@ Catégories: légumes, fruits, viandes, poissons, produits laitiers, sec, condim
             temperature=0.9,
             max_tokens=1500
         )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        recipe_data = json.loads(content)
-        
-        # Ensure all ingredients have required fields
-        for ingredient in recipe_data.get("ingredients", []):
-            if "unit" not in ingredient or not ingredient.get("unit"):
-                ingredient["unit"] = "unité" if req.language == "fr" else "unit"
-            if "category" not in ingredient or not ingredient.get("category"):
-                ingredient["category"] = "autre" if req.language == "fr" else "other"
-        
-        return Recipe(**recipe_data)
+        return generated.to_recipe(req.language)
         
     except Exception as e:
         print(f"Error generating recipe from image: {e}")
@@ -2518,6 +2182,10 @@ Catégories: légumes, fruits, viandes, poissons, produits laitiers, sec, condim
 
 class ChatRequest(BaseModel):
     message: str
+    # With a conversation_id (from a previous ChatResponse), send only the new
+    # messages and the user_context keys that changed (null removes a key)
+    conversation_id: Optional[str] = None
+    start_session: bool = False  # Keep this conversation server-side and return its conversation_id
     conversation_history: List[dict] = Field(default_factory=list)
     user_context: dict = Field(default_factory=dict)
     language: str = "fr"
@@ -2533,6 +2201,8 @@ class ChatResponse(BaseModel):
     modification_type: Optional[str] = None  # "replace_ingredient", "adjust_portions", "add_meal"
     modification_metadata: Optional[dict] = None  # Additional info (e.g., weekday, meal_type for add_meal)
     member_data: Optional[dict] = None  # For adding family members
+    conversation_id: Optional[str] = None  # Server-side session to reference in the next request (opted-in sessions only)
+    session_expired: bool = False  # Session unknown: resend the full history and user_context next time
 
 
 class AddMemberRequest(BaseModel):
@@ -2548,33 +2218,6 @@ class AddMemberResponse(BaseModel):
     member: Optional[dict] = None
 
 
-def detect_agent_mode(message: str, conversation_history: List[dict]) -> str:
-    """Detect which agent mode should be used based on the message context."""
-    message_lower = message.lower()
-    
-    # Check for recipe Q&A keywords
-    recipe_qa_keywords = [
-        # French
-        'recette', 'substituer', 'remplacer', 'conversion', 'convertir', 'portion', 'portions',
-        'ingrédient', 'ingrédients', 'étape', 'étapes', 'cuisson', 'température',
-        'comment faire', 'comment cuire', 'combien de', 'ajuster',
-        # English
-        'recipe', 'substitute', 'replace', 'conversion', 'convert', 'portion', 'portions',
-        'ingredient', 'ingredients', 'step', 'steps', 'cooking', 'temperature',
-        'how to', 'how do i', 'how much', 'adjust'
-    ]
-    
-    # Check conversation history for context (look at last 5 messages for better context)
-    has_recipe_context = any('recipe' in str(msg).lower() or 'recette' in str(msg).lower() 
-                            for msg in conversation_history[-5:] if msg)
-    
-    # Decision logic - ONLY recipe_qa and nutrition_coach modes
-    if any(keyword in message_lower for keyword in recipe_qa_keywords) or has_recipe_context:
-        return "recipe_qa"
-    else:
-        return "nutrition_coach"
-
-
 def detect_member_addition_intent(message: str, conversation_history: List[dict]) -> bool:
     """Detect if the user wants to add a family member."""
     message_lower = message.lower()
@@ -2722,203 +2365,228 @@ def extract_member_data_from_conversation(conversation_history: List[dict], curr
     return None
 
 
-def detect_recipe_modification_request(message: str, user_context: dict) -> tuple:
+def detect_recipe_modification_request(message: str, user_context: dict, intents: Optional[ChatIntents] = None, recipe_index: Optional[RecipeTitleIndex] = None) -> tuple:
     """Detect if user is requesting a recipe modification and extract details.
     Returns: (is_modification, is_question, recipe_to_modify, message, modification_type, weekday, meal_type)
     """
-    message_lower = message.lower()
-    
-    # Check if this is a QUESTION about possibility (vs a request for action)
-    # Questions about possibility: "Est-ce que JE PEUX...?", "Can I...?"
-    # Requests for action: "Peux-TU...?", "Can YOU...?", "Remplace...", etc.
-    
-    question_about_possibility_fr = ['est-ce que', 'est ce que', 'puis-je', 'peux-je', 'peut-on', 'pourrais-je', 'devrais-je', 'dois-je']
-    question_about_possibility_en = ['can i', 'could i', 'should i', 'is it possible', 'would it be', 'may i']
-    
-    # Request for action indicators (the agent should DO something)
-    action_request_fr = ['peux-tu', 'peux tu', 'peut-tu', 'peut tu', 'pourrais-tu', 'pourrais tu', 'veux-tu', 'veux tu']
-    action_request_en = ['can you', 'could you', 'would you', 'will you', 'please']
-    
-    # Check if it's a question about possibility
-    is_question = any(indicator in message_lower for indicator in question_about_possibility_fr + question_about_possibility_en)
-    
-    # If it's a request for action, treat as command (not a question)
-    is_action_request = any(indicator in message_lower for indicator in action_request_fr + action_request_en)
-    if is_action_request:
-        is_question = False  # Override - this is a command, not a question
-    
-    # Keywords indicating modification
-    modification_keywords = {
-        'fr': ['remplace', 'remplacer', 'substitue', 'substituer', 'change', 'changer', 'modifie', 'modifier', 'ajuste', 'ajuster', 'double', 'triple'],
-        'en': ['replace', 'substitute', 'change', 'modify', 'adjust', 'swap', 'double', 'triple']
-    }
-    
-    is_modification = any(
-        keyword in message_lower 
-        for keywords in modification_keywords.values() 
-        for keyword in keywords
-    )
+    if intents is None:
+        intents = intent_engine.classify(message)
     
-    if not is_modification:
+    if not intents.modification:
         return (False, False, None, None, None, None, None)
     
-    # Determine modification type
-    modification_type = "replace_ingredient"  # default
-    
-    # Check for portion adjustment
-    portion_keywords = ['portion', 'portions', 'servings', 'double', 'triple', 'moitié', 'half', 'personnes', 'people']
-    if any(keyword in message_lower for keyword in portion_keywords):
-        modification_type = "adjust_portions"
+    # Find which recipe from context: plan, recent and favorite recipes ranked together
+    if recipe_index is None:
+        recipe_index = RecipeTitleIndex(user_context)
+    candidates = recipe_index.search(message)
+    if candidates:
+        print(f"🔎 Recipe candidates: {[(c.recipe.get('title'), c.weekday, c.score) for c in candidates]}")
     
-    # Try to find which recipe from context
-    recipe_to_modify = None
-    found_weekday = None
-    found_meal_type = None
-    
-    # Check current plan recipes
-    if user_context.get("current_plan"):
-        for day, meals in user_context["current_plan"].items():
-            for meal in meals:
-                recipe_title = meal.get("title", "").lower()
-                # Check if recipe title is mentioned in message
-                if recipe_title in message_lower or any(word in recipe_title for word in message_lower.split() if len(word) > 4):
-                    recipe_to_modify = meal
-                    found_weekday = day
-                    found_meal_type = meal.get("meal_type")
-                    break
-            if recipe_to_modify:
-                break
+    recipe_to_modify = found_weekday = found_meal_type = None
+    if candidates:
+        best = candidates[0]
+        recipe_to_modify, found_weekday, found_meal_type = best.recipe, best.weekday, best.meal_type
     
-    # If not found in plan, check recent recipes
-    if not recipe_to_modify and user_context.get("recent_recipes"):
-        for recipe in user_context["recent_recipes"]:
-            recipe_title = recipe.get("title", "").lower()
-            if recipe_title in message_lower or any(word in recipe_title for word in message_lower.split() if len(word) > 4):
-                recipe_to_modify = recipe
-                break
+    return (True, intents.question, recipe_to_modify, message, intents.modification_type, found_weekday, found_meal_type)
+
+
+# Set by /ai/chat/stream: queue that receives the reply's text deltas as they arrive
+chat_delta_queue: contextvars.ContextVar[Optional[asyncio.Queue]] = contextvars.ContextVar("chat_delta_queue", default=None)
+
+
+async def generate_chat_reply(messages: List[dict], stream_deltas: bool = True) -> str:
+    """Main chat completion for the agent's reply.
     
-    # If not found, check favorites
-    if not recipe_to_modify and user_context.get("favorite_recipes"):
-        for recipe in user_context["favorite_recipes"]:
-            recipe_title = recipe.get("title", "").lower()
-            if recipe_title in message_lower or any(word in recipe_title for word in message_lower.split() if len(word) > 4):
-                recipe_to_modify = recipe
-                break
+    Under /ai/chat/stream (and when `stream_deltas` is set) the reply is
+    streamed from OpenAI and each delta is forwarded to the client.
+    """
+    queue = chat_delta_queue.get()
+    if queue is None or not stream_deltas:
+        response = await llm.chat_completion(
+            "chat",
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=800
+        )
+        return response.choices[0].message.content.strip()
     
-    return (True, is_question, recipe_to_modify, message, modification_type, found_weekday, found_meal_type)
+    parts = []
+    async for delta in llm.chat_completion_stream(
+        "chat",
+        model="gpt-4o",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=800
+    ):
+        parts.append(delta)
+        await queue.put(delta)
+    return "".join(parts).strip()
 
 
-def detect_add_meal_request(message: str) -> tuple:
-    """Detect if user wants to add a meal to the plan.
-    Returns: (is_add_meal, meal_type, weekday)
-    """
-    message_lower = message.lower()
+@app.post("/ai/chat", response_model=ChatResponse)
+@limiter.limit("30/minute")
+async def ai_chat(request: Request, req: ChatRequest):
+    """Conversational agent with 3 modes: onboarding, recipe Q&A, and nutrition coach."""
+    req, session, expired = await resume_chat_session(req)
+    return await run_chat_turn(req, session, expired)
+
+
+@app.post("/ai/chat/stream")
+@limiter.limit("30/minute")
+async def ai_chat_stream(request: Request, req: ChatRequest):
+    """Streaming variant of /ai/chat (SSE).
     
-    # Keywords indicating meal addition
-    add_keywords_fr = ['ajoute', 'ajouter', 'crée', 'créer', 'génère', 'générer', 'propose', 'proposer']
-    add_keywords_en = ['add', 'create', 'generate', 'suggest', 'propose']
+    Sends `delta` events with the reply text as OpenAI generates it, then a
+    `final` event carrying every ChatResponse field. The final `reply` is
+    authoritative: add-meal and modification flows replace the generated
+    text, and their replies are not streamed.
+    """
+    req, session, expired = await resume_chat_session(req)
     
-    is_add_meal = any(keyword in message_lower for keyword in add_keywords_fr + add_keywords_en)
+    # Premium check up front so non-premium users get a plain 403, not a stream
+    if not req.user_context.get("has_premium", False):
+        raise HTTPException(status_code=403, detail="Premium subscription required for conversational agent")
     
-    if not is_add_meal:
-        return (False, None, None)
+    queue: asyncio.Queue = asyncio.Queue()
     
-    # Extract meal type
-    meal_type = None
-    meal_keywords = {
-        'BREAKFAST': ['breakfast', 'petit-déjeuner', 'petit déjeuner', 'déjeuner'],
-        'LUNCH': ['lunch', 'dîner', 'midi'],
-        'DINNER': ['dinner', 'souper', 'soir', 'diner']
-    }
+    async def run_chat() -> ChatResponse:
+        chat_delta_queue.set(queue)  # Task-local: the task runs in a copy of our context
+        return await run_chat_turn(req, session, expired)
     
-    for mtype, keywords in meal_keywords.items():
-        if any(keyword in message_lower for keyword in keywords):
-            meal_type = mtype
-            break
-    
-    # Extract weekday
-    weekday = None
-    weekday_keywords = {
-        'Mon': ['lundi', 'monday', 'mon'],
-        'Tue': ['mardi', 'tuesday', 'tue'],
-        'Wed': ['mercredi', 'wednesday', 'wed'],
-        'Thu': ['jeudi', 'thursday', 'thu'],
-        'Fri': ['vendredi', 'friday', 'fri'],
-        'Sat': ['samedi', 'saturday', 'sat'],
-        'Sun': ['dimanche', 'sunday', 'sun']
-    }
+    async def events():
+        task = asyncio.create_task(run_chat())
+        try:
+            while True:
+                get_delta = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get_delta, task}, return_when=asyncio.FIRST_COMPLETED)
+                if get_delta in done:
+                    yield {"type": "delta", "text": get_delta.result()}
+                    continue
+                get_delta.cancel()
+                # Deltas queued just before the reply finished
+                while not queue.empty():
+                    yield {"type": "delta", "text": queue.get_nowait()}
+                break
+            
+            try:
+                response = task.result()
+            except HTTPException as e:
+                yield {"type": "error", "status_code": e.status_code, "detail": e.detail}
+                return
+            except Exception as e:
+                yield {"type": "error", "status_code": 500, "detail": str(e)}
+                return
+            yield {"type": "final", **response.model_dump(mode="json")}
+        finally:
+            task.cancel()
     
-    for day, keywords in weekday_keywords.items():
-        if any(keyword in message_lower for keyword in keywords):
-            weekday = day
-            break
+    return event_stream_response(events(), sse=True)
+
+
+async def resume_chat_session(req: ChatRequest):
+    """Apply the request's deltas to its chat session.
     
-    return (is_add_meal, meal_type, weekday)
+    Returns `(req, session, expired)` where `req` now carries the session's
+    full history and user context.
+    """
+    session, expired = await chat_sessions.resume(
+        req.conversation_id, req.conversation_history, req.user_context, start_session=req.start_session
+    )
+    req = req.model_copy(update={
+        "conversation_history": list(session.history),
+        "user_context": session.user_context
+    })
+    return req, session, expired
+
+
+async def run_chat_turn(req: ChatRequest, session: ConversationSession, expired: bool) -> ChatResponse:
+    """Answer one message and record the turn in its session."""
+    response = await handle_chat_message(req, session)
+    await chat_sessions.record_turn(session, req.message, response.reply)
+    if session.persistent:
+        response.conversation_id = session.conversation_id
+    response.session_expired = expired
+    return response
 
 
-def detect_user_confirmation(message: str, language: str) -> bool:
-    """Detect if user is confirming a pending action."""
-    message_lower = message.lower().strip()
+def render_chat_context(user_context: dict, language: str) -> str:
+    """Context block appended to the chat system prompt (preferences and recipes)."""
+    context_info = ""
     
-    confirmation_keywords_fr = ['oui', 'ok', 'confirme', 'confirm', 'accepte', 'accept', 'd\'accord', 'daccord', 'parfait', 'vas-y', 'vas y', 'go']
-    confirmation_keywords_en = ['yes', 'ok', 'confirm', 'accept', 'go ahead', 'sure', 'perfect', 'agreed']
+    if user_context.get("preferences"):
+        prefs = user_context["preferences"]
+        context_info += f"\n\nUser preferences: {prefs}"
     
-    all_keywords = confirmation_keywords_fr + confirmation_keywords_en
+    # Format current plan recipes with full details IN CHRONOLOGICAL ORDER
+    if user_context.get("current_plan"):
+        # Define day order
+        day_order = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+        day_names_fr = {
+            "Mon": "Lundi", "Tue": "Mardi", "Wed": "Mercredi", 
+            "Thu": "Jeudi", "Fri": "Vendredi", "Sat": "Samedi", "Sun": "Dimanche"
+        }
+        day_names_en = {
+            "Mon": "Monday", "Tue": "Tuesday", "Wed": "Wednesday",
+            "Thu": "Thursday", "Fri": "Friday", "Sat": "Saturday", "Sun": "Sunday"
+        }
+        
+        context_info += "\n\n📅 PLAN ACTUEL - Vous avez ACCÈS COMPLET à ces recettes:\n"
+        
+        # Sort days chronologically
+        sorted_days = sorted(
+            user_context["current_plan"].items(),
+            key=lambda x: day_order.index(x[0]) if x[0] in day_order else 999
+        )
+        
+        for day_abbr, meals in sorted_days:
+            # Use full day name
+            day_name = day_names_fr.get(day_abbr, day_abbr) if language == "fr" else day_names_en.get(day_abbr, day_abbr)
+            context_info += f"\n{day_name}:"
+            for meal in meals:
+                meal_type_fr = {"BREAKFAST": "Déjeuner", "LUNCH": "Dîner", "DINNER": "Souper"}.get(meal.get('meal_type', 'Repas'), meal.get('meal_type', 'Repas'))
+                meal_type_en = {"BREAKFAST": "Breakfast", "LUNCH": "Lunch", "DINNER": "Dinner"}.get(meal.get('meal_type', 'Meal'), meal.get('meal_type', 'Meal'))
+                meal_type_display = meal_type_fr if language == "fr" else meal_type_en
+                
+                context_info += f"\n  • {meal_type_display}: {meal.get('title', 'Unknown')}"
+                if meal.get('servings') and meal.get('total_minutes'):
+                    context_info += f" ({meal.get('servings')} portions, {meal.get('total_minutes')} min)"
     
-    # Check for exact matches or if message starts with confirmation
-    is_confirmation = (
-        message_lower in all_keywords or
-        any(message_lower.startswith(keyword) for keyword in all_keywords)
-    )
+    if user_context.get("recent_recipes"):
+        recipes = user_context["recent_recipes"]
+        context_info += f"\n\n📝 Recent recipes (access available): {len(recipes)} recipes"
+        for idx, recipe in enumerate(recipes[:5]):  # Show first 5
+            context_info += f"\n  {idx+1}. {recipe.get('title', 'Unknown')} ({recipe.get('servings', 'N/A')} servings)"
     
-    return is_confirmation
-
-
-def detect_plan_display_request(message: str) -> bool:
-    """Detect if user wants to see their meal plan."""
-    message_lower = message.lower()
+    if user_context.get("favorite_recipes"):
+        favorites = user_context["favorite_recipes"]
+        context_info += f"\n\n⭐ Favorite recipes (access available): {len(favorites)} recipes"
+        for idx, recipe in enumerate(favorites[:5]):  # Show first 5
+            context_info += f"\n  {idx+1}. {recipe.get('title', 'Unknown')} ({recipe.get('servings', 'N/A')} servings)"
     
-    # Keywords indicating plan display request
-    plan_keywords_fr = ['mon plan', 'le plan', 'mon menu', 'le menu', 'semaine', 'cette semaine', 'plan actuel', 'plan de la semaine', 'mes repas', 'repas de la semaine']
-    plan_keywords_en = ['my plan', 'the plan', 'my menu', 'the menu', 'week', 'this week', 'current plan', 'week plan', 'my meals', 'week meals']
-    
-    # Question words
-    question_words_fr = ['quel', 'quelle', 'quels', 'quelles', 'montre', 'voir', 'affiche', 'afficher']
-    question_words_en = ['what', 'which', 'show', 'display', 'see', 'view']
-    
-    # Check if asking about the plan
-    is_plan_request = (
-        any(keyword in message_lower for keyword in plan_keywords_fr + plan_keywords_en) and
-        (any(q in message_lower for q in question_words_fr + question_words_en) or 
-         message_lower.endswith('?') or 
-         message_lower.startswith('montre') or 
-         message_lower.startswith('show'))
-    )
+    if not context_info.strip():
+        context_info = "\n\nNo recipe data currently available in context."
     
-    return is_plan_request
+    return context_info
 
 
-@app.post("/ai/chat", response_model=ChatResponse)
-@limiter.limit("30/minute")
-async def ai_chat(request: Request, req: ChatRequest):
-    """Conversational agent with 3 modes: onboarding, recipe Q&A, and nutrition coach."""
+async def handle_chat_message(req: ChatRequest, session: Optional[ConversationSession] = None) -> ChatResponse:
+    """Process one chat message (shared by /ai/chat and /ai/chat/stream)."""
     
     # Check if user has premium access
     has_premium = req.user_context.get("has_premium", False)
     if not has_premium:
         raise HTTPException(status_code=403, detail="Premium subscription required for conversational agent")
     
-    # Check if user wants to see their plan - PRIORITY CHECK
-    is_plan_display = detect_plan_display_request(req.message)
-    
-    # Check if user is confirming a previous action
-    is_confirmation = detect_user_confirmation(req.message, req.language)
-    
-    # Check if this is a recipe modification request
-    is_modification, is_question, recipe_to_modify, modification_request, modification_type, found_weekday, found_meal_type = detect_recipe_modification_request(req.message, req.user_context)
-    
-    # Check if this is an add meal request - CRITICAL for meal plan integration
-    is_add_meal, meal_type, weekday = detect_add_meal_request(req.message)
+    # Classify the message once: plan display (PRIORITY CHECK), confirmation of a
+    # previous action, recipe modification, add meal (CRITICAL for meal plan
+    # integration) and agent mode
+    intents = intent_engine.classify(req.message, req.conversation_history)
+    recipe_index = RecipeTitleIndex(req.user_context)
+    is_plan_display = intents.plan_display
+    is_confirmation = intents.confirmation
+    is_modification, is_question, recipe_to_modify, modification_request, modification_type, found_weekday, found_meal_type = detect_recipe_modification_request(req.message, req.user_context, intents, recipe_index)
+    is_add_meal, meal_type, weekday = intents.add_meal, intents.meal_type, intents.weekday
     
     print(f"\n🔍 ADD MEAL DETECTION:")
     print(f"  is_add_meal: {is_add_meal}")
@@ -2926,8 +2594,7 @@ async def ai_chat(request: Request, req: ChatRequest):
     print(f"  weekday: {weekday}")
     print(f"  message: {req.message}")
     
-    # Detect which mode to use
-    detected_mode = detect_agent_mode(req.message, req.conversation_history)
+    detected_mode = intents.agent_mode
     
     # Build system prompt based on mode
     if detected_mode == "recipe_qa":
@@ -3061,76 +2728,23 @@ Tu NE PEUX PAS fournir:
 
 Garde tes conseils généraux et basés sur les preuves. Pour les calculs caloriques, utilise des valeurs de référence nutritionnelles standard."""
     
-    # Build context from user data with detailed recipe information
-    context_info = ""
-    
-    if req.user_context.get("preferences"):
-        prefs = req.user_context["preferences"]
-        context_info += f"\n\nUser preferences: {prefs}"
-    
-    # Format current plan recipes with full details IN CHRONOLOGICAL ORDER
-    if req.user_context.get("current_plan"):
-        # Define day order
-        day_order = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-        day_names_fr = {
-            "Mon": "Lundi", "Tue": "Mardi", "Wed": "Mercredi", 
-            "Thu": "Jeudi", "Fri": "Vendredi", "Sat": "Samedi", "Sun": "Dimanche"
-        }
-        day_names_en = {
-            "Mon": "Monday", "Tue": "Tuesday", "Wed": "Wednesday",
-            "Thu": "Thursday", "Fri": "Friday", "Sat": "Saturday", "Sun": "Sunday"
-        }
-        
-        context_info += "\n\n📅 PLAN ACTUEL - Vous avez ACCÈS COMPLET à ces recettes:\n"
-        
-        # Sort days chronologically
-        sorted_days = sorted(
-            req.user_context["current_plan"].items(),
-            key=lambda x: day_order.index(x[0]) if x[0] in day_order else 999
-        )
-        
-        for day_abbr, meals in sorted_days:
-            # Use full day name
-            day_name = day_names_fr.get(day_abbr, day_abbr) if req.language == "fr" else day_names_en.get(day_abbr, day_abbr)
-            context_info += f"\n{day_name}:"
-            for meal in meals:
-                meal_type_fr = {"BREAKFAST": "Déjeuner", "LUNCH": "Dîner", "DINNER": "Souper"}.get(meal.get('meal_type', 'Repas'), meal.get('meal_type', 'Repas'))
-                meal_type_en = {"BREAKFAST": "Breakfast", "LUNCH": "Lunch", "DINNER": "Dinner"}.get(meal.get('meal_type', 'Meal'), meal.get('meal_type', 'Meal'))
-                meal_type_display = meal_type_fr if req.language == "fr" else meal_type_en
-                
-                context_info += f"\n  • {meal_type_display}: {meal.get('title', 'Unknown')}"
-                if meal.get('servings') and meal.get('total_minutes'):
-                    context_info += f" ({meal.get('servings')} portions, {meal.get('total_minutes')} min)"
-    
-    if req.user_context.get("recent_recipes"):
-        recipes = req.user_context["recent_recipes"]
-        context_info += f"\n\n📝 Recent recipes (access available): {len(recipes)} recipes"
-        for idx, recipe in enumerate(recipes[:5]):  # Show first 5
-            context_info += f"\n  {idx+1}. {recipe.get('title', 'Unknown')} ({recipe.get('servings', 'N/A')} servings)"
-    
-    if req.user_context.get("favorite_recipes"):
-        favorites = req.user_context["favorite_recipes"]
-        context_info += f"\n\n⭐ Favorite recipes (access available): {len(favorites)} recipes"
-        for idx, recipe in enumerate(favorites[:5]):  # Show first 5
-            context_info += f"\n  {idx+1}. {recipe.get('title', 'Unknown')} ({recipe.get('servings', 'N/A')} servings)"
-    
-    if not context_info.strip():
-        context_info = "\n\nNo recipe data currently available in context."
-    
-    # Build conversation context
-    messages = [
-        {"role": "system", "content": system_prompt + context_info}
-    ]
-    
-    # Add conversation history (last 10 messages)
-    for msg in req.conversation_history[-10:]:
-        messages.append({
-            "role": "user" if msg.get("isFromUser") else "assistant",
-            "content": msg.get("content", "")
-        })
-    
-    # Add current message
-    messages.append({"role": "user", "content": req.message})
+    # Build context from user data with detailed recipe information (cached
+    # with the session until its context changes)
+    if session is not None:
+        context_info = session.context_block(req.language, render_chat_context)
+    else:
+        context_info = render_chat_context(req.user_context, req.language)
+    
+    # Build conversation context: recent history verbatim, older turns folded
+    # into the session's running summary, all within the mode's token cap
+    messages = chat_memory.build_messages(
+        system_prompt + context_info,
+        req.conversation_history,
+        req.message,
+        mode=detected_mode,
+        language=req.language,
+        session=session
+    )
     
     # SPECIAL HANDLING: If user wants to see their plan, format it with card markers
     if is_plan_display and req.user_context.get("current_plan"):
@@ -3191,15 +2805,17 @@ Garde tes conseils généraux et basés sur les preuves. Pour les calculs calori
         )
     
     try:
-        # Call OpenAI
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=800
-        )
-        
-        reply = response.choices[0].message.content.strip()
+        # Call OpenAI. Add-meal turns answer with the generated recipe card (or
+        # a clarifying question), so they skip the conversational completion.
+        # Modification flows replace this reply, so only plain answers are
+        # streamed to /ai/chat/stream clients.
+        if is_add_meal:
+            reply = ""
+        else:
+            reply = await generate_chat_reply(
+                messages,
+                stream_deltas=not (is_modification or is_confirmation)
+            )
         
         # Check if onboarding is asking for confirmation
         requires_confirmation = False
@@ -3266,6 +2882,7 @@ Garde tes conseils généraux et basés sur les preuves. Pour les calculs calori
                 
                 # If we have a description, use it like ai_recipe endpoint
                 # Otherwise fall back to generic generation
+                preferences = req.user_context.get("preferences", {})
                 if recipe_description and len(recipe_description) > 2:
                     # Use the recipe generation similar to /ai/recipe endpoint
                     recipe_request = RecipeRequest(
@@ -3276,10 +2893,10 @@ Garde tes conseils généraux et basés sur les preuves. Pour les calculs calori
                         language=req.language,
                         preferences=req.user_context.get("preferences", {})
                     )
-                    recipe = await ai_recipe(recipe_request)
+                    recipe_generation = generate_recipe_from_idea(recipe_request)
                 else:
                     # Fallback to generic generation based on meal_type
-                    recipe = await generate_recipe_with_openai(
+                    recipe_generation = generate_recipe_with_openai(
                         meal_type=meal_type,
                         constraints=req.user_context.get("preferences", {}).get("constraints", {}),
                         units=req.user_context.get("preferences", {}).get("units", "METRIC"),
@@ -3292,8 +2909,14 @@ Garde tes conseils généraux et basés sur les preuves. Pour les calculs calori
                         other_plan_proteins=[]
                     )
                 
-                # Mark ingredients on sale if feature is enabled
-                await mark_ingredients_on_sale(recipe, req.user_context.get("preferences", {}))
+                # The flyer deals do not depend on the recipe: fetch them while it
+                # is generated, then mark ingredients on sale if feature is enabled
+                recipe, deal_context = await asyncio.gather(
+                    recipe_generation,
+                    fetch_flyer_deal_context(preferences)
+                )
+                if deal_context is not None:
+                    recipe = await mark_ingredients_on_sale(recipe, preferences, deal_context)
                 
                 # Return the recipe as PENDING - user needs to confirm
                 print(f"  ✅ Recipe generated: {recipe.title}")
@@ -3330,7 +2953,7 @@ Voulez-vous l'ajouter à votre plan?"""
 
 🍽️ For: {day_names.get(weekday, weekday)} {meal_names.get(meal_type, meal_type)}
 👥 Servings: {recipe.servings}
-⏱️ Time: {recipe.totalMinutes} minutes
+⏱️ Time: {recipe.total_minutes} minutes
 
 Would you like to add it to your plan?"""
                 
@@ -3413,7 +3036,7 @@ Would you like to add it to your plan?"""
             for msg in req.conversation_history[-5:]:
                 if msg and msg.get("isFromUser"):
                     msg_content = msg.get("content", "")
-                    is_mod, is_q, recipe, mod_req, mod_type, wd, mt = detect_recipe_modification_request(msg_content, req.user_context)
+                    is_mod, is_q, recipe, mod_req, mod_type, wd, mt = detect_recipe_modification_request(msg_content, req.user_context, recipe_index=recipe_index)
                     if is_mod and recipe:
                         # Apply the modification now
                         try:
@@ -3480,7 +3103,9 @@ IMPORTANT:
 - Garde la recette cohérente et complète
 - Ajuste les quantités et étapes selon la modification"""
                             
-                            modification_response = await client.chat.completions.create(
+                            generated = await llm.generate(
+                                "chat_modification",
+                                GeneratedRecipe,
                                 model="gpt-4o",
                                 messages=[
                                     {"role": "system", "content": "Tu es un chef expert qui modifie des recettes selon les demandes des utilisateurs."},
@@ -3489,32 +3114,7 @@ IMPORTANT:
                                 temperature=0.7,
                                 max_tokens=1200
                             )
-                            
-                            content = modification_response.choices[0].message.content.strip()
-                            
-                            # Remove markdown code blocks
-                            if content.startswith("```"):
-                                content = content.split("```")[1]
-                                if content.startswith("json"):
-                                    content = content[4:]
-                                content = content.strip()
-                            
-                            # Extract JSON
-                            start_idx = content.find('{')
-                            end_idx = content.rfind('}')
-                            if start_idx != -1 and end_idx != -1:
-                                content = content[start_idx:end_idx+1]
-                            
-                            recipe_data = json.loads(content)
-                            
-                            # Ensure all ingredients have required fields
-                            for ingredient in recipe_data.get("ingredients", []):
-                                if "unit" not in ingredient or not ingredient.get("unit"):
-                                    ingredient["unit"] = "unité" if req.language == "fr" else "unit"
-                                if "category" not in ingredient or not ingredient.get("category"):
-                                    ingredient["category"] = "autre" if req.language == "fr" else "other"
-                            
-                            modified_recipe = Recipe(**recipe_data)
+                            modified_recipe = generated.to_recipe(req.language)
                             print(f"  ✅ Modification applied: {modified_recipe.title}")
                             
                             # Update reply to confirm
@@ -3596,7 +3196,9 @@ Retourne UNIQUEMENT un objet JSON valide avec cette structure exacte:
 IMPORTANT: Implémente EXACTEMENT la modification demandée"""
                 
                 # Generate proposed modification
-                modification_response = await client.chat.completions.create(
+                generated = await llm.generate(
+                    "chat_modification",
+                    GeneratedRecipe,
                     model="gpt-4o",
                     messages=[
                         {"role": "system", "content": "Tu es un chef expert qui modifie des recettes selon les demandes des utilisateurs."},
@@ -3605,32 +3207,7 @@ IMPORTANT: Implémente EXACTEMENT la modification demandée"""
                     temperature=0.7,
                     max_tokens=1200
                 )
-                
-                content = modification_response.choices[0].message.content.strip()
-                
-                # Remove markdown code blocks
-                if content.startswith("```"):
-                    content = content.split("```")[1]
-                    if content.startswith("json"):
-                        content = content[4:]
-                    content = content.strip()
-                
-                # Extract JSON
-                start_idx = content.find('{')
-                end_idx = content.rfind('}')
-                if start_idx != -1 and end_idx != -1:
-                    content = content[start_idx:end_idx+1]
-                
-                recipe_data = json.loads(content)
-                
-                # Ensure all ingredients have required fields
-                for ingredient in recipe_data.get("ingredients", []):
-                    if "unit" not in ingredient or not ingredient.get("unit"):
-                        ingredient["unit"] = "unité" if req.language == "fr" else "unit"
-                    if "category" not in ingredient or not ingredient.get("category"):
-                        ingredient["category"] = "autre" if req.language == "fr" else "other"
-                
-                pending_recipe_modification = Recipe(**recipe_data)
+                pending_recipe_modification = generated.to_recipe(req.language)
                 print(f"  ✅ Proposed modification generated: {pending_recipe_modification.title}")
                 
                 # Ask for confirmation in the reply
@@ -3673,6 +3250,7 @@ IMPORTANT: Implémente EXACTEMENT la modification demandée"""
 
 @app.post("/ai/meal-prep-concepts")
 @limiter.limit("10/minute")
+@coalesce_requests(in_flight_requests, "meal_prep_concepts")
 async def generate_meal_prep_concepts(request: Request, req: dict):
     """Generate meal prep concept options for user to choose from."""
     
@@ -3749,7 +3327,8 @@ Sois créatif et diversifié. Chaque concept doit être COMPLÈTEMENT DIFFÉRENT
 Rends les descriptions attrayantes et spécifiques."""
     
     try:
-        response = await client.chat.completions.create(
+        response = await llm.chat_completion(
+            "meal_prep_concepts",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Tu es un expert en meal prep qui crée des concepts thématiques créatifs et diversifiés."},
@@ -3847,6 +3426,40 @@ Rends les descriptions attrayantes et spécifiques."""
         return {"concepts": fallback}
 
 
+async def run_kit_phase(phase: str, coro, fallback: Callable[[], dict]) -> dict:
+    """Await one kit section under its own timeout, degrading to `fallback()` on failure."""
+    try:
+        return await asyncio.wait_for(coro, timeout=KIT_PHASE_TIMEOUTS[phase])
+    except asyncio.TimeoutError:
+        print(f"  ⏱️ {phase} timed out after {KIT_PHASE_TIMEOUTS[phase]}s, using fallback")
+    except Exception as e:
+        print(f"  ❌ {phase} failed: {e}, using fallback")
+    return fallback()
+
+
+class ConsolidatedIngredient(BaseModel):
+    name: str
+    quantity: str  # "500g", "3 unités", ...
+
+class CommonPrep(BaseModel):
+    category: str
+    items: List[str]
+
+class RecipePrep(BaseModel):
+    recipe_name: str
+    emoji: str
+    prep_today: List[str]
+    dont_prep_today: Optional[str]
+    estimated_minutes: Optional[int]
+    evening_minutes: Optional[int]
+
+class TodayPreparation(BaseModel):
+    consolidated_ingredients: Optional[List[ConsolidatedIngredient]]
+    common_preps: List[CommonPrep]
+    recipe_preps: List[RecipePrep]
+    total_minutes: int
+
+
 async def generate_today_preparation(kit_recipes: List[dict], language: str = "fr") -> dict:
     """
     Generate simplified "Today's Preparation" section in ChatGPT style.
@@ -4069,7 +3682,9 @@ CRITICAL RULES:
 Return ONLY the JSON."""
     
     try:
-        response = await client.chat.completions.create(
+        generated = await llm.generate(
+            "kit_today_preparation",
+            TodayPreparation,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Tu es un expert meal prep qui crée des guides simples et narratifs."},
@@ -4078,50 +3693,7 @@ Return ONLY the JSON."""
             temperature=0.7,
             max_tokens=3500  # Increased for 10 recipes with detailed steps
         )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Extract JSON
-        if "```json" in content:
-            parts = content.split("```json")
-            if len(parts) > 1:
-                json_part = parts[1].split("```")[0]
-                content = json_part.strip()
-        elif content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        start_idx = content.find('{')
-        end_idx = content.rfind('}')
-        if start_idx != -1 and end_idx != -1:
-            content = content[start_idx:end_idx+1]
-        
-        # Try to parse JSON with error recovery
-        try:
-            today_data = json.loads(content)
-        except json.JSONDecodeError as e:
-            print(f"  ⚠️ JSON parsing error: {e}")
-            print(f"  📄 Problematic JSON (first 500 chars): {content[:500]}")
-            print(f"  📄 Problematic JSON (last 500 chars): {content[-500:]}")
-            
-            # Try to fix common JSON errors
-            import re
-            # Remove trailing commas before ] or }
-            content = re.sub(r',(\s*[}\]])', r'\1', content)
-            # Try again
-            try:
-                today_data = json.loads(content)
-                print(f"  ✅ JSON fixed with trailing comma removal")
-            except:
-                # Last resort: return empty structure
-                print(f"  ❌ Could not fix JSON, returning empty structure")
-                return {
-                    "common_preps": [],
-                    "recipe_preps": [],
-                    "total_minutes": 120
-                }
+        today_data = generated.model_dump()
         
         # CRITICAL DEBUG: Log what AI returned
         print(f"\n🔍 DEBUG - AI Response:")
@@ -4148,12 +3720,16 @@ Return ONLY the JSON."""
         
     except Exception as e:
         print(f"  ❌ Error generating today preparation: {e}")
-        # Fallback
-        return {
-            "common_preps": [],
-            "recipe_preps": [],
-            "total_minutes": 120
-        }
+        return fallback_today_preparation()
+
+
+def fallback_today_preparation() -> dict:
+    """Empty "Today's Preparation" section used when generation fails."""
+    return {
+        "common_preps": [],
+        "recipe_preps": [],
+        "total_minutes": 120
+    }
 
 
 async def generate_weekly_reheating(kit_recipes: List[dict], days: List[str], meals: List[str], language: str = "fr") -> dict:
@@ -4323,7 +3899,8 @@ CRITICAL RULES:
 Return ONLY the JSON."""
     
     try:
-        response = await client.chat.completions.create(
+        response = await llm.chat_completion(
+            "kit_weekly_reheating",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Tu es un expert meal prep qui crée des guides simples de réchauffage."},
@@ -4368,10 +3945,14 @@ Return ONLY the JSON."""
         
     except Exception as e:
         print(f"  ❌ Error generating weekly reheating: {e}")
-        # Fallback
-        return {
-            "days": []
-        }
+        return fallback_weekly_reheating()
+
+
+def fallback_weekly_reheating() -> dict:
+    """Empty "Weekly Reheating" section used when generation fails."""
+    return {
+        "days": []
+    }
 
 
 async def generate_cooking_phases(kit_recipes: List[dict], language: str = "fr") -> dict:
@@ -4685,7 +4266,8 @@ IF YOU DON'T FOLLOW THE FORMAT [Verb + Specific Ingredients + Method/Location],
 Return ONLY the JSON."""
     
     try:
-        response = await client.chat.completions.create(
+        response = await llm.chat_completion(
+            "kit_cooking_phases",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Tu es un expert en meal prep qui crée des plans de cuisson optimisés et structurés."},
@@ -4735,29 +4317,33 @@ Return ONLY the JSON."""
         
     except Exception as e:
         print(f"  ❌ Error generating phases with AI: {e}")
-        # Fallback to basic structure
-        return {
-            "cook": {
-                "title": "🔥 Cuisson" if language == "fr" else "🔥 Cook",
-                "total_minutes": sum(r.get("recipe", {}).get("total_minutes", 30) for r in kit_recipes),
-                "steps": []
-            },
-            "assemble": {
-                "title": "🧩 Assemblage" if language == "fr" else "🧩 Assemble",
-                "total_minutes": 10,
-                "steps": []
-            },
-            "cool_down": {
-                "title": "❄️ Refroidissement" if language == "fr" else "❄️ Cool Down",
-                "total_minutes": 15,
-                "steps": []
-            },
-            "store": {
-                "title": "📦 Conservation" if language == "fr" else "📦 Store",
-                "total_minutes": 10,
-                "steps": []
-            }
+        return fallback_cooking_phases(kit_recipes, language)
+
+
+def fallback_cooking_phases(kit_recipes: List[dict], language: str = "fr") -> dict:
+    """Basic 4-phase structure with no steps, used when generation fails."""
+    return {
+        "cook": {
+            "title": "🔥 Cuisson" if language == "fr" else "🔥 Cook",
+            "total_minutes": sum(r.get("recipe", {}).get("total_minutes", 30) for r in kit_recipes),
+            "steps": []
+        },
+        "assemble": {
+            "title": "🧩 Assemblage" if language == "fr" else "🧩 Assemble",
+            "total_minutes": 10,
+            "steps": []
+        },
+        "cool_down": {
+            "title": "❄️ Refroidissement" if language == "fr" else "❄️ Cool Down",
+            "total_minutes": 15,
+            "steps": []
+        },
+        "store": {
+            "title": "📦 Conservation" if language == "fr" else "📦 Store",
+            "total_minutes": 10,
+            "steps": []
         }
+    }
 
 
 def group_preparation_steps(kit_recipes: List[dict], language: str = "fr") -> List[dict]:
@@ -4908,6 +4494,7 @@ def group_preparation_steps(kit_recipes: List[dict], language: str = "fr") -> Li
 
 @app.post("/ai/meal-prep-kits")
 @limiter.limit("5/minute")
+@coalesce_requests(in_flight_requests, "meal_prep_kits")
 async def generate_meal_prep_kits(request: Request, req: dict):
     """Generate a single meal prep kit with storage metadata, adaptive shelf life, and grouped prep steps."""
     
@@ -5117,14 +4704,27 @@ async def generate_meal_prep_kits(request: Request, req: dict):
     grouped_prep_steps = group_preparation_steps(kit_recipes, language)
     print(f"  ✅ Generated {len(grouped_prep_steps)} grouped prep steps")
     
-    # Generate cooking phases with AI (DEPRECATED - keeping for backward compatibility)
-    print(f"\n⚡ Generating cooking phases with AI...")
-    cooking_phases = await generate_cooking_phases(kit_recipes, language)
-    
-    # NEW: Generate simplified ChatGPT-style structure
-    print(f"\n✨ Generating simplified meal prep structure (ChatGPT style)...")
-    today_preparation = await generate_today_preparation(kit_recipes, language)
-    weekly_reheating = await generate_weekly_reheating(kit_recipes, days, meals, language)
+    # The three AI sections only depend on kit_recipes: generate them together.
+    # Cooking phases are DEPRECATED - kept for backward compatibility; today
+    # preparation + weekly reheating are the simplified ChatGPT-style structure.
+    print(f"\n⚡ Generating cooking phases, today preparation and weekly reheating...")
+    cooking_phases, today_preparation, weekly_reheating = await asyncio.gather(
+        run_kit_phase(
+            "cooking_phases",
+            generate_cooking_phases(kit_recipes, language),
+            lambda: fallback_cooking_phases(kit_recipes, language)
+        ),
+        run_kit_phase(
+            "today_preparation",
+            generate_today_preparation(kit_recipes, language),
+            fallback_today_preparation
+        ),
+        run_kit_phase(
+            "weekly_reheating",
+            generate_weekly_reheating(kit_recipes, days, meals, language),
+            fallback_weekly_reheating
+        )
+    )
     
     # Create kit
     if language == "fr":
@@ -5161,3 +4761,21 @@ async def generate_meal_prep_kits(request: Request, req: dict):
 @app.get("/")
 def root():
     return {"message": "Planea AI Server with OpenAI - Ready!"}
+
+
+@app.get("/health")
+def health():
+    """Liveness probe with cache counters for monitoring."""
+    return {
+        "status": "ok",
+        "flyer_cache": FlyerScraperService.deals_cache.stats(),
+        "flyer_validators": GroceryStoreScraper.validators.stats(),
+        "llm_cache": llm.cache.stats(),
+        "openai_scheduler": llm.scheduler.stats(),
+        "openai_breaker": {**llm.breaker.stats(), "retries": llm.retries},
+        "openai_prompt_cache": llm.prompt_cache_stats(),
+        "in_flight_requests": in_flight_requests.stats(),
+        "flyer_refresher": flyer_refresher.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "chat_memory": chat_memory.stats()
+    }
@@ -0,0 +1,467 @@
+"""
+Prompt templates for recipe generation.
+
+The long invariant parts of the recipe prompts (protein portions, meal
+balance, preparation steps, output format, nutrition, meal prep rules)
+are compiled once per language when the server starts. A prompt is then
+a static system message, identical for every request of the same kind
+and language, followed by a short user message holding only the
+per-request details. Keeping the static text first lets OpenAI's
+automatic prompt caching reuse it across requests (it applies to
+identical prefixes of 1024 tokens or more).
+"""
+
+from typing import Dict, List, Tuple
+
+
+LANGUAGES = ("fr", "en")
+
+
+def prompt_language(language: str) -> str:
+    """Prompts exist in French and English; anything but English gets French."""
+    return "en" if language == "en" else "fr"
+
+
+PROTEIN_PORTIONS_GUIDE = """CRITICAL - PROTEIN PORTIONS PER PERSON:
+You MUST include adequate protein in each recipe following these guidelines:
+- Chicken (breast, thigh): 150-200g per person (250-300g if bone-in)
+- Beef (steak, roast): 180-220g per person
+- Pork (chops, tenderloin): 160-200g per person
+- Lamb: 180-200g per person
+- Fish (fillet): 150-180g per person (300-350g if whole fish)
+- Shrimp/Prawns: 120-150g per person
+- Tofu: 120-150g per person
+- Tempeh/Seitan: 100-130g per person
+- Eggs: 2-3 large eggs per person
+- Ground meat (beef, pork, chicken): 150-180g per person
+These portions ensure adequate protein intake for a satisfying meal."""
+
+# Starch / side dish guidance for plan recipes
+MEAL_BALANCE_GUIDANCE = {
+    "fr": """🍽️ ÉQUILIBRE DU REPAS (pour Dîner et Souper - Guidage Intelligent):
+
+ÉVALUE si le repas BÉNÉFICIERAIT d'un féculent/accompagnement:
+
+✅ INCLURE un féculent SI le plat en bénéficierait:
+- Protéine grillée/rôtie simple (ex: poulet grillé → ajouter riz basmati ou pommes de terre rôties)
+- Plat en sauce (ex: curry de poulet → servir avec riz basmati ou naan)
+- Sauté asiatique (ex: boeuf aux légumes → avec riz jasmin ou nouilles de riz)
+- Viande mijotée (ex: boeuf braisé → avec purée de pommes de terre ou polenta crémeuse)
+- Poisson au four (ex: saumon → avec quinoa ou riz sauvage)
+- Repas qui semble "léger" sans glucides
+
+❌ PAS NÉCESSAIRE si déjà complet:
+- Pâtes bolognaise, carbonara, etc. (les pâtes SONT le féculent)
+- Pizza, lasagne, cannelloni (déjà substantiel avec pâtes)
+- Quiche, tarte salée (pâte = glucides)
+- Bol-repas avec plusieurs composantes (ex: bowl poke avec riz déjà inclus)
+- Salade-repas copieuse avec légumineuses ou croûtons
+
+🌾 OPTIONS DE FÉCULENTS (portions par personne):
+
+CLASSIQUES (privilégier selon le type de plat):
+- Riz blanc, basmati, jasmin: 60-80g sec (180-240g cuit)
+- Riz brun: 60-75g sec (pour plats santé)
+- Pâtes (spaghetti, penne, etc.): 80-100g sec
+- Pommes de terre: 150-200g (rôties, en purée, bouillies)
+- Patates douces: 150-180g (rôties ou en purée)
+- Quinoa: 60-75g sec (pour bols santé)
+- Couscous: 60-80g sec (avec plats méditerranéens)
+- Polenta: 50-60g sec (avec plats mijotés italiens)
+
+ALTERNATIVES LOW-CARB (pour préférences diététiques):
+- Riz de chou-fleur: 150-200g (alternative au riz)
+- Courgettes spiralisées (zoodles): 200-250g (alternative aux pâtes)
+- Purée de chou-fleur: 200g (alternative à la purée)
+- Courge spaghetti: 200g (alternative aux pâtes)
+
+💡 PRINCIPE CLÉS:
+- Pense "repas complet, équilibré et satisfaisant"
+- Le féculent n'est PAS obligatoire, mais souvent recommandé
+- Adapte le choix au style du plat (riz asiatique, pâtes italiennes, pommes de terre françaises)
+- Si tu ajoutes un féculent, intègre-le naturellement dans les instructions""",
+    "en": """🍽️ MEAL BALANCE (for Lunch and Dinner - Intelligent Guidance):
+
+EVALUATE if the meal would BENEFIT from a starch/side dish:
+
+✅ INCLUDE a starch IF it would enhance the meal:
+- Simple grilled/roasted protein (e.g., grilled chicken → add basmati rice or roasted potatoes)
+- Saucy dish (e.g., chicken curry → serve with basmati rice or naan)
+- Asian stir-fry (e.g., beef with vegetables → with jasmine rice or rice noodles)
+- Braised meat (e.g., braised beef → with mashed potatoes or creamy polenta)
+- Baked fish (e.g., salmon → with quinoa or wild rice)
+- Meal that feels "light" without carbs
+
+❌ NOT NECESSARY if already complete:
+- Pasta bolognese, carbonara, etc. (pasta IS the starch)
+- Pizza, lasagna, cannelloni (already substantial with pasta)
+- Quiche, savory tart (crust = carbs)
+- Bowl meals with multiple components (e.g., poke bowl with rice already included)
+- Hearty salad with legumes or croutons
+
+🌾 STARCH OPTIONS (portions per person):
+
+CLASSICS (choose based on dish style):
+- White, basmati, jasmine rice: 60-80g dry (180-240g cooked)
+- Brown rice: 60-75g dry (for healthy dishes)
+- Pasta (spaghetti, penne, etc.): 80-100g dry
+- Potatoes: 150-200g (roasted, mashed, boiled)
+- Sweet potatoes: 150-180g (roasted or mashed)
+- Quinoa: 60-75g dry (for healthy bowls)
+- Couscous: 60-80g dry (with Mediterranean dishes)
+- Polenta: 50-60g dry (with Italian braised dishes)
+
+LOW-CARB ALTERNATIVES (for dietary preferences):
+- Cauliflower rice: 150-200g (rice alternative)
+- Spiralized zucchini (zoodles): 200-250g (pasta alternative)
+- Cauliflower mash: 200g (mashed potato alternative)
+- Spaghetti squash: 200g (pasta alternative)
+
+💡 KEY PRINCIPLES:
+- Think "complete, balanced, and satisfying meal"
+- Starch is NOT mandatory, but often recommended
+- Match the choice to dish style (Asian rice, Italian pasta, French potatoes)
+- If you add a starch, integrate it naturally into the instructions"""
+}
+
+PREPARATION_STEPS_RULES = {
+    "fr": """CRITIQUE - ÉTAPES DE PRÉPARATION: La recette DOIT commencer par des étapes de préparation détaillées:
+- Les premières étapes doivent décrire TOUTES les préparations d'ingrédients (couper, émincer, hacher, râper, etc.)
+- Sois précis sur les coupes: "couper les carottes en dés de 1cm", "râper 100g de fromage", "émincer finement 2 oignons"
+- Inclure la préparation de TOUS les ingrédients avant les étapes de cuisson
+- Ensuite inclure les étapes de cuisson/assemblage avec temps exacts, températures et techniques""",
+    "en": """CRITICAL - PREPARATION STEPS: The recipe MUST start with detailed preparation steps:
+- First steps should describe ALL ingredient preparations (cutting, dicing, chopping, grating, etc.)
+- Be specific about cuts: "dice carrots into 1cm cubes", "grate 100g cheese", "finely chop 2 onions"
+- Include prep for ALL ingredients before cooking steps
+- Then include cooking/assembly steps with exact times, temperatures, and techniques"""
+}
+
+# The answer itself is enforced by the GeneratedRecipe schema; the example
+# shows the model what good values look like
+RECIPE_OUTPUT_FORMAT = {
+    "fr": """Retourne UNIQUEMENT un objet JSON valide avec cette structure exacte (sans texte avant ou après):
+{
+    "title": "Nom créatif et appétissant de la recette",
+    "servings": 4,
+    "total_minutes": 30,
+    "ingredients": [
+        {"name": "ingrédient", "quantity": 200, "unit": "g", "category": "légumes"}
+    ],
+    "steps": [
+        "Préparation: Couper les carottes en dés de 1cm. Émincer finement l'oignon. Râper le fromage.",
+        "Préparation: Couper le poulet en morceaux et assaisonner de sel et poivre.",
+        "Faire chauffer l'huile dans une grande poêle à feu moyen-vif...",
+        "Ajouter les carottes en dés et cuire 5 minutes...",
+        "Terminer avec le fromage râpé et servir..."
+    ],
+    "equipment": ["poêle", "casserole"],
+    "tags": ["facile", "rapide"],
+    "calories_per_serving": 450,
+    "protein_per_serving": 35,
+    "carbs_per_serving": 40,
+    "fat_per_serving": 15
+}""",
+    "en": """Return ONLY a valid JSON object with this exact structure (no text before or after):
+{
+    "title": "Creative and appetizing recipe name",
+    "servings": 4,
+    "total_minutes": 30,
+    "ingredients": [
+        {"name": "ingredient", "quantity": 200, "unit": "g", "category": "vegetables"}
+    ],
+    "steps": [
+        "Preparation: Dice the carrots into 1cm cubes. Finely chop the onion. Grate the cheese.",
+        "Preparation: Cut the chicken into bite-sized pieces and season with salt and pepper.",
+        "Heat oil in a large pan over medium-high heat...",
+        "Add the diced carrots and cook for 5 minutes...",
+        "Finish with grated cheese and serve..."
+    ],
+    "equipment": ["pan", "pot"],
+    "tags": ["easy", "quick"],
+    "calories_per_serving": 450,
+    "protein_per_serving": 35,
+    "carbs_per_serving": 40,
+    "fat_per_serving": 15
+}"""
+}
+
+NUTRITION_RULES = {
+    "fr": """CRITIQUE - CALCUL NUTRITIONNEL:
+Calcule les valeurs nutritionnelles approximatives par portion en utilisant tes connaissances de la base USDA:
+- calories_per_serving: Calories totales par portion (entier)
+- protein_per_serving: Protéines en grammes par portion (entier)
+- carbs_per_serving: Glucides en grammes par portion (entier)
+- fat_per_serving: Lipides en grammes par portion (entier)
+Base les calculs sur les ingrédients et quantités réels de la recette.""",
+    "en": """CRITICAL - NUTRITIONAL CALCULATION:
+Calculate approximate nutritional values per serving using USDA database knowledge:
+- calories_per_serving: Total calories per serving (integer)
+- protein_per_serving: Protein in grams per serving (integer)
+- carbs_per_serving: Carbohydrates in grams per serving (integer)
+- fat_per_serving: Fat in grams per serving (integer)
+Base calculations on the actual ingredients and quantities in the recipe."""
+}
+
+INGREDIENT_CATEGORIES = {
+    "fr": """Catégories d'ingrédients possibles: légumes, fruits, viandes, poissons, produits laitiers, sec, condiments, conserves.""",
+    "en": """Possible ingredient categories: vegetables, fruits, meats, fish, dairy, dry goods, condiments, canned goods."""
+}
+
+MIN_STEPS_RULE = {
+    "fr": "IMPORTANT: Génère au moins {min_steps} étapes détaillées avec des étapes de préparation EXPLICITES au début.",
+    "en": "IMPORTANT: Generate at least {min_steps} detailed steps with EXPLICIT preparation steps at the beginning."
+}
+
+# Complexity blocks for plan recipes, formatted with max_time
+COMPLEXITY_RULES = {
+    "fr": {
+        "simple": """RECETTE SIMPLE et RAPIDE (max {max_time} minutes):
+- Techniques basiques: grillé, poêlé, sauté, rôti, vapeur
+- Formats acceptés: protéine + légumes, salades composées, omelettes, sandwiches élaborés
+- Sauces simples autorisées: vinaigrettes, marinades rapides, réductions simples""",
+        "medium": """RECETTE DE COMPLEXITÉ MOYENNE (max {max_time} minutes):
+- Inclure UNE sauce ou garniture élaborée
+- Formats privilégiés: pâtes avec sauce, sautés asiatiques, tacos élaborés, bowls composés
+- Techniques intermédiaires: mijoter brièvement, réduire, caraméliser, gratiner rapidement
+- Minimum 6-7 ingrédients différents pour créer des profils de saveurs intéressants""",
+        "complex": """RECETTE ÉLABORÉE (max {max_time} minutes):
+- PRIVILÉGIER ABSOLUMENT: casseroles, lasagnes, gratins, plats mijotés, pâtes au four
+- Sauces riches et complexes: béchamel, sauce tomate maison, crème réduites, bouillons mijotés
+- Techniques avancées: étages de saveurs, cuisson au four, assemblage complexe
+- Minimum 8-10 ingrédients variés incluant herbes, épices, condiments spéciaux
+- Créer des profils de saveurs multicouches: umami, acidité, douceur, épices"""
+    },
+    "en": {
+        "simple": """SIMPLE and QUICK recipe (max {max_time} minutes):
+- Basic techniques: grilled, pan-fried, sautéed, roasted, steamed
+- Accepted formats: protein + vegetables, composed salads, omelets, elaborate sandwiches
+- Simple sauces allowed: vinaigrettes, quick marinades, simple reductions""",
+        "medium": """MEDIUM COMPLEXITY recipe (max {max_time} minutes):
+- Include ONE elaborate sauce or garnish
+- Preferred formats: pasta with sauce, Asian stir-fries, elaborate tacos, composed bowls
+- Intermediate techniques: brief simmering, reducing, caramelizing, quick gratinating
+- Minimum 6-7 different ingredients to create interesting flavor profiles""",
+        "complex": """ELABORATE recipe (max {max_time} minutes):
+- ABSOLUTELY PRIORITIZE: casseroles, lasagnas, gratins, braised dishes, baked pasta
+- Rich and complex sauces: béchamel, homemade tomato sauce, reduced creams, simmered broths
+- Advanced techniques: flavor layering, oven cooking, complex assembly
+- Minimum 8-10 varied ingredients including herbs, spices, special condiments
+- Create multi-layered flavor profiles: umami, acidity, sweetness, spices"""
+    }
+}
+
+# For meal prep recipes eaten more than 3 days after cooking, formatted with days
+ADAPTIVE_STORAGE_RULES = {
+    "fr": """🥡 CONSERVATION ADAPTATIVE (CRITIQUE):
+Cette recette sera consommée le jour {days} après préparation.
+Elle DOIT ABSOLUMENT:
+- Se conserver {days} jours au frigo, OU
+- Être congélable
+
+TYPES DE RECETTES PRIVILÉGIÉS pour longue conservation:
+- Soupes, ragoûts, chilis
+- Plats mijotés (curry, tajines)
+- Casseroles, lasagnes, gratins
+- Pâtes au four
+
+ÉVITER: salades, poisson frais, fruits de mer non congelés""",
+    "en": """🥡 ADAPTIVE STORAGE (CRITICAL):
+This recipe will be consumed on day {days} after preparation.
+It MUST:
+- Keep {days} days in fridge, OR
+- Be freezable
+
+PRIORITIZE for long storage:
+- Soups, stews, chilis
+- Braised dishes (curries, tagines)
+- Casseroles, lasagnas, gratins
+- Baked pasta
+
+AVOID: salads, fresh fish, non-frozen seafood"""
+}
+
+MEAL_PREP_RULES = {
+    "fr": """🍱🍱🍱 RECETTE MEAL PREP - INSTRUCTIONS DÉTAILLÉES 🍱🍱🍱
+
+Tu DOIS créer une recette optimisée pour le MEAL PREP avec instructions séparées "AUJOURD'HUI" vs "CE SOIR".
+
+🔥 FORMAT OBLIGATOIRE POUR LES ÉTAPES (steps):
+
+Les étapes doivent inclure des SECTIONS CLAIREMENT MARQUÉES:
+
+**📅 AUJOURD'HUI (Préparation à l'avance):**
+1. [Étape de préparation 1]
+2. [Étape de préparation 2]
+3. [Conservation au frigo]
+
+**🌙 CE SOIR (Jour de consommation):**
+1. [Réchauffage ou finition]
+2. [Service]
+
+EXEMPLE CONCRET - Poulet rôti avec légumes:
+
+steps: [
+  "📅 AUJOURD'HUI (Préparation à l'avance):",
+  "1. Assaisonner poulet (600g) avec sel, poivre, paprika et herbes",
+  "2. Rôtir poulet au four 200°C pendant 30 min jusqu'à cuisson complète",
+  "3. Pendant ce temps: rôtir brocoli et carottes sur une autre plaque 20 min",
+  "4. Cuire quinoa (300g): rincer, puis 2 volumes d'eau, bouillir 15 min",
+  "5. Laisser refroidir tous les éléments 10-15 min",
+  "6. Portionner dans 4 contenants hermétiques: poulet + légumes + quinoa",
+  "7. Conserver au frigo jusqu'à 4 jours",
+  "",
+  "🌙 CE SOIR (Jour de consommation):",
+  "1. Réchauffer 1 portion au micro-ondes 2-3 min OU à la poêle 5-8 min",
+  "2. Servir immédiatement"
+]
+
+EXEMPLE CONCRET - Saumon avec légumes (poisson frais):
+
+steps: [
+  "📅 AUJOURD'HUI (Préparation à l'avance):",
+  "1. Préparer marinade: mélanger huile d'olive, jus de citron, ail émincé, aneth",
+  "2. Placer saumon dans un contenant, verser marinade, couvrir, réfrigérer",
+  "3. Laver brocoli, couper en bouquets, conserver au frigo",
+  "4. Cuire riz (300g) et portionner dans 4 contenants",
+  "",
+  "🌙 CE SOIR (Jour de consommation):",
+  "1. Sortir saumon mariné du frigo",
+  "2. Cuire saumon à la poêle ou au four 12-15 min",
+  "3. Pendant ce temps: faire sauter brocoli 5-8 min",
+  "4. Réchauffer portion de riz au micro-ondes 2 min",
+  "5. Assembler et servir"
+]
+
+
+Cette recette DOIT être optimisée pour le MEAL PREP:
+
+RÈGLES MEAL PREP OBLIGATOIRES:
+1. Conservation: Recette qui se conserve bien 3-5 jours au frigo
+2. Réchauffage: Se réchauffe facilement (micro-ondes ou poêle)
+3. Texture: Maintient sa qualité après conservation
+4. Portionnement: Facile à diviser en portions individuelles
+
+TYPES DE RECETTES MEAL PREP IDÉALES:
+✅ Plats complets en une préparation:
+   - Bols protéinés (protéine + légumes + féculent)
+   - Plats mijotés (curry, tajines, chilis)
+   - Casseroles et gratins
+   - Pâtes au four
+   - Sautés asiatiques avec sauce
+
+✅ Techniques meal prep friendly:
+   - Rôtir au four (facile à faire en grandes quantités)
+   - Mijoter (améliore avec le temps)
+   - Cuire en sauce (protège de la sécheresse)
+
+❌ ÉVITER pour meal prep:
+   - Recettes avec éléments crus/frais à ajouter au dernier moment
+   - Salades vertes (se flétrit)
+   - Poisson délicat (perd texture, sauf congelé)
+   - Recettes qui deviennent pâteuses
+
+INSTRUCTIONS SPÉCIALES:
+- Intégrer les légumes DANS le plat (pas à part)
+- Sauce généreuse pour maintenir l'humidité
+- Assaisonnement marqué (s'atténue avec le temps)""",
+    "en": """🍱🍱🍱 MEAL PREP RECIPE - CRITICAL OPTIMIZATION 🍱🍱🍱
+
+This recipe MUST be optimized for MEAL PREP:
+
+MANDATORY MEAL PREP RULES:
+1. Storage: Recipe keeps well 3-5 days in fridge
+2. Reheating: Easy to reheat (microwave or pan)
+3. Texture: Maintains quality after storage
+4. Portioning: Easy to divide into individual portions
+
+IDEAL MEAL PREP RECIPE TYPES:
+✅ Complete one-pot dishes:
+   - Protein bowls (protein + vegetables + starch)
+   - Braised dishes (curries, tagines, chilis)
+   - Casseroles and gratins
+   - Baked pasta
+   - Asian stir-fries with sauce
+
+✅ Meal prep friendly techniques:
+   - Roasting in oven (easy to make in large quantities)
+   - Braising (improves with time)
+   - Cooking in sauce (prevents dryness)
+
+❌ AVOID for meal prep:
+   - Recipes with fresh elements to add last minute
+   - Green salads (wilts)
+   - Delicate fish (loses texture, unless frozen)
+   - Recipes that become mushy
+
+SPECIAL INSTRUCTIONS:
+- Integrate vegetables INTO the dish (not separate)
+- Generous sauce to maintain moisture
+- Bold seasoning (diminishes over time)"""
+}
+
+
+class PromptTemplateRegistry:
+    """Static system prompts per (kind, language), compiled once."""
+    
+    def __init__(self):
+        self._system_prompts: Dict[Tuple[str, str], str] = {}
+    
+    def register(self, kind: str, language: str, *sections: str):
+        self._system_prompts[(kind, language)] = "\n\n".join(sections)
+    
+    def system_prompt(self, kind: str, language: str) -> str:
+        return self._system_prompts[(kind, prompt_language(language))]
+    
+    def messages(self, kind: str, language: str, user_prompt: str) -> List[Dict[str, str]]:
+        """Chat messages with the static prefix first and the request details last."""
+        return [
+            {"role": "system", "content": self.system_prompt(kind, language)},
+            {"role": "user", "content": user_prompt}
+        ]
+
+
+RECIPE_ROLES = {
+    "plan_recipe": {
+        "fr": "Tu es un chef cuisinier créatif et expert qui génère des recettes uniques et détaillées en JSON. Tu varies toujours les ingrédients, cuisines et techniques.",
+        "en": "You are a creative and expert chef who generates unique and detailed recipes in JSON. You always vary ingredients, cuisines and techniques."
+    },
+    "recipe": {
+        "fr": "Tu es un chef cuisinier créatif et expert qui génère des recettes uniques et détaillées en JSON.",
+        "en": "You are a creative and expert chef who generates unique and detailed recipes in JSON."
+    },
+    "recipe_from_title": {
+        "fr": "Tu es un chef cuisinier créatif et expert qui génère des recettes uniques et détaillées en JSON à partir de noms de plats.",
+        "en": "You are a creative and expert chef who generates unique and detailed recipes in JSON based on dish names."
+    }
+}
+
+
+def build_recipe_prompts() -> PromptTemplateRegistry:
+    registry = PromptTemplateRegistry()
+    for language in LANGUAGES:
+        recipe_rules = (
+            PROTEIN_PORTIONS_GUIDE,
+            PREPARATION_STEPS_RULES[language],
+            RECIPE_OUTPUT_FORMAT[language],
+            NUTRITION_RULES[language],
+            INGREDIENT_CATEGORIES[language]
+        )
+        registry.register(
+            "plan_recipe", language,
+            RECIPE_ROLES["plan_recipe"][language],
+            MEAL_BALANCE_GUIDANCE[language],
+            *recipe_rules,
+            MIN_STEPS_RULE[language].format(min_steps="6-8")
+        )
+        for kind in ("recipe", "recipe_from_title"):
+            registry.register(
+                kind, language,
+                RECIPE_ROLES[kind][language],
+                *recipe_rules,
+                MIN_STEPS_RULE[language].format(min_steps="5-7")
+            )
+    return registry
+
+
+recipe_prompts = build_recipe_prompts()
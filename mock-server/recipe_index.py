@@ -0,0 +1,157 @@
+"""
+Recipe lookup for chat modification requests.
+
+A chat message such as "replace the chicken on Tuesday" refers to one of the
+recipes the client sent in `user_context`: the current plan (by weekday),
+recent recipes and favorites. The index is built once per request as an
+inverted map from title tokens to recipes, so resolving a message costs one
+dictionary lookup per message token instead of a substring scan of every
+title. Candidates are ranked by how much of their title the message names
+(rare words weigh more), with a boost for the weekday and meal type the
+message mentions.
+"""
+
+import heapq
+import math
+import re
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from chat_intents import MEAL_TYPE_KEYWORDS, WEEKDAY_KEYWORDS
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset([
+    'avec', 'pour', 'dans', 'sans', 'une', 'des', 'les', 'aux', 'sur', 'par', 'est', 'mon', 'mes', 'son', 'ses',
+    'the', 'and', 'with', 'for', 'from', 'that', 'this', 'can', 'you', 'your', 'please'
+])
+
+# Full day names only: three-letter forms such as "mon" are ordinary words
+_WEEKDAY_TOKENS = {
+    keyword: day
+    for day, keywords in WEEKDAY_KEYWORDS.items()
+    for keyword in keywords
+    if len(keyword) > 3
+}
+_MEAL_TYPE_TOKENS = {
+    keyword: meal_type
+    for meal_type, keywords in MEAL_TYPE_KEYWORDS.items()
+    for keyword in keywords
+    if _TOKEN_RE.fullmatch(keyword)
+}
+
+# Plan recipes first, then recent recipes, then favorites (ties only)
+SOURCE_PRIORITY = {"current_plan": 3, "recent_recipes": 2, "favorite_recipes": 1}
+WEEKDAY_BOOST = 1.5
+MEAL_TYPE_BOOST = 0.5
+FULL_TITLE_BOOST = 2.0
+
+
+def title_tokens(text: str) -> List[str]:
+    """Significant lowercase words of `text`, with plural s/x folded."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if len(token) < 3 or token in _STOPWORDS:
+            continue
+        if len(token) > 4 and token[-1] in "sx":
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class RecipeCandidate(NamedTuple):
+    recipe: dict
+    source: str
+    weekday: Optional[str]
+    meal_type: Optional[str]
+    score: float
+
+
+class _Entry(NamedTuple):
+    recipe: dict
+    source: str
+    weekday: Optional[str]
+    tokens: Set[str]
+
+
+class RecipeTitleIndex:
+    """Inverted token index over the recipes of one chat request's `user_context`."""
+    
+    def __init__(self, user_context: dict):
+        self._entries: List[_Entry] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._by_weekday: Dict[str, List[int]] = {}
+        
+        for day, meals in (user_context.get("current_plan") or {}).items():
+            for meal in meals:
+                self._add(meal, "current_plan", day)
+        for source in ("recent_recipes", "favorite_recipes"):
+            for recipe in user_context.get(source) or []:
+                self._add(recipe, source, None)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _add(self, recipe: dict, source: str, weekday: Optional[str]):
+        entry_id = len(self._entries)
+        tokens = set(title_tokens(recipe.get("title", "")))
+        self._entries.append(_Entry(recipe, source, weekday, tokens))
+        for token in tokens:
+            self._postings.setdefault(token, []).append(entry_id)
+        if weekday:
+            self._by_weekday.setdefault(weekday, []).append(entry_id)
+    
+    def search(self, message: str, limit: int = 5) -> List[RecipeCandidate]:
+        """Recipes the message refers to, best first.
+        
+        A recipe qualifies when the message names a word of its title, or -
+        for plan recipes - both its weekday and its meal type.
+        """
+        message_tokens = set(title_tokens(message))
+        weekdays = {_WEEKDAY_TOKENS[t] for t in message_tokens if t in _WEEKDAY_TOKENS}
+        meal_types = {_MEAL_TYPE_TOKENS[t] for t in message_tokens if t in _MEAL_TYPE_TOKENS}
+        
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        total = len(self._entries)
+        for token in message_tokens:
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            weight = 1 + math.log(total / len(postings))
+            for entry_id in postings:
+                scores[entry_id] = scores.get(entry_id, 0.0) + weight
+                matched[entry_id] = matched.get(entry_id, 0) + 1
+        
+        for entry_id, count in matched.items():
+            scores[entry_id] += FULL_TITLE_BOOST * count / len(self._entries[entry_id].tokens)
+        
+        for weekday in weekdays:
+            for entry_id in self._by_weekday.get(weekday, []):
+                if entry_id in scores or _meal_type(self._entries[entry_id].recipe) in meal_types:
+                    scores[entry_id] = scores.get(entry_id, 0.0) + WEEKDAY_BOOST
+        
+        if meal_types:
+            for entry_id in scores:
+                if _meal_type(self._entries[entry_id].recipe) in meal_types:
+                    scores[entry_id] += MEAL_TYPE_BOOST
+        
+        entries = self._entries
+        ranked = heapq.nsmallest(
+            limit,
+            scores.items(),
+            key=lambda item: (-item[1], -SOURCE_PRIORITY[entries[item[0]].source], item[0])
+        )
+        return [
+            RecipeCandidate(
+                recipe=self._entries[entry_id].recipe,
+                source=self._entries[entry_id].source,
+                weekday=self._entries[entry_id].weekday,
+                meal_type=self._entries[entry_id].recipe.get("meal_type"),
+                score=round(score, 3)
+            )
+            for entry_id, score in ranked
+        ]
+
+
+def _meal_type(recipe: dict) -> Optional[str]:
+    # The iOS client sends the plan slot's meal type as "type"
+    return recipe.get("meal_type") or recipe.get("type")
@@ -0,0 +1,159 @@
+"""
+Incremental parsing of JSON objects streamed by OpenAI.
+
+Recipes are generated as one JSON object, sometimes wrapped in a markdown
+fence or preceded by a short sentence. Instead of buffering the whole
+completion and then searching for the outermost braces, the parser is fed
+each streamed delta: it skips the preamble, tracks nesting and strings as
+text arrives, reports every top-level field as soon as its value is
+complete, and returns the decoded object the moment the closing brace
+arrives. Output that cannot become valid JSON is rejected at the first
+offending character, so the caller can stop the stream early.
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+# Characters allowed outside strings: punctuation, numbers and the
+# letters of true / false / null
+_BARE_CHARS = frozenset(" \t\r\n,:-+.0123456789eEtrufalsn")
+_CLOSERS = {"}": "{", "]": "["}
+
+
+class MalformedJSONStreamError(ValueError):
+    """The streamed text cannot be (or did not become) a JSON object."""
+
+
+class IncrementalJSONObjectParser:
+    """Assemble one JSON object from text chunks.
+    
+    `feed` returns None until the top-level object is closed, then the
+    decoded dict. `on_field(key, value)` is called for each top-level field
+    as soon as its value is complete (e.g. the title long before the steps).
+    """
+    
+    def __init__(self, on_field: Optional[Callable[[str, Any], None]] = None, max_preamble_chars: int = 200):
+        self.on_field = on_field
+        self.max_preamble_chars = max_preamble_chars
+        self.fields: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self._preamble: List[str] = []
+        self._parts: List[str] = []
+        self._pos = 0  # Offset of the next character within the object text
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        # Top-level field tracking: expecting a "key", its "colon" or its "value"
+        self._field_state = "key"
+        self._token_start = 0
+        self._key: Optional[str] = None
+    
+    @property
+    def started(self) -> bool:
+        return bool(self._stack) or self.result is not None
+    
+    def feed(self, text: str) -> Optional[Dict[str, Any]]:
+        """Consume the next chunk of streamed text."""
+        if self.result is not None:
+            return self.result
+        
+        for i, char in enumerate(text):
+            if not self._stack:
+                if char == "{":
+                    self._stack.append("{")
+                    self._pos = 1
+                    return self._scan(text[i:], skip=1)
+                self._preamble.append(char)
+                if len(self._preamble) > self.max_preamble_chars:
+                    raise MalformedJSONStreamError(f"No JSON object in the first {self.max_preamble_chars} characters")
+            else:
+                return self._scan(text[i:])
+        return None
+    
+    @property
+    def received(self) -> str:
+        """Everything consumed so far, preamble included (for error logs)."""
+        return "".join(self._preamble) + self._text()
+    
+    def finish(self) -> Dict[str, Any]:
+        """Return the object once the stream has ended, or raise if it never closed."""
+        if self.result is None:
+            state = "truncated" if self.started else "missing"
+            raise MalformedJSONStreamError(f"JSON object {state} at end of stream")
+        return self.result
+    
+    def _text(self) -> str:
+        return "".join(self._parts)
+    
+    def _scan(self, text: str, skip: int = 0) -> Optional[Dict[str, Any]]:
+        self._parts.append(text)
+        for i in range(skip, len(text)):
+            char = text[i]
+            pos = self._pos
+            self._pos += 1
+            
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._field_state == "key":
+                        self._key = json.loads(self._text()[self._token_start:pos + 1])
+                        self._field_state = "colon"
+                continue
+            
+            top_level = len(self._stack) == 1
+            if top_level and self._field_state != "value":
+                self._expect_top_level(char, pos)
+            elif top_level and char in ",}":
+                self._complete_field(pos)
+            
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append(char)
+            elif char in _CLOSERS:
+                if self._stack[-1] != _CLOSERS[char]:
+                    raise MalformedJSONStreamError(f"Unexpected '{char}' at offset {pos}")
+                self._stack.pop()
+                if not self._stack:
+                    return self._close(pos)
+            elif char not in _BARE_CHARS:
+                raise MalformedJSONStreamError(f"Unexpected '{char}' at offset {pos}")
+        return None
+    
+    def _expect_top_level(self, char: str, pos: int):
+        """Check the structure between top-level fields: `"key": value, ...`."""
+        if char.isspace():
+            return
+        state = self._field_state
+        if state == "key" and char == '"':
+            self._token_start = pos
+        elif state == "key" and char == "}" and not self.fields:
+            pass  # Empty object
+        elif state == "colon" and char == ":":
+            self._field_state = "value"
+            self._token_start = pos + 1
+        else:
+            raise MalformedJSONStreamError(f"Unexpected '{char}' at offset {pos}")
+    
+    def _complete_field(self, pos: int):
+        raw_value = self._text()[self._token_start:pos].strip()
+        try:
+            value = json.loads(raw_value)
+        except json.JSONDecodeError as e:
+            raise MalformedJSONStreamError(f"Invalid value for '{self._key}': {e}") from e
+        self.fields[self._key] = value
+        self._field_state = "key"
+        if self.on_field:
+            self.on_field(self._key, value)
+    
+    def _close(self, pos: int) -> Dict[str, Any]:
+        text = self._text()[:pos + 1]
+        try:
+            self.result = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise MalformedJSONStreamError(str(e)) from e
+        return self.result
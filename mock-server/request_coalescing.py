@@ -0,0 +1,132 @@
+"""
+Coalescing of duplicate in-flight API requests.
+
+The iOS client retries slow generations (timeouts, dropped connections)
+while the first attempt is still running on the server. Requests with the
+same `Idempotency-Key` header - or, without one, the same canonical body -
+attach to the generation already in progress instead of starting another
+full set of OpenAI calls, and all of them receive its result. Both kinds
+of identity are scoped to the caller's address (and keys to the body too),
+so one client never attaches to or replays another client's generation.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from pydantic import BaseModel
+from slowapi.util import get_remote_address
+
+logger = logging.getLogger(__name__)
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+def canonical_body_hash(body: Any) -> str:
+    """Stable hash of a request body (pydantic model or plain JSON data)."""
+    if isinstance(body, BaseModel):
+        body = body.model_dump(mode="json")
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class InFlightRequests:
+    """Registry of running generations keyed by (endpoint, request identity).
+    
+    Each generation runs in its own task, so a caller that disconnects (and
+    is cancelled) never cancels the work the other callers are waiting on.
+    Successful results of requests carrying an idempotency key stay
+    available for `result_ttl_seconds`, so a retry that arrives just after
+    the first attempt finished still gets it. Body-matched requests are only
+    coalesced while running: an identical request sent later on purpose
+    (e.g. "regenerate") must produce a fresh answer.
+    """
+    
+    def __init__(self, result_ttl_seconds: float = 30):
+        self.result_ttl_seconds = result_ttl_seconds
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._results: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self.started = 0
+        self.coalesced = 0
+    
+    async def run(self, key: Tuple[str, str], factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of the generation for `key`, starting it if none is running."""
+        self._drop_expired_results()
+        
+        if key in self._results:
+            self.coalesced += 1
+            logger.info(f"Replaying recent result for duplicate {key[0]} request")
+            return self._results[key][1]
+        
+        task = self._tasks.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.create_task(factory())
+            self._tasks[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+        else:
+            self.coalesced += 1
+            logger.info(f"Attaching duplicate {key[0]} request to the generation in progress")
+        
+        return await asyncio.shield(task)
+    
+    def _finished(self, key: Tuple[str, str], task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        replayable = key[1].startswith("key:") and self.result_ttl_seconds > 0
+        if replayable and not task.cancelled() and task.exception() is None:
+            self._results[key] = (time.time() + self.result_ttl_seconds, task.result())
+    
+    def _drop_expired_results(self):
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._results.items() if expires_at <= now]:
+            del self._results[key]
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._tasks),
+            "recent_results": len(self._results),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
+
+
+def request_identity(request: Request, body: Any) -> str:
+    """Idempotency key sent by the client, or the canonical body hash.
+    
+    Either only matches requests from the same address (and a key only with
+    the same body).
+    """
+    caller = get_remote_address(request)
+    body_hash = canonical_body_hash(body)
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+    if idempotency_key:
+        return f"key:{caller}:{idempotency_key}:{body_hash}"
+    return f"body:{caller}:{body_hash}"
+
+
+def coalesce_requests(registry: InFlightRequests, endpoint: str, body_param: str = "req"):
+    """Decorator for `async def handler(request: Request, req: ...)` endpoints.
+    
+    Place it below the route and limiter decorators; the endpoint signature
+    is preserved for FastAPI.
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Optional[Request] = kwargs.get("request")
+            if request is None:
+                request = next((arg for arg in args if isinstance(arg, Request)), None)
+            if request is None or body_param not in kwargs:
+                return await func(*args, **kwargs)
+            
+            key = (endpoint, request_identity(request, kwargs[body_param]))
+            return await registry.run(key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator